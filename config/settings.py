@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -108,6 +109,26 @@ DATABASES = {
     }
 }
 
+# Conexiones: por defecto se reutilizan (CONN_MAX_AGE) con health checks,
+# para no abrir una conexión (y un handshake TLS con Render) por request.
+# Con DB_POOL=1 se usa el pool de psycopg 3 (requiere psycopg[pool]);
+# Django no permite combinar el pool con conexiones persistentes.
+DB_POOL = os.environ.get("DB_POOL", "0") == "1"
+
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+if DB_POOL:
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        }
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
@@ -118,6 +139,76 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Listados de SQL crudo (core.pagination): True devuelve la tabla
+# completa cuando el cliente no envía ?limit= ni ?after= (compatibilidad
+# con clientes viejos); por defecto se pagina siempre.
+PAGINACION_OPCIONAL = os.environ.get("PAGINACION_OPCIONAL", "0") == "1"
+
+# Contraseñas (core.passwords): costo de bcrypt para hashes nuevos y
+# rehash en login; hilos dedicados del login asíncrono y cuántas
+# verificaciones pueden esperar en cola.
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", "0")) or os.cpu_count()
+BCRYPT_MAX_QUEUE = int(os.environ.get("BCRYPT_MAX_QUEUE", "64"))
+
+# Versiones de los catálogos (core.catalogos) y de la lista de tokens
+# revocados (core.tokens). Debe ser compartida por todos los workers: por
+# defecto un directorio local del nodo; en varios nodos se puede apuntar
+# a memcached/redis con las variables de entorno. La agenda por médico y
+# día (core.agenda) tiene su propia caché, así sus claves no desplazan a
+# las versiones.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalogos": {
+        "BACKEND": os.environ.get(
+            "CATALOG_CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.environ.get(
+            "CATALOG_CACHE_LOCATION",
+            os.path.join(tempfile.gettempdir(), "hospital_backend_catalogos")
+        ),
+        "TIMEOUT": None,
+    },
+    "agenda": {
+        "BACKEND": os.environ.get(
+            "AGENDA_CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.environ.get(
+            "AGENDA_CACHE_LOCATION",
+            os.path.join(tempfile.gettempdir(), "hospital_backend_agenda")
+        ),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("AGENDA_CACHE_MAX_ENTRIES", "10000")),
+        },
+    },
+}
+
+# Agenda de citas (core.agenda): duración de una cita, jornada de los
+# médicos y vigencia en caché de las citas ocupadas de cada día
+CITA_DURACION_MINUTOS = int(os.environ.get("CITA_DURACION_MINUTOS", "30"))
+AGENDA_HORA_INICIO = int(os.environ.get("AGENDA_HORA_INICIO", "8"))
+AGENDA_HORA_FIN = int(os.environ.get("AGENDA_HORA_FIN", "17"))
+AGENDA_CACHE_TTL = int(os.environ.get("AGENDA_CACHE_TTL", "3600"))
+
+# Alertas de stock (core.alertas): días de prescripciones que se miran,
+# vida media (días) del peso de cada día y horizonte por defecto de
+# /api/medicamentos/alertas/
+STOCK_VENTANA_DIAS = int(os.environ.get("STOCK_VENTANA_DIAS", "28"))
+STOCK_VIDA_MEDIA_DIAS = float(os.environ.get("STOCK_VIDA_MEDIA_DIAS", "7"))
+STOCK_HORIZONTE_DIAS = int(os.environ.get("STOCK_HORIZONTE_DIAS", "14"))
+
+# Vigencia (segundos) de los tokens de acceso y de refresco (core.tokens)
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", str(15 * 60)))
+REFRESH_TOKEN_TTL = int(os.environ.get("REFRESH_TOKEN_TTL", str(7 * 24 * 3600)))
+
+# Caché en proceso de empleados autenticados (core.middleware)
+EMPLEADO_CACHE_TTL = int(os.environ.get("EMPLEADO_CACHE_TTL", "300"))
+EMPLEADO_CACHE_MAXSIZE = int(os.environ.get("EMPLEADO_CACHE_MAXSIZE", "1024"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,315 @@
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Citas, Empleados
+
+
+# ================================================================
+#                DISPONIBILIDAD DE CITAS (AGENDA)
+# ================================================================
+#
+# Las citas ocupadas de cada médico se traen con una sola consulta por
+# rango (id_emp, fecha_hora), que usa idx_citas_id_emp_fecha. El
+# resultado se guarda por médico y día en la caché "agenda"; crear,
+# editar o borrar una cita invalida solo los días afectados, una vez
+# confirmada la transacción.
+#
+# Cada (médico, día) tiene una generación (un uuid) y la clave de los
+# datos la incluye. Invalidar es cambiar la generación: una lectura que
+# empezó antes y guarda datos viejos los deja en la clave de la
+# generación anterior, que ya nadie lee y vence sola. Los
+# espacios libres se calculan con un barrido sobre los intervalos
+# ordenados de cada día.
+#
+# Reservas: para no agendar dos citas cruzadas al mismo médico, cada
+# escritura toma un candado de PostgreSQL (pg_advisory_xact_lock) por
+# (id_emp, día), verifica el cruce y guarda en la misma transacción.
+# Solo compiten las reservas del mismo médico y el mismo día; las de
+# médicos distintos no se esperan entre sí.
+
+MAX_DIAS = 31
+
+# estados que no bloquean el horario del médico
+ESTADOS_LIBRES = ("Cancelada",)
+
+
+def duracion_cita():
+    return timedelta(minutes=getattr(settings, "CITA_DURACION_MINUTOS", 30))
+
+
+def jornada():
+    return (
+        time(getattr(settings, "AGENDA_HORA_INICIO", 8)),
+        time(getattr(settings, "AGENDA_HORA_FIN", 17)),
+    )
+
+
+def _gen_key(id_emp, dia):
+    return f"agenda:gen:{id_emp}:{dia.isoformat()}"
+
+
+def _dia_key(id_emp, dia, generacion):
+    return f"agenda:{id_emp}:{dia.isoformat()}:{generacion}"
+
+
+def _dia_local(fecha_hora):
+    return timezone.localtime(fecha_hora).date()
+
+
+def _inicio_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+class AgendaCache:
+
+    def __init__(self, alias="agenda"):
+        self.alias = alias
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def ttl(self):
+        return getattr(settings, "AGENDA_CACHE_TTL", 3600)
+
+    def _generaciones(self, id_emp, dias):
+        claves = {_gen_key(id_emp, dia): dia for dia in dias}
+        generaciones = self.shared.get_many(list(claves))
+        faltan = [clave for clave in claves if clave not in generaciones]
+        if faltan:
+            # add() y volver a leer: si otro proceso la creó primero, se
+            # usa la suya
+            for clave in faltan:
+                self.shared.add(clave, uuid.uuid4().hex, timeout=self.ttl())
+            generaciones.update(self.shared.get_many(faltan))
+        return {claves[clave]: gen for clave, gen in generaciones.items()}
+
+    def ocupados(self, id_emp, dias):
+        """
+        {dia: [inicio, ...]} con las citas que bloquean el horario. Los
+        días que no están en caché se cargan con una sola consulta.
+        """
+        # la generación se lee antes que la base: si se invalida durante
+        # la carga, lo cargado queda en la clave vieja
+        generaciones = self._generaciones(id_emp, dias)
+        claves = {
+            _dia_key(id_emp, dia, gen): dia for dia, gen in generaciones.items()
+        }
+        guardados = self.shared.get_many(list(claves))
+        resultado = {claves[k]: v for k, v in guardados.items()}
+
+        faltantes = [dia for dia in dias if dia not in resultado]
+        if not faltantes:
+            return resultado
+
+        cargados = {dia: [] for dia in faltantes}
+        inicios = (
+            Citas.objects
+            .filter(
+                id_emp_id=id_emp,
+                fecha_hora__gte=_inicio_dia(min(faltantes)),
+                fecha_hora__lt=_inicio_dia(max(faltantes) + timedelta(days=1)),
+            )
+            .exclude(estado__in=ESTADOS_LIBRES)
+            .order_by("fecha_hora")
+            .values_list("fecha_hora", flat=True)
+        )
+        for inicio in inicios:
+            inicio = timezone.localtime(inicio)
+            if inicio.date() in cargados:
+                cargados[inicio.date()].append(inicio)
+
+        # un día sin generación (la caché la descartó) no se guarda
+        self.shared.set_many(
+            {
+                _dia_key(id_emp, dia, generaciones[dia]): v
+                for dia, v in cargados.items() if dia in generaciones
+            },
+            timeout=self.ttl(),
+        )
+        resultado.update(cargados)
+        return resultado
+
+    def invalidar(self, id_emp, fecha_hora):
+        self.shared.set(
+            _gen_key(id_emp, _dia_local(fecha_hora)), uuid.uuid4().hex, timeout=self.ttl()
+        )
+
+    def invalidar_cita(self, cita):
+        self.invalidar(cita.id_emp_id, cita.fecha_hora)
+
+    def invalidar_al_confirmar(self, *pares):
+        """
+        Invalida los días de cada (id_emp, fecha_hora) cuando se
+        confirme la transacción en curso: si la generación cambiara
+        antes del commit, una lectura concurrente podría guardar los
+        datos viejos bajo la generación nueva.
+        """
+        transaction.on_commit(lambda: [self.invalidar(*par) for par in pares])
+
+
+agenda_cache = AgendaCache()
+
+
+# ---------------------------------------------------------------
+#   Reservas
+# ---------------------------------------------------------------
+
+class CitaOcupada(Exception):
+    pass
+
+
+def _bloquear(cursor, id_emp, dias):
+    # candado de dos llaves (id_emp, día); se toma en orden para que
+    # dos reservas sobre los mismos días no se bloqueen mutuamente
+    for dia in sorted(dias):
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(%s, %s);", [int(id_emp), dia.toordinal()]
+        )
+
+
+@contextmanager
+def reservar(id_emp, fecha_hora, estado=None, excluir=None):
+    """
+    Transacción para crear o mover una cita de `id_emp` a `fecha_hora`.
+    Lanza CitaOcupada si se cruza con otra cita activa del médico;
+    `excluir` es el id_cita que se está editando.
+    """
+    with transaction.atomic():
+        if estado in ESTADOS_LIBRES:
+            yield
+            return
+
+        ocupada = duracion_cita()
+        desde, hasta = fecha_hora - ocupada, fecha_hora + ocupada
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                _bloquear(cursor, id_emp, {_dia_local(desde), _dia_local(hasta)})
+
+            cursor.execute(
+                f"""
+                SELECT id_cita FROM citas
+                WHERE id_emp = %s
+                  AND fecha_hora > %s
+                  AND fecha_hora < %s
+                  AND estado NOT IN ({", ".join(["%s"] * len(ESTADOS_LIBRES))})
+                  AND id_cita <> %s
+                LIMIT 1;
+                """,
+                [id_emp, desde, hasta, *ESTADOS_LIBRES, excluir or 0]
+            )
+            cruce = cursor.fetchone()
+
+        if cruce:
+            raise CitaOcupada(
+                f"El médico ya tiene la cita {cruce[0]} en ese horario"
+            )
+        yield
+
+
+def espacios_libres(dia, ocupados, duracion, desde=None):
+    """
+    Barrido sobre los inicios ordenados de las citas del día: devuelve
+    los espacios [inicio, fin) de `duracion` que caben en la jornada sin
+    cruzarse con ninguna cita. `desde` descarta los que ya pasaron.
+    """
+    hora_inicio, hora_fin = jornada()
+    cursor = timezone.make_aware(datetime.combine(dia, hora_inicio))
+    fin_jornada = timezone.make_aware(datetime.combine(dia, hora_fin))
+    ocupada = duracion_cita()
+
+    libres = []
+    for inicio in ocupados + [fin_jornada]:
+        while cursor + duracion <= min(inicio, fin_jornada):
+            if desde is None or cursor >= desde:
+                libres.append((cursor, cursor + duracion))
+            cursor += duracion
+        cursor = max(cursor, inicio + ocupada)
+    return libres
+
+
+class Disponibilidad:
+    """
+    Valida ?cod_servicio=&desde=&hasta=&id_emp=&duracion= y arma la
+    respuesta por médico.
+    """
+
+    def __init__(self, request):
+        params = request.query_params
+        self.cod_servicio = self._entero(params.get("cod_servicio"), "cod_servicio")
+        if self.cod_servicio is None:
+            raise ValueError("'cod_servicio' es obligatorio")
+
+        hoy = timezone.localdate()
+        self.desde = self._fecha(params.get("desde"), "desde") or hoy
+        self.hasta = self._fecha(params.get("hasta"), "hasta") or self.desde
+        if self.desde > self.hasta:
+            raise ValueError("'desde' no puede ser posterior a 'hasta'")
+        if (self.hasta - self.desde).days >= MAX_DIAS:
+            raise ValueError(f"El rango no puede superar {MAX_DIAS} días")
+
+        self.id_emps = [
+            self._entero(valor, "id_emp")
+            for valor in params.get("id_emp", "").split(",") if valor
+        ]
+
+        minutos = self._entero(params.get("duracion"), "duracion")
+        if minutos is not None and minutos <= 0:
+            raise ValueError("'duracion' debe ser mayor que cero")
+        self.duracion = timedelta(minutes=minutos) if minutos else duracion_cita()
+
+    def _fecha(self, valor, nombre):
+        if valor is None or valor == "":
+            return None
+        try:
+            return date.fromisoformat(valor)
+        except ValueError:
+            raise ValueError(f"'{nombre}' debe tener formato YYYY-MM-DD")
+
+    def _entero(self, valor, nombre):
+        if valor is None or valor == "":
+            return None
+        try:
+            return int(valor)
+        except ValueError:
+            raise ValueError(f"'{nombre}' debe ser un entero")
+
+    def medicos(self):
+        # sin id_emp: los médicos que ya atienden ese servicio
+        empleados = Empleados.objects.select_related("documento")
+        if self.id_emps:
+            empleados = empleados.filter(id_emp__in=self.id_emps)
+        else:
+            empleados = empleados.filter(citas__cod_servicio_id=self.cod_servicio).distinct()
+        return empleados.order_by("id_emp")
+
+    def dias(self):
+        total = (self.hasta - self.desde).days + 1
+        return [self.desde + timedelta(days=i) for i in range(total)]
+
+    def calcular(self):
+        dias = self.dias()
+        ahora = timezone.now()
+        data = []
+
+        for empleado in self.medicos():
+            ocupados = agenda_cache.ocupados(empleado.id_emp, dias)
+            slots = [
+                {"inicio": inicio.isoformat(), "fin": fin.isoformat()}
+                for dia in dias
+                for inicio, fin in espacios_libres(dia, ocupados[dia], self.duracion, ahora)
+            ]
+            data.append({
+                "id_emp": empleado.id_emp,
+                "medico": empleado.documento.nom_persona,
+                "cod_servicio": self.cod_servicio,
+                "slots": slots,
+            })
+        return data
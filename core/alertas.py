@@ -0,0 +1,204 @@
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import esquema
+
+# ================================================================
+#               ALERTAS DE STOCK BAJO POR SEDE
+# ================================================================
+#
+# `manage.py calcular_alertas_stock` (cron) suma las unidades
+# dispensadas por (cod_med, id_sede, día) de la ventana reciente, arma una matriz
+# pares x días y calcula el consumo diario de todos los pares a la vez
+# con un promedio ponderado que da más peso a los días recientes. Con el
+# saldo de stock_medicamento estima los días que quedan y reescribe
+# alertas_stock; /api/medicamentos/alertas/ solo lee esa tabla. La
+# tabla se crea con `manage.py crear_tablas` (core.esquema).
+#
+# El consumo sale del libro de core.inventario: los movimientos con
+# motivo 'prescripcion', en unidades (las mismas de stock_medicamento) y
+# en la sede de donde salieron. Las prescripciones pendientes todavía no
+# consumen. La ventana tiene que ser más corta que la antigüedad con la
+# que `manage.py compactar_stock` borra movimientos (90 días).
+
+DDL = """
+    CREATE TABLE IF NOT EXISTS alertas_stock (
+        cod_med integer NOT NULL,
+        id_sede integer NOT NULL,
+        cantidad integer NOT NULL,
+        consumo_diario double precision NOT NULL,
+        dias_restantes double precision NOT NULL,
+        fecha_agotamiento date NOT NULL,
+        calculado timestamptz NOT NULL,
+        PRIMARY KEY (cod_med, id_sede)
+    );
+"""
+
+
+def ventana_dias():
+    return getattr(settings, "STOCK_VENTANA_DIAS", 28)
+
+
+def vida_media_dias():
+    return getattr(settings, "STOCK_VIDA_MEDIA_DIAS", 7)
+
+
+def horizonte_dias():
+    return getattr(settings, "STOCK_HORIZONTE_DIAS", 14)
+
+
+def crear_tablas():
+    with connection.cursor() as cursor:
+        cursor.execute(DDL)
+
+
+SQL_CONSUMO = """
+    SELECT cod_med, id_sede, (creado AT TIME ZONE %s)::date, SUM(-delta)
+    FROM movimientos_stock
+    WHERE motivo = 'prescripcion' AND creado >= %s AND creado < %s
+    GROUP BY 1, 2, 3;
+"""
+
+SQL_STOCK = "SELECT cod_med, id_sede, cantidad FROM stock_medicamento;"
+
+# tope para fecha_agotamiento cuando el consumo es casi nulo
+MAX_DIAS_FECHA = 36500
+
+
+def rango_consumo(hoy, ventana):
+    """
+    Parámetros (zona horaria, desde, hasta) de SQL_CONSUMO para los días
+    locales (hoy - ventana, hoy].
+    """
+    desde = datetime.combine(hoy - timedelta(days=ventana - 1), time.min)
+    hasta = datetime.combine(hoy + timedelta(days=1), time.min)
+    return [
+        timezone.get_current_timezone_name(),
+        timezone.make_aware(desde),
+        timezone.make_aware(hasta),
+    ]
+
+
+def pesos(ventana, vida_media):
+    """
+    Peso de cada día de la ventana (índice 0 = hoy), normalizados a 1:
+    un día de hace `vida_media` días pesa la mitad que hoy.
+    """
+    edades = np.arange(ventana, dtype=float)
+    w = 0.5 ** (edades / vida_media)
+    return w / w.sum()
+
+
+def consumo_diario(pares, filas, hoy, ventana, vida_media):
+    """
+    pares: lista de (cod_med, id_sede).
+    filas: lista de (cod_med, id_sede, fecha, unidades).
+    Devuelve el consumo diario estimado de cada par, shape (len(pares),).
+    """
+    indice = {par: i for i, par in enumerate(pares)}
+    datos = [
+        (indice[(cod_med, id_sede)], (hoy - fecha).days, conteo)
+        for cod_med, id_sede, fecha, conteo in filas
+        if (cod_med, id_sede) in indice
+    ]
+
+    # matriz pares x días (columna 0 = hoy)
+    matriz = np.zeros((len(pares), ventana))
+    if datos:
+        fila, edad, conteo = np.array(datos, dtype=np.int64).T
+        np.add.at(matriz, (fila, edad), conteo)
+    return matriz @ pesos(ventana, vida_media)
+
+
+def calcular_alertas(hoy=None):
+    """
+    Recalcula alertas_stock para todos los pares con consumo. Devuelve
+    cuántos pares se agotan dentro del horizonte configurado.
+    """
+    hoy = hoy or timezone.localdate()
+    ventana = ventana_dias()
+    esquema.verificar("alertas_stock", "movimientos_stock")
+
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_STOCK)
+        stock = cursor.fetchall()
+        # (hoy - ventana, hoy]: edades 0 .. ventana-1
+        cursor.execute(SQL_CONSUMO, rango_consumo(hoy, ventana))
+        filas = cursor.fetchall()
+
+    pares = [(cod_med, id_sede) for cod_med, id_sede, _ in stock]
+    cantidades = np.array([cantidad for _, _, cantidad in stock], dtype=float)
+    consumo = consumo_diario(pares, filas, hoy, ventana, vida_media_dias())
+
+    con_consumo = consumo > 0
+    dias = np.divide(
+        np.maximum(cantidades, 0), consumo,
+        out=np.full(len(consumo), np.inf), where=con_consumo,
+    )
+
+    ahora = timezone.now()
+    registros = [
+        (
+            *pares[i], int(cantidades[i]),
+            float(consumo[i]), float(dias[i]),
+            hoy + timedelta(days=int(min(dias[i], MAX_DIAS_FECHA))), ahora,
+        )
+        for i in np.flatnonzero(con_consumo)
+    ]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM alertas_stock;")
+        cursor.executemany(
+            """
+            INSERT INTO alertas_stock
+                (cod_med, id_sede, cantidad, consumo_diario, dias_restantes,
+                 fecha_agotamiento, calculado)
+            VALUES (%s, %s, %s, %s, %s, %s, %s);
+            """,
+            registros
+        )
+
+    return int(np.count_nonzero(dias[con_consumo] <= horizonte_dias()))
+
+
+SQL_ALERTAS = """
+    SELECT
+        a.cod_med, m.nom_med, a.id_sede, s.nom_sede, a.cantidad,
+        a.consumo_diario, a.dias_restantes, a.fecha_agotamiento, a.calculado
+    FROM alertas_stock a
+    JOIN medicamentos m ON m.cod_med = a.cod_med
+    JOIN sedes_hospitalarias s ON s.id_sede = a.id_sede
+    WHERE a.dias_restantes <= %s {sede}
+    ORDER BY a.dias_restantes, a.cod_med, a.id_sede;
+"""
+
+
+def leer_alertas(dias, id_sede=None):
+    esquema.verificar("alertas_stock")
+    sede, params = "", [dias]
+    if id_sede is not None:
+        sede = "AND a.id_sede = %s"
+        params.append(id_sede)
+
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_ALERTAS.format(sede=sede), params)
+        rows = cursor.fetchall()
+
+    return [
+        {
+            "cod_med": row[0],
+            "medicamento": row[1],
+            "id_sede": row[2],
+            "sede": row[3],
+            "cantidad": row[4],
+            "consumo_diario": round(row[5], 2),
+            "dias_restantes": round(row[6], 1),
+            "fecha_agotamiento": row[7],
+            "calculado": row[8],
+        }
+        for row in rows
+    ]
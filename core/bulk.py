@@ -0,0 +1,436 @@
+import csv
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from rest_framework.parsers import BaseParser
+
+from core.catalogos import catalog_cache
+from core.models import TiposDocumento, Cargos, Roles, DepartamentosTrabajo
+from core.passwords import bcrypt_bien_formado, hash_password, bcrypt_rounds
+
+
+# ================================================================
+#                   CARGA MASIVA (COPY + STAGING)
+# ================================================================
+#
+# Las filas se validan en Python contra conjuntos precargados una vez
+# por lote, se copian con COPY a una tabla temporal y desde ahí se
+# insertan con sentencias por conjuntos, todo en una transacción.
+#
+# La inserción va por tramos, cada uno en un savepoint. Si la base
+# rechaza un tramo (un documento insertado en paralelo por otra
+# transacción, un CHECK, una llave foránea), ese tramo se repite fila
+# por fila y cada fila que falla queda en "errores" como las de la
+# validación; las demás se guardan.
+
+TAMANO_TRAMO = 500
+
+
+class CSVTextParser(BaseParser):
+    """Permite enviar el lote como cuerpo text/csv."""
+
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream.read().decode("utf-8-sig")
+
+
+def leer_filas(request, clave):
+    """
+    Devuelve la lista de dicts del lote: arreglo JSON (o {clave: [...]}),
+    cuerpo text/csv o archivo CSV en el campo multipart 'archivo'.
+    """
+    data = request.data
+
+    if isinstance(data, str):
+        return list(csv.DictReader(io.StringIO(data)))
+
+    archivo = request.FILES.get("archivo") if hasattr(request, "FILES") else None
+    if archivo is not None:
+        texto = archivo.read().decode("utf-8-sig")
+        return list(csv.DictReader(io.StringIO(texto)))
+
+    if isinstance(data, dict):
+        data = data.get(clave)
+
+    if not isinstance(data, list):
+        raise ValueError(f"Debe enviar un arreglo JSON, un objeto {{'{clave}': [...]}} o un CSV")
+    return data
+
+
+# ---------------------------------------------------------------
+#   Validación
+# ---------------------------------------------------------------
+
+class FilaInvalida(Exception):
+    pass
+
+
+def _vacio(valor):
+    return valor is None or valor == ""
+
+
+def entero(fila, campo, requerido=True):
+    valor = fila.get(campo)
+    if _vacio(valor):
+        if requerido:
+            raise FilaInvalida(f"{campo} es obligatorio")
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise FilaInvalida(f"{campo} debe ser un entero")
+
+
+def texto(fila, campo, max_length, requerido=False):
+    valor = fila.get(campo)
+    if _vacio(valor):
+        if requerido:
+            raise FilaInvalida(f"{campo} es obligatorio")
+        return None
+    valor = str(valor)
+    if len(valor) > max_length:
+        raise FilaInvalida(f"{campo} supera {max_length} caracteres")
+    return valor
+
+
+def fecha(fila, campo):
+    valor = fila.get(campo)
+    if _vacio(valor):
+        return None
+    try:
+        return date.fromisoformat(str(valor))
+    except ValueError:
+        raise FilaInvalida(f"{campo} debe tener formato YYYY-MM-DD")
+
+
+class Referencias:
+    """
+    Conjuntos de llaves válidas, cargados una sola vez por lote.
+    """
+
+    def __init__(self):
+        self.tipos_doc = {t.pk for t in catalog_cache.all(TiposDocumento)}
+        self.cargos = {c.pk for c in catalog_cache.all(Cargos)}
+        self.roles = {r.pk for r in catalog_cache.all(Roles)}
+        self.departamentos = {d.pk for d in catalog_cache.all(DepartamentosTrabajo)}
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id_sede FROM sedes_hospitalarias;")
+            self.sedes = {row[0] for row in cursor.fetchall()}
+
+
+def validar_persona(fila, refs):
+    persona = {
+        "documento": entero(fila, "documento"),
+        "nom_persona": texto(fila, "nombre", 150, requerido=True),
+        "fecha_nac": fecha(fila, "fecha_nac"),
+        "genero": texto(fila, "genero", 1),
+        "dir_per": texto(fila, "direccion", 150),
+        "correo_per": texto(fila, "correo", 120),
+        "tipo_doc_id": entero(fila, "tipo_doc_id"),
+        "id_sede": entero(fila, "id_sede"),
+    }
+    if persona["tipo_doc_id"] not in refs.tipos_doc:
+        raise FilaInvalida("tipo_doc_id no existe")
+    if persona["id_sede"] not in refs.sedes:
+        raise FilaInvalida("id_sede no existe")
+    return persona
+
+
+# ---------------------------------------------------------------
+#   COPY
+# ---------------------------------------------------------------
+
+def copy_rows(cursor, tabla, columnas, filas):
+    """
+    COPY de `filas` (tuplas) a `tabla`. Usa la API de psycopg 3 y, si el
+    driver es psycopg2, copy_expert con un buffer CSV.
+    """
+    sql = f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN"
+    raw = cursor.cursor
+
+    # el cursor del driver no pasa por el envoltorio de Django: sin esto
+    # un valor rechazado por COPY no llega como DatabaseError
+    with cursor.db.wrap_database_errors:
+        if hasattr(raw, "copy"):
+            with raw.copy(sql) as copy:
+                for fila in filas:
+                    copy.write_row(fila)
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for fila in filas:
+            writer.writerow(["\\N" if v is None else v for v in fila])
+        buffer.seek(0)
+        raw.copy_expert(f"{sql} WITH (FORMAT csv, NULL '\\N')", buffer)
+
+
+# ---------------------------------------------------------------
+#   Pacientes
+# ---------------------------------------------------------------
+
+COLUMNAS_PERSONA = [
+    "documento", "nom_persona", "fecha_nac", "genero",
+    "dir_per", "correo_per", "tipo_doc_id", "id_sede",
+]
+
+
+def _staging_personas(cursor, nombre, validas, extra=None):
+    # extra: columnas adicionales {nombre: tipo} que vienen en cada registro
+    extra = extra or {}
+    columnas_extra = "".join(f",\n            {col} {tipo}" for col, tipo in extra.items())
+    cursor.execute(f"""
+        CREATE TEMP TABLE {nombre} (
+            fila integer PRIMARY KEY,
+            documento integer NOT NULL,
+            nom_persona varchar(150) NOT NULL,
+            fecha_nac date,
+            genero varchar(1),
+            dir_per varchar(150),
+            correo_per varchar(120),
+            tipo_doc_id integer NOT NULL,
+            id_sede integer NOT NULL{columnas_extra}
+        ) ON COMMIT DROP;
+    """)
+    columnas = COLUMNAS_PERSONA + list(extra)
+    copy_rows(
+        cursor, nombre, ["fila"] + columnas,
+        [(i,) + tuple(p[c] for c in columnas) for i, p in validas]
+    )
+
+    # documentos que ya existen en personas
+    cursor.execute(f"""
+        DELETE FROM {nombre} s
+        USING personas per
+        WHERE per.documento = s.documento
+        RETURNING s.fila;
+    """)
+    return [fila for (fila,) in cursor.fetchall()]
+
+
+def _insert_personas(cursor, staging):
+    columnas = ", ".join(COLUMNAS_PERSONA)
+    cursor.execute(f"""
+        INSERT INTO personas ({columnas})
+        SELECT {columnas} FROM {staging} ORDER BY fila;
+    """)
+
+
+def _mensaje_db(error):
+    causa = error.__cause__
+    codigo = getattr(causa, "sqlstate", None) or getattr(causa, "pgcode", None)
+    if isinstance(error, IntegrityError) and codigo == "23505":
+        return "El documento ya existe"
+    return str(error).strip().splitlines()[0]
+
+
+def _insertar_tramo(cursor, staging, tramo, extra, sql_insert):
+    duplicadas = _staging_personas(cursor, staging, tramo, extra)
+    errores = [{"fila": fila, "error": "El documento ya existe"} for fila in duplicadas]
+    _insert_personas(cursor, staging)
+    cursor.execute(sql_insert.format(staging=staging))
+    creados = cursor.fetchall()
+    cursor.execute(f"DROP TABLE {staging};")
+    return creados, errores
+
+
+def _insertar_por_tramos(validas, staging, sql_insert, extra=None):
+    """
+    Inserta los registros validados. `sql_insert` inserta desde
+    {staging} y devuelve (fila, documento, id) de cada fila creada.
+    Devuelve (creados, errores).
+    """
+    creados, errores = [], []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for inicio in range(0, len(validas), TAMANO_TRAMO):
+            tramo = validas[inicio:inicio + TAMANO_TRAMO]
+            try:
+                with transaction.atomic():
+                    c, e = _insertar_tramo(cursor, staging, tramo, extra, sql_insert)
+                creados += c
+                errores += e
+                continue
+            except DatabaseError:
+                pass
+
+            for registro in tramo:
+                try:
+                    with transaction.atomic():
+                        c, e = _insertar_tramo(cursor, staging, [registro], extra, sql_insert)
+                    creados += c
+                    errores += e
+                except DatabaseError as error:
+                    errores.append({"fila": registro[0], "error": _mensaje_db(error)})
+    return creados, errores
+
+
+def _validar_lote(filas, validar):
+    validas, errores, vistos = [], [], set()
+    for i, fila in enumerate(filas, start=1):
+        try:
+            if not isinstance(fila, dict):
+                raise FilaInvalida("La fila debe ser un objeto")
+            registro = validar(fila)
+            if registro["documento"] in vistos:
+                raise FilaInvalida("documento repetido en el lote")
+            vistos.add(registro["documento"])
+            validas.append((i, registro))
+        except FilaInvalida as e:
+            errores.append({"fila": i, "error": str(e)})
+    return validas, errores
+
+
+SQL_INSERT_PACIENTES = """
+    WITH nuevos AS (
+        INSERT INTO pacientes (documento)
+        SELECT documento FROM {staging} ORDER BY fila
+        RETURNING cod_pac, documento
+    )
+    SELECT s.fila, n.documento, n.cod_pac
+    FROM nuevos n
+    JOIN {staging} s ON s.documento = n.documento
+    ORDER BY s.fila;
+"""
+
+
+def cargar_pacientes(filas):
+    """
+    Crea personas + pacientes en bloque. Devuelve
+    {"creados", "pacientes": [{fila, documento, cod_pac}], "errores": [{fila, error}]}.
+    """
+    refs = Referencias()
+    validas, errores = _validar_lote(filas, lambda fila: validar_persona(fila, refs))
+    creados = []
+
+    if validas:
+        filas_creadas, errores_db = _insertar_por_tramos(
+            validas, "staging_pacientes", SQL_INSERT_PACIENTES
+        )
+        errores.extend(errores_db)
+        creados = [
+            {"fila": fila, "documento": documento, "cod_pac": cod_pac}
+            for fila, documento, cod_pac in filas_creadas
+        ]
+
+    errores.sort(key=lambda e: e["fila"])
+    return {"creados": len(creados), "pacientes": creados, "errores": errores}
+
+
+# ---------------------------------------------------------------
+#   Empleados
+# ---------------------------------------------------------------
+
+COLUMNAS_EMPLEADO = {
+    "id_dept": "integer NOT NULL",
+    "cargo_id": "integer NOT NULL",
+    "rol_id": "integer NOT NULL",
+    "hash_contra": "text NOT NULL",
+}
+
+
+def validar_empleado(fila, refs):
+    # acepta la fila plana o anidada como en EmpleadosReporteView.post
+    if isinstance(fila.get("persona"), dict) or isinstance(fila.get("empleado"), dict):
+        fila = {**(fila.get("persona") or {}), **(fila.get("empleado") or {})}
+
+    empleado = validar_persona(fila, refs)
+    empleado.update({
+        "id_dept": entero(fila, "id_dept"),
+        "cargo_id": entero(fila, "cargo_id"),
+        "rol_id": entero(fila, "rol_id"),
+    })
+    if empleado["id_dept"] not in refs.departamentos:
+        raise FilaInvalida("id_dept no existe")
+    if empleado["cargo_id"] not in refs.cargos:
+        raise FilaInvalida("cargo_id no existe")
+    if empleado["rol_id"] not in refs.roles:
+        raise FilaInvalida("rol_id no existe")
+
+    # "password" siempre se hashea; un "hash_contra" enviado por el
+    # cliente solo se acepta si es un hash bcrypt bien formado
+    password = fila.get("password")
+    hash_contra = fila.get("hash_contra")
+    if not _vacio(password):
+        empleado["password"] = str(password)
+        empleado["hash_contra"] = None
+    elif not _vacio(hash_contra):
+        if not bcrypt_bien_formado(hash_contra):
+            raise FilaInvalida("hash_contra no es un hash bcrypt válido")
+        empleado["hash_contra"] = hash_contra
+    else:
+        raise FilaInvalida("password es obligatorio")
+    return empleado
+
+
+# Pool de hilos propio de la carga masiva (bcrypt libera el GIL), aparte
+# del de login en core.passwords para que un lote grande no lo sature.
+_pool_bcrypt = ThreadPoolExecutor(
+    max_workers=getattr(settings, "BCRYPT_WORKERS", None) or os.cpu_count() or 1,
+    thread_name_prefix="bcrypt-bulk",
+)
+
+
+def hashear_en_paralelo(passwords):
+    """
+    bcrypt de todo el lote repartido en el pool de la carga masiva.
+    """
+    rounds = bcrypt_rounds()
+    if len(passwords) < 2:
+        return [hash_password(p, rounds) for p in passwords]
+    return list(_pool_bcrypt.map(hash_password, passwords, [rounds] * len(passwords)))
+
+
+SQL_INSERT_EMPLEADOS = """
+    WITH nuevos AS (
+        INSERT INTO empleados (documento, id_dept, cargo_id, rol_id, hash_contra)
+        SELECT documento, id_dept, cargo_id, rol_id, hash_contra
+        FROM {staging} ORDER BY fila
+        RETURNING id_emp, documento
+    )
+    SELECT s.fila, n.documento, n.id_emp
+    FROM nuevos n
+    JOIN {staging} s ON s.documento = n.documento
+    ORDER BY s.fila;
+"""
+
+
+def cargar_empleados(filas):
+    """
+    Crea personas + empleados en bloque. Devuelve
+    {"creados", "empleados": [{fila, documento, id_emp}], "errores", "segundos", "filas_por_segundo"}.
+    """
+    inicio = time.perf_counter()
+    refs = Referencias()
+    validas, errores = _validar_lote(filas, lambda fila: validar_empleado(fila, refs))
+    creados = []
+
+    if validas:
+        sin_hash = [e for _, e in validas if e["hash_contra"] is None]
+        hashes = hashear_en_paralelo([e.pop("password") for e in sin_hash])
+        for empleado, hash_contra in zip(sin_hash, hashes):
+            empleado["hash_contra"] = hash_contra
+
+        filas_creadas, errores_db = _insertar_por_tramos(
+            validas, "staging_empleados", SQL_INSERT_EMPLEADOS, extra=COLUMNAS_EMPLEADO
+        )
+        errores.extend(errores_db)
+        creados = [
+            {"fila": fila, "documento": documento, "id_emp": id_emp}
+            for fila, documento, id_emp in filas_creadas
+        ]
+
+    segundos = time.perf_counter() - inicio
+    errores.sort(key=lambda e: e["fila"])
+    return {
+        "creados": len(creados),
+        "empleados": creados,
+        "errores": errores,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(len(creados) / segundos, 1) if segundos else None,
+    }
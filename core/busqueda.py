@@ -0,0 +1,299 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Q
+
+from core import esquema
+from core.models import Personas
+
+
+# ================================================================
+#                      BÚSQUEDA DE PERSONAS
+# ================================================================
+#
+# En PostgreSQL el nombre se busca por similitud de trigramas (pg_trgm)
+# con el índice GIN idx_personas_nombre_trgm: encuentra nombres
+# parciales y con errores de digitación y los ordena por similitud. Un
+# texto solo de dígitos se busca como prefijo del documento con
+# idx_personas_documento_texto. En otros motores (SQLite en pruebas
+# locales), o si la extensión aún no está instalada, se usa un
+# ILIKE/LIKE sin ranking.
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MIN_LARGO = 2
+
+_trgm = None
+
+
+class Busqueda:
+    """
+    Valida ?q=&limit= de las vistas de búsqueda.
+    """
+
+    def __init__(self, request):
+        params = request.query_params
+        self.q = " ".join((params.get("q") or "").split())
+        if len(self.q) < MIN_LARGO:
+            raise ValueError(f"'q' debe tener al menos {MIN_LARGO} caracteres")
+        self.limite = self._limite(params.get("limit"))
+
+    def _limite(self, valor):
+        if valor is None or valor == "":
+            return DEFAULT_LIMIT
+        try:
+            limite = int(valor)
+        except ValueError:
+            raise ValueError("El parámetro 'limit' debe ser un entero")
+        if limite < 1:
+            raise ValueError("El parámetro 'limit' debe ser mayor que 0")
+        return min(limite, MAX_LIMIT)
+
+
+SQL_DOCUMENTO = """
+    SELECT per.documento, per.nom_persona, per.id_sede, pac.cod_pac, 1.0 AS score
+    FROM personas per
+    LEFT JOIN pacientes pac ON pac.documento = per.documento
+    WHERE per.documento::text LIKE %s
+    ORDER BY per.documento::text
+    LIMIT %s;
+"""
+
+# <% (word_similarity) compara q con la parte más parecida del nombre,
+# así "gonzal" o "gonsalez" encuentran "María González Pérez".
+SQL_NOMBRE = """
+    SELECT
+        per.documento,
+        per.nom_persona,
+        per.id_sede,
+        pac.cod_pac,
+        word_similarity(%s, per.nom_persona) AS score
+    FROM personas per
+    LEFT JOIN pacientes pac ON pac.documento = per.documento
+    WHERE %s <%% per.nom_persona
+    ORDER BY score DESC, per.nom_persona
+    LIMIT %s;
+"""
+
+
+def trgm_disponible():
+    # se consulta una vez por proceso; `manage.py sync_indexes` crea la
+    # extensión junto con el índice
+    global _trgm
+    if _trgm is None:
+        if connection.vendor != "postgresql":
+            _trgm = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm';")
+                _trgm = cursor.fetchone() is not None
+    return _trgm
+
+
+def _consultar(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _buscar_like(q, limite):
+    filtro = Q(nom_persona__icontains=q)
+    if q.isdigit():
+        filtro |= Q(documento__startswith=q)
+    personas = (
+        Personas.objects
+        .filter(filtro)
+        .order_by("nom_persona")
+        .values_list("documento", "nom_persona", "id_sede", "pacientes__cod_pac")[:limite]
+    )
+    return [fila + (None,) for fila in personas]
+
+
+def buscar_personas(q, limite=DEFAULT_LIMIT):
+    if connection.vendor == "postgresql" and q.isdigit():
+        rows = _consultar(SQL_DOCUMENTO, [q + "%", limite])
+    elif trgm_disponible():
+        rows = _consultar(SQL_NOMBRE, [q, q, limite])
+    else:
+        rows = _buscar_like(q, limite)
+
+    return [
+        {
+            "documento": row[0],
+            "nombre": row[1],
+            "id_sede": row[2],
+            "cod_pac": row[3],
+            "score": round(float(row[4]), 3) if row[4] is not None else None,
+        }
+        for row in rows
+    ]
+
+
+# ================================================================
+#               BÚSQUEDA DE TEXTO EN DIAGNÓSTICOS
+# ================================================================
+#
+# En PostgreSQL se usa el índice GIN de expresión
+# idx_historias_diagnostico_fts sobre to_tsvector('spanish', diagnostico)
+# (core.indexes); la consulta repite la misma expresión para que el
+# planificador lo use. En SQLite se mantiene una tabla FTS5 equivalente
+# con triggers, creada por `manage.py crear_tablas` (core.esquema).
+
+CONFIG_FTS = "spanish"
+
+SQL_DIAGNOSTICOS_PG = """
+    WITH hits AS (
+        SELECT
+            h.cod_hist,
+            ts_rank(to_tsvector('{config}', h.diagnostico), q.consulta, 1) AS score
+        FROM historias_clinicas h
+        CROSS JOIN websearch_to_tsquery('{config}', %s) AS q(consulta)
+        {joins}
+        WHERE to_tsvector('{config}', h.diagnostico) @@ q.consulta
+        {filtros}
+        ORDER BY score DESC, h.cod_hist DESC
+        LIMIT %s
+    )
+    SELECT
+        h.cod_hist,
+        h.fecha_hora,
+        h.diagnostico,
+        hits.score,
+        c.cod_pac,
+        p_pac.nom_persona,
+        c.id_emp,
+        p_emp.nom_persona,
+        p_pac.id_sede
+    FROM hits
+    JOIN historias_clinicas h ON h.cod_hist = hits.cod_hist
+    JOIN citas c ON h.id_cita = c.id_cita
+    JOIN pacientes pac ON c.cod_pac = pac.cod_pac
+    JOIN personas p_pac ON pac.documento = p_pac.documento
+    JOIN empleados e ON c.id_emp = e.id_emp
+    JOIN personas p_emp ON e.documento = p_emp.documento
+    ORDER BY hits.score DESC, h.cod_hist DESC;
+"""
+
+# la sede de una historia es la del paciente, como en rollup_enfermedades
+JOIN_SEDE = """
+        JOIN citas cs ON h.id_cita = cs.id_cita
+        JOIN pacientes pacs ON cs.cod_pac = pacs.cod_pac
+        JOIN personas pers ON pacs.documento = pers.documento
+"""
+
+SQL_DIAGNOSTICOS_SQLITE = """
+    SELECT
+        h.cod_hist,
+        h.fecha_hora,
+        h.diagnostico,
+        -bm25(historias_fts) AS score,
+        c.cod_pac,
+        p_pac.nom_persona,
+        c.id_emp,
+        p_emp.nom_persona,
+        p_pac.id_sede
+    FROM historias_fts
+    JOIN historias_clinicas h ON h.cod_hist = historias_fts.rowid
+    JOIN citas c ON h.id_cita = c.id_cita
+    JOIN pacientes pac ON c.cod_pac = pac.cod_pac
+    JOIN personas p_pac ON pac.documento = p_pac.documento
+    JOIN empleados e ON c.id_emp = e.id_emp
+    JOIN personas p_emp ON e.documento = p_emp.documento
+    WHERE historias_fts MATCH %s
+    {filtros}
+    ORDER BY score DESC, h.cod_hist DESC
+    LIMIT %s;
+"""
+
+DDL_FTS_SQLITE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS historias_fts USING fts5(
+        diagnostico,
+        content='historias_clinicas',
+        content_rowid='cod_hist',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS historias_fts_ai AFTER INSERT ON historias_clinicas BEGIN
+        INSERT INTO historias_fts(rowid, diagnostico) VALUES (new.cod_hist, new.diagnostico);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS historias_fts_ad AFTER DELETE ON historias_clinicas BEGIN
+        INSERT INTO historias_fts(historias_fts, rowid, diagnostico)
+        VALUES ('delete', old.cod_hist, old.diagnostico);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS historias_fts_au AFTER UPDATE ON historias_clinicas BEGIN
+        INSERT INTO historias_fts(historias_fts, rowid, diagnostico)
+        VALUES ('delete', old.cod_hist, old.diagnostico);
+        INSERT INTO historias_fts(rowid, diagnostico) VALUES (new.cod_hist, new.diagnostico);
+    END;
+    """,
+    "INSERT INTO historias_fts(historias_fts) VALUES ('rebuild');",
+]
+
+
+def crear_tablas():
+    # en PostgreSQL basta el índice de core.indexes
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for sql in DDL_FTS_SQLITE:
+            cursor.execute(sql)
+
+
+def _consulta_fts5(q):
+    # cada palabra como frase literal: FTS5 las combina con AND y no
+    # interpreta operadores ni comillas del usuario
+    return " ".join('"' + palabra.replace('"', '""') + '"' for palabra in q.split())
+
+
+def _filtros_diagnosticos(filtros, sede):
+    condiciones, params = [], []
+    if filtros.id_sede is not None:
+        condiciones.append(f"AND {sede}.id_sede = %s")
+        params.append(filtros.id_sede)
+    if filtros.desde:
+        condiciones.append("AND h.fecha_hora >= %s")
+        params.append(filtros.desde)
+    if filtros.hasta:
+        condiciones.append("AND h.fecha_hora < %s")
+        params.append(filtros.hasta + timedelta(days=1))
+    return "\n".join(condiciones), params
+
+
+def buscar_diagnosticos(q, filtros, limite=DEFAULT_LIMIT):
+    """
+    Historias cuyo diagnóstico coincide con `q`, de mayor a menor
+    relevancia. `filtros` es un core.filtros.ReporteFiltros.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            where, params = _filtros_diagnosticos(filtros, "pers")
+            joins = JOIN_SEDE if filtros.id_sede is not None else ""
+            sql = SQL_DIAGNOSTICOS_PG.format(config=CONFIG_FTS, joins=joins, filtros=where)
+            cursor.execute(sql, [q] + params + [limite])
+        else:
+            esquema.verificar("historias_fts")
+            where, params = _filtros_diagnosticos(filtros, "p_pac")
+            sql = SQL_DIAGNOSTICOS_SQLITE.format(filtros=where)
+            cursor.execute(sql, [_consulta_fts5(q)] + params + [limite])
+        rows = cursor.fetchall()
+
+    return [
+        {
+            "cod_hist": row[0],
+            "fecha_hora": row[1],
+            "diagnostico": row[2],
+            "score": round(float(row[3]), 4),
+            "cod_pac": row[4],
+            "paciente_nombre": row[5],
+            "id_emp": row[6],
+            "medico_nombre": row[7],
+            "id_sede": row[8],
+        }
+        for row in rows
+    ]
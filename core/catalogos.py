@@ -0,0 +1,135 @@
+import threading
+
+from django.core.cache import caches
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from core.models import (
+    Regiones, Cargos, Roles, TiposDocumento, TiposServicio,
+    TipoEquipamiento, DepartamentosTrabajo
+)
+
+
+# ================================================================
+#               CACHÉ DE CATÁLOGOS (TABLAS DE REFERENCIA)
+# ================================================================
+#
+# Cada worker guarda en memoria las filas de los catálogos pequeños.
+# La versión de cada catálogo vive en la caché compartida "catalogos"
+# (settings.CACHES); una escritura por el ModelViewSet la incrementa y
+# los demás workers recargan al ver una versión distinta. Leer un
+# catálogo cuesta solo esa comprobación de versión.
+
+CATALOG_MODELS = (
+    Regiones, Cargos, Roles, TiposDocumento, TiposServicio,
+    TipoEquipamiento, DepartamentosTrabajo,
+)
+
+
+def _version_key(model):
+    return f"catalogo:{model._meta.db_table}:version"
+
+
+class CatalogCache:
+
+    def __init__(self, alias="catalogos"):
+        self.alias = alias
+        self._data = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def version(self, model):
+        return self.shared.get(_version_key(model), 0)
+
+    def bump(self, model):
+        key = _version_key(model)
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            # la llave no existe todavía (o expiró)
+            self.shared.set(key, 1, timeout=None)
+        with self._lock:
+            self._data.pop(model, None)
+
+    def _load(self, model):
+        version = self.version(model)
+        item = self._data.get(model)
+        if item is not None and item[0] == version:
+            return item[1]
+
+        filas = {obj.pk: obj for obj in model.objects.order_by("pk")}
+        with self._lock:
+            self._data[model] = (version, filas)
+        return filas
+
+    def all(self, model):
+        return list(self._load(model).values())
+
+    def get(self, model, pk):
+        return self._load(model).get(pk)
+
+
+catalog_cache = CatalogCache()
+
+
+class CatalogViewSetMixin:
+    """
+    list/retrieve se sirven desde catalog_cache; create/update/destroy
+    invalidan la versión del catálogo.
+    """
+
+    def list(self, request, *args, **kwargs):
+        model = self.queryset.model
+        serializer = self.get_serializer(catalog_cache.all(model), many=True)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        model = self.queryset.model
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        try:
+            pk = model._meta.pk.to_python(kwargs[lookup])
+        except Exception:
+            raise Http404
+        obj = catalog_cache.get(model, pk)
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(request, obj)
+        return Response(self.get_serializer(obj).data)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        catalog_cache.bump(self.queryset.model)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        catalog_cache.bump(self.queryset.model)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        catalog_cache.bump(self.queryset.model)
+
+
+class CatalogPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField que valida contra catalog_cache en vez de
+    consultar la base de datos en cada escritura.
+    """
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        model = self.get_queryset().model
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except Exception:
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        obj = catalog_cache.get(model, pk)
+        if obj is None:
+            self.fail("does_not_exist", pk_value=data)
+        return obj
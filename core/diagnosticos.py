@@ -0,0 +1,201 @@
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import esquema
+
+
+# ================================================================
+#               CATÁLOGO NORMALIZADO DE DIAGNÓSTICOS
+# ================================================================
+#
+# historias_clinicas.diagnostico es texto libre. Al guardar una historia
+# el texto se normaliza (minúsculas, sin tildes ni signos, sinónimos) y
+# se le asigna el código entero de diagnosticos_catalogo en
+# historias_diagnostico; el reporte de enfermedades agrupa por ese
+# código. `manage.py backfill_diagnosticos` asigna las historias viejas.
+
+TABLAS = ("diagnosticos_catalogo", "historias_diagnostico")
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS diagnosticos_catalogo (
+        cod_diag serial PRIMARY KEY,
+        clave varchar(200) NOT NULL UNIQUE,
+        nombre varchar(500) NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS historias_diagnostico (
+        cod_hist integer PRIMARY KEY
+            REFERENCES historias_clinicas (cod_hist) ON DELETE CASCADE,
+        cod_diag integer NOT NULL REFERENCES diagnosticos_catalogo (cod_diag)
+    );
+    """,
+]
+
+# clave normalizada -> clave canónica; se puede ampliar con
+# settings.DIAGNOSTICO_SINONIMOS
+SINONIMOS = {
+    "dengue clasico": "dengue",
+    "dengue sin signos de alarma": "dengue",
+    "fiebre dengue": "dengue",
+    "dengue hemorragico": "dengue grave",
+    "dengue con signos de alarma": "dengue grave",
+    "gripe": "influenza",
+    "gripa": "influenza",
+    "resfriado": "rinofaringitis aguda",
+    "resfriado comun": "rinofaringitis aguda",
+    "ira": "infeccion respiratoria aguda",
+    "eda": "enfermedad diarreica aguda",
+    "diarrea aguda": "enfermedad diarreica aguda",
+    "hta": "hipertension arterial",
+    "hipertension": "hipertension arterial",
+    "dm2": "diabetes mellitus tipo 2",
+    "diabetes tipo 2": "diabetes mellitus tipo 2",
+    "itu": "infeccion de vias urinarias",
+    "infeccion urinaria": "infeccion de vias urinarias",
+    "covid": "covid 19",
+    "covid19": "covid 19",
+    "sars cov 2": "covid 19",
+}
+
+MAX_CLAVE = 200
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def sinonimos():
+    return {**SINONIMOS, **getattr(settings, "DIAGNOSTICO_SINONIMOS", {})}
+
+
+def _clave_base(texto):
+    texto = unicodedata.normalize("NFKD", (texto or "").casefold())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(" ", texto).strip()[:MAX_CLAVE].strip()
+
+
+class Normalizador:
+    """
+    Texto libre -> (clave, nombre). La clave agrupa las variantes; el
+    nombre es el texto con que se crea la entrada del catálogo.
+    """
+
+    def __init__(self, mapa=None):
+        self.mapa = sinonimos() if mapa is None else mapa
+
+    def clave(self, texto):
+        base = _clave_base(texto)
+        return self.mapa.get(base, base)
+
+    def nombre(self, texto):
+        base = _clave_base(texto)
+        if base in self.mapa:
+            return self.mapa[base].capitalize()
+        return " ".join(texto.split())
+
+
+class CatalogoDiagnosticos:
+    """
+    Códigos ya resueltos en memoria del proceso (clave -> cod_diag). Una
+    clave nueva se inserta con ON CONFLICT, así que dos workers que la
+    ven a la vez terminan con el mismo código; solo pasa a memoria al
+    confirmarse la transacción.
+    """
+
+    def __init__(self):
+        self._codigos = {}
+        self._lock = threading.Lock()
+        self._normalizador = None
+
+    @property
+    def normalizador(self):
+        if self._normalizador is None:
+            self._normalizador = Normalizador()
+        return self._normalizador
+
+    def codigos(self, textos):
+        """
+        {texto: cod_diag} para todos los textos, con a lo sumo dos
+        consultas para las claves que no estaban en memoria.
+        """
+        claves = {texto: self.normalizador.clave(texto) for texto in textos}
+        faltantes = {}
+        for texto, clave in claves.items():
+            if clave not in self._codigos and clave not in faltantes:
+                faltantes[clave] = self.normalizador.nombre(texto)
+
+        resueltos = {}
+        if faltantes:
+            esquema.verificar(*TABLAS)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    """
+                    INSERT INTO diagnosticos_catalogo (clave, nombre)
+                    VALUES (%s, %s)
+                    ON CONFLICT (clave) DO NOTHING;
+                    """,
+                    list(faltantes.items())
+                )
+                cursor.execute(
+                    "SELECT clave, cod_diag FROM diagnosticos_catalogo WHERE clave = ANY(%s);",
+                    [list(faltantes)]
+                )
+                resueltos = dict(cursor.fetchall())
+            transaction.on_commit(lambda: self._guardar(resueltos))
+
+        return {
+            texto: resueltos.get(clave) or self._codigos[clave]
+            for texto, clave in claves.items()
+        }
+
+    def _guardar(self, resueltos):
+        with self._lock:
+            self._codigos.update(resueltos)
+
+    def asignar(self, historias):
+        """
+        Asigna el código a cada (cod_hist, diagnostico) y lo guarda en
+        historias_diagnostico.
+        """
+        historias = list(historias)
+        if not historias:
+            return 0
+        esquema.verificar(*TABLAS)
+        codigos = self.codigos({diagnostico for _, diagnostico in historias})
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                """
+                INSERT INTO historias_diagnostico (cod_hist, cod_diag)
+                VALUES (%s, %s)
+                ON CONFLICT (cod_hist) DO UPDATE SET cod_diag = EXCLUDED.cod_diag;
+                """,
+                [(cod_hist, codigos[diagnostico]) for cod_hist, diagnostico in historias]
+            )
+        return len(historias)
+
+    def asignar_historia(self, historia):
+        """
+        Asigna el código al guardar una historia. Sin las tablas (antes de
+        `manage.py crear_tablas`) no se asigna nada y la historia se guarda
+        igual; `manage.py backfill_diagnosticos` la asigna después.
+        """
+        if not esquema.existen(*TABLAS):
+            return
+        self.asignar([(historia.cod_hist, historia.diagnostico)])
+
+    def clear(self):
+        with self._lock:
+            self._codigos.clear()
+
+
+catalogo_diagnosticos = CatalogoDiagnosticos()
+
+
+def crear_tablas():
+    with connection.cursor() as cursor:
+        for ddl in DDL:
+            cursor.execute(ddl)
@@ -0,0 +1,69 @@
+from importlib import import_module
+
+from django.db import connection
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# ================================================================
+#          TABLAS AUXILIARES (SE CREAN AL DESPLEGAR)
+# ================================================================
+#
+# Las tablas que no están en models.py (rollups, catálogo de
+# diagnósticos, libro de stock, ...) se crean solo con
+# `manage.py crear_tablas`, que se corre en cada despliegue con un rol
+# que tenga permisos de DDL. Las peticiones nunca ejecutan DDL:
+# verifican que las tablas existan (una consulta por proceso hasta que
+# aparecen) y responden 503 si faltan.
+#
+# Cada módulo de MODULOS expone crear_tablas(), idempotente.
+
+MODULOS = [
+    "core.alertas",
+    "core.busqueda",
+    "core.diagnosticos",
+    "core.inventario",
+    "core.rollups",
+    "core.tokens",
+]
+
+_existentes = set()
+
+
+class TablasFaltantes(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Faltan tablas auxiliares; ejecute `manage.py crear_tablas`."
+    default_code = "tablas_faltantes"
+
+
+def _faltantes(tablas):
+    faltan = [tabla for tabla in tablas if tabla not in _existentes]
+    if not faltan:
+        return []
+    with connection.cursor() as cursor:
+        presentes = set(connection.introspection.table_names(cursor))
+    _existentes.update(tabla for tabla in faltan if tabla in presentes)
+    return [tabla for tabla in faltan if tabla not in presentes]
+
+
+def existen(*tablas):
+    return not _faltantes(tablas)
+
+
+def verificar(*tablas):
+    faltan = _faltantes(tablas)
+    if faltan:
+        raise TablasFaltantes(
+            f"Faltan las tablas {', '.join(faltan)}; ejecute `manage.py crear_tablas`."
+        )
+
+
+def crear_tablas():
+    """
+    Crea las tablas de todos los módulos registrados. Devuelve los
+    nombres de los módulos en el orden en que se procesaron.
+    """
+    for modulo in MODULOS:
+        import_module(modulo).crear_tablas()
+    _existentes.clear()
+    return list(MODULOS)
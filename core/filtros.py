@@ -0,0 +1,50 @@
+from datetime import date
+
+
+# ================================================================
+#               FILTROS DE LOS REPORTES (?desde=&hasta=&id_sede=)
+# ================================================================
+
+
+class ReporteFiltros:
+    """
+    Valida los filtros de un reporte. El rango de fechas lo aplica
+    core.rollups.fuente (periodos completos del rollup más los días de
+    los bordes); where() solo traduce id_sede.
+    """
+
+    def __init__(self, request, permitir_fechas=True):
+        params = request.query_params
+        self.desde = self._fecha(params.get("desde"), "desde")
+        self.hasta = self._fecha(params.get("hasta"), "hasta")
+        self.id_sede = self._entero(params.get("id_sede"), "id_sede")
+
+        if not permitir_fechas and (self.desde or self.hasta):
+            raise ValueError("Este reporte solo admite el filtro id_sede")
+
+        if self.desde and self.hasta and self.desde > self.hasta:
+            raise ValueError("'desde' no puede ser posterior a 'hasta'")
+
+    def _fecha(self, valor, nombre):
+        if valor is None or valor == "":
+            return None
+        try:
+            return date.fromisoformat(valor)
+        except ValueError:
+            raise ValueError(f"'{nombre}' debe tener formato YYYY-MM-DD")
+
+    def _entero(self, valor, nombre):
+        if valor is None or valor == "":
+            return None
+        try:
+            return int(valor)
+        except ValueError:
+            raise ValueError(f"'{nombre}' debe ser un entero")
+
+    def where(self, alias):
+        """
+        Devuelve ("WHERE ...", params) o ("", []) si no hay filtros.
+        """
+        if self.id_sede is None:
+            return "", []
+        return f"WHERE {alias}.id_sede = %s", [self.id_sede]
@@ -0,0 +1,233 @@
+import re
+
+from django.db import DatabaseError, connection, transaction
+
+
+# ================================================================
+#                 REGISTRO DE ÍNDICES (ESQUEMA NO MANEJADO)
+# ================================================================
+#
+# Todos los modelos son managed = False, así que Django no crea índices.
+# Aquí se declaran los que necesitan los JOIN y filtros de core/views.py;
+# `manage.py sync_indexes` los compara con pg_indexes y crea los que
+# falten con CREATE INDEX CONCURRENTLY.
+#
+# La comparación es por definición, no solo por nombre: cada IndexSpec
+# se construye sobre una copia vacía de su tabla (en una transacción que
+# se descarta) y su pg_get_indexdef, sin nombre ni tabla, se compara con
+# el de pg_indexes. Un índice con el nombre registrado pero otra
+# definición se recrea; uno equivalente con otro nombre se respeta.
+
+
+class IndexSpec:
+
+    def __init__(self, nombre, tabla, columnas, unique=False, using="btree", where=None,
+                 extension=None):
+        self.nombre = nombre
+        self.tabla = tabla
+        self.columnas = columnas
+        self.unique = unique
+        self.using = using
+        self.where = where
+        # extensión que provee la clase de operadores (p. ej. pg_trgm)
+        self.extension = extension
+
+    def extension_sql(self):
+        if not self.extension:
+            return None
+        return f"CREATE EXTENSION IF NOT EXISTS {self.extension};"
+
+    def create_sql(self, nombre=None, tabla=None, concurrently=True):
+        unique = "UNIQUE " if self.unique else ""
+        concurrente = "CONCURRENTLY " if concurrently else ""
+        sql = (
+            f"CREATE {unique}INDEX {concurrente}IF NOT EXISTS {nombre or self.nombre} "
+            f"ON {tabla or self.tabla} USING {self.using} ({', '.join(self.columnas)})"
+        )
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql + ";"
+
+    def drop_sql(self):
+        return f"DROP INDEX CONCURRENTLY IF EXISTS {self.nombre};"
+
+    def __repr__(self):
+        return f"<IndexSpec {self.nombre}>"
+
+
+INDEXES = {}
+
+
+def register(*specs):
+    for spec in specs:
+        INDEXES[spec.nombre] = spec
+
+
+register(
+    # llaves foráneas usadas en los JOIN
+    # (cod_pac, fecha_hora) también sirve los JOIN por cod_pac y la
+    # línea de tiempo del paciente
+    IndexSpec("idx_citas_cod_pac_fecha", "citas", ["cod_pac", "fecha_hora"]),
+    IndexSpec("idx_citas_id_emp_fecha", "citas", ["id_emp", "fecha_hora"]),
+    IndexSpec("idx_historias_id_cita", "historias_clinicas", ["id_cita"]),
+    IndexSpec("idx_presc_cod_hist", "prescripciones_medicamentos", ["cod_hist"]),
+    IndexSpec("idx_personas_id_sede", "personas", ["id_sede"]),
+    IndexSpec("idx_pacientes_documento", "pacientes", ["documento"]),
+    IndexSpec("idx_empleados_documento", "empleados", ["documento"]),
+    IndexSpec("idx_equipamento_responsable", "equipamento", ["responsable"]),
+    IndexSpec("idx_equipamento_id_dept", "equipamento", ["id_dept"]),
+
+    # rangos de fechas de reportes y rollups
+    IndexSpec("idx_citas_fecha_hora", "citas", ["fecha_hora"]),
+    IndexSpec("idx_historias_fecha_hora", "historias_clinicas", ["fecha_hora"]),
+    IndexSpec("idx_presc_fecha_emision", "prescripciones_medicamentos", ["fecha_emision"]),
+
+    # búsqueda de personas (core.busqueda): trigramas sobre el nombre y
+    # prefijo del documento como texto
+    IndexSpec(
+        "idx_personas_nombre_trgm", "personas", ["nom_persona gin_trgm_ops"],
+        using="gin", extension="pg_trgm",
+    ),
+    IndexSpec(
+        "idx_personas_documento_texto", "personas", ["(documento::text) text_pattern_ops"],
+    ),
+
+    # texto completo de diagnósticos; la expresión debe coincidir con la
+    # de core.busqueda.SQL_DIAGNOSTICOS_PG
+    IndexSpec(
+        "idx_historias_diagnostico_fts", "historias_clinicas",
+        ["to_tsvector('spanish', diagnostico)"], using="gin",
+    ),
+)
+
+
+_INDEXDEF = re.compile(r"^CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ (USING .*)$")
+
+
+def normalizar(indexdef):
+    """
+    pg_get_indexdef sin el nombre del índice ni el de la tabla.
+    """
+    m = _INDEXDEF.match(indexdef)
+    if m is None:
+        return indexdef
+    return f"{m.group(1) or ''}{m.group(2)}"
+
+
+def existing_indexes():
+    """
+    Índices del esquema actual: {nombre: (es_valido, tabla, definicion)}.
+    """
+    sql = """
+        SELECT i.indexname, ix.indisvalid, i.tablename, i.indexdef
+        FROM pg_indexes i
+        JOIN pg_class c ON c.relname = i.indexname
+        JOIN pg_namespace n ON n.oid = c.relnamespace AND n.nspname = i.schemaname
+        JOIN pg_index ix ON ix.indexrelid = c.oid
+        WHERE i.schemaname = current_schema();
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return {
+            nombre: (valido, tabla, normalizar(indexdef))
+            for nombre, valido, tabla, indexdef in cursor.fetchall()
+        }
+
+
+def expected_definitions(specs):
+    """
+    {nombre: definicion normalizada} de cada spec, tal como la escribe
+    Postgres. Se construye sobre tablas temporales vacías y se descarta
+    todo al final; una spec que no se puede construir (p. ej. falta la
+    extensión) queda fuera.
+    """
+    definiciones = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for tabla in {spec.tabla for spec in specs}:
+            cursor.execute(f"CREATE TEMP TABLE _idx_{tabla} (LIKE {tabla});")
+        for spec in specs:
+            nombre = f"_idx_{spec.nombre}"[:63]
+            try:
+                with transaction.atomic():
+                    cursor.execute(spec.create_sql(nombre, f"_idx_{spec.tabla}", concurrently=False))
+                    cursor.execute("SELECT pg_get_indexdef(%s::regclass);", [nombre])
+                    definiciones[spec.nombre] = normalizar(cursor.fetchone()[0])
+            except DatabaseError:
+                pass
+        transaction.set_rollback(True)
+    return definiciones
+
+
+def diff_indexes():
+    """
+    Compara el registro con la base y devuelve
+    (faltantes, invalidos, distintos, equivalentes):
+
+    - faltantes: specs sin índice con su nombre ni uno equivalente.
+    - invalidos: quedaron de un CREATE INDEX CONCURRENTLY que falló.
+    - distintos: el índice existe con otra definición.
+    - equivalentes: [(spec, nombre_existente)] con la misma definición
+      bajo otro nombre; no se crean de nuevo.
+    """
+    existentes = existing_indexes()
+    esperadas = expected_definitions(list(INDEXES.values()))
+    faltantes, invalidos, distintos, equivalentes = [], [], [], []
+
+    for nombre, spec in INDEXES.items():
+        esperada = esperadas.get(nombre)
+        if nombre in existentes:
+            valido, tabla, definicion = existentes[nombre]
+            if not valido:
+                invalidos.append(spec)
+            elif esperada is not None and (tabla, definicion) != (spec.tabla, esperada):
+                distintos.append(spec)
+            continue
+
+        otro = next(
+            (
+                otro for otro, (valido, tabla, definicion) in existentes.items()
+                if valido and esperada is not None
+                and (tabla, definicion) == (spec.tabla, esperada)
+            ),
+            None,
+        )
+        if otro:
+            equivalentes.append((spec, otro))
+        else:
+            faltantes.append(spec)
+
+    return faltantes, invalidos, distintos, equivalentes
+
+
+def create_index(spec, recrear=False):
+    # CONCURRENTLY no puede ir dentro de una transacción: se ejecuta en
+    # autocommit, una sentencia a la vez.
+    with connection.cursor() as cursor:
+        if spec.extension:
+            cursor.execute(spec.extension_sql())
+        if recrear:
+            cursor.execute(spec.drop_sql())
+        cursor.execute(spec.create_sql())
+
+
+def unused_indexes():
+    """
+    Índices sin escaneos según pg_stat_user_indexes (excluye llaves
+    primarias y únicos, que sostienen restricciones).
+    """
+    sql = """
+        SELECT
+            s.relname AS tabla,
+            s.indexrelname AS indice,
+            s.idx_scan,
+            pg_relation_size(s.indexrelid) AS bytes
+        FROM pg_stat_user_indexes s
+        JOIN pg_index ix ON ix.indexrelid = s.indexrelid
+        WHERE s.idx_scan = 0
+          AND NOT ix.indisprimary
+          AND NOT ix.indisunique
+        ORDER BY bytes DESC;
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchall()
@@ -0,0 +1,324 @@
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+
+from core import esquema
+
+
+# ================================================================
+#                 INVENTARIO DE MEDICAMENTOS
+# ================================================================
+#
+# stock_medicamento.cantidad es el saldo vigente de cada (cod_med,
+# id_sede): leerlo es una búsqueda por la llave única. Cada cambio de
+# saldo se hace con un UPDATE atómico sobre esa fila (una salida solo
+# procede si `cantidad >= n`) y en la misma transacción se agrega un
+# movimiento a movimientos_stock, que nunca se edita. Solo se bloquea
+# la fila del medicamento en esa sede, así que las farmacias escriben
+# en paralelo. La API no escribe `cantidad` directamente: crear,
+# editar o borrar un registro de stock pasa por el libro (fijar_saldo).
+#
+# Crear una prescripción intenta descontar su medicamento en la misma
+# transacción (dispensar_prescripcion); prescripciones_dispensadas, con
+# id_presc como llave, impide dispensar dos veces y no se compacta. Si
+# no alcanza el stock, la sede no tiene registro de ese medicamento o
+# aún no existen estas tablas, la prescripción se guarda igual y queda
+# pendiente: es un acto médico, no una venta. La farmacia la dispensa
+# después con POST /prescripciones/<id>/dispensar/.
+#
+# `manage.py compactar_stock` suma los movimientos viejos en
+# stock_snapshot y los borra del libro. En todo momento:
+#     stock_medicamento.cantidad = snapshot.cantidad + SUM(movimientos.delta)
+#
+# Las tablas se crean con `manage.py crear_tablas` (core.esquema).
+
+MOTIVOS = ("entrada", "salida", "ajuste", "prescripcion")
+
+TABLAS = ("movimientos_stock", "stock_snapshot", "prescripciones_dispensadas")
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS movimientos_stock (
+        id_mov bigserial PRIMARY KEY,
+        cod_med integer NOT NULL,
+        id_sede integer NOT NULL,
+        delta integer NOT NULL,
+        saldo integer NOT NULL,
+        motivo varchar(20) NOT NULL,
+        referencia integer,
+        id_emp integer,
+        observacion text,
+        creado timestamptz NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_movimientos_med_sede
+        ON movimientos_stock (cod_med, id_sede, id_mov);
+    """,
+    # ventana de consumo de core.alertas y core.rebalanceo
+    """
+    CREATE INDEX IF NOT EXISTS idx_movimientos_prescripcion_creado
+        ON movimientos_stock (creado) WHERE motivo = 'prescripcion';
+    """,
+    # una prescripción se dispensa una sola vez
+    """
+    CREATE TABLE IF NOT EXISTS prescripciones_dispensadas (
+        id_presc integer PRIMARY KEY,
+        id_mov bigint NOT NULL,
+        creado timestamptz NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_snapshot (
+        cod_med integer NOT NULL,
+        id_sede integer NOT NULL,
+        cantidad integer NOT NULL,
+        hasta_mov bigint NOT NULL,
+        actualizado timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (cod_med, id_sede)
+    );
+    """,
+]
+
+# el saldo que ya existía antes del libro queda como snapshot inicial
+SQL_SNAPSHOT_INICIAL = """
+    INSERT INTO stock_snapshot (cod_med, id_sede, cantidad, hasta_mov)
+    SELECT cod_med, id_sede, cantidad, 0 FROM stock_medicamento
+    ON CONFLICT (cod_med, id_sede) DO NOTHING;
+"""
+
+
+
+def crear_tablas():
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('stock_snapshot') IS NULL;")
+        nueva = cursor.fetchone()[0]
+        for ddl in DDL:
+            cursor.execute(ddl)
+        if nueva:
+            cursor.execute(SQL_SNAPSHOT_INICIAL)
+
+
+class StockInsuficiente(Exception):
+    pass
+
+
+class SinStock(Exception):
+    """La sede no tiene registro de stock de ese medicamento."""
+
+
+class YaDispensada(Exception):
+    pass
+
+
+def _registrar(cursor, cod_med, id_sede, delta, saldo, motivo, referencia, id_emp, observacion):
+    cursor.execute(
+        """
+        INSERT INTO movimientos_stock
+            (cod_med, id_sede, delta, saldo, motivo, referencia, id_emp, observacion)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id_mov;
+        """,
+        [cod_med, id_sede, delta, saldo, motivo, referencia, id_emp, observacion]
+    )
+    return cursor.fetchone()[0]
+
+
+def mover(cod_med, id_sede, delta, motivo, referencia=None, id_emp=None, observacion=None):
+    """
+    Aplica `delta` al saldo de (cod_med, id_sede) y lo registra en el
+    libro. Devuelve {"id_mov", "saldo"}. Una salida (delta < 0) sin
+    saldo suficiente lanza StockInsuficiente (SinStock si la sede no
+    tiene fila de ese medicamento) y no cambia nada.
+    """
+    if motivo not in MOTIVOS:
+        raise ValueError(f"motivo debe ser uno de {', '.join(MOTIVOS)}")
+    if delta == 0:
+        raise ValueError("La cantidad no puede ser cero")
+
+    esquema.verificar(*TABLAS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if delta < 0:
+            cursor.execute(
+                """
+                UPDATE stock_medicamento
+                SET cantidad = cantidad + %s
+                WHERE cod_med = %s AND id_sede = %s AND cantidad >= %s
+                RETURNING cantidad;
+                """,
+                [delta, cod_med, id_sede, -delta]
+            )
+        else:
+            cursor.execute(
+                """
+                INSERT INTO stock_medicamento (cod_med, id_sede, cantidad)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (cod_med, id_sede)
+                DO UPDATE SET cantidad = stock_medicamento.cantidad + EXCLUDED.cantidad
+                RETURNING cantidad;
+                """,
+                [cod_med, id_sede, delta]
+            )
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(
+                "SELECT cantidad FROM stock_medicamento WHERE cod_med = %s AND id_sede = %s;",
+                [cod_med, id_sede]
+            )
+            actual = cursor.fetchone()
+            if actual is None:
+                raise SinStock(
+                    f"No hay stock registrado del medicamento {cod_med} en la sede {id_sede}"
+                )
+            raise StockInsuficiente(
+                f"Stock insuficiente del medicamento {cod_med} en la sede {id_sede}: "
+                f"hay {actual[0]}, se piden {-delta}"
+            )
+
+        saldo = row[0]
+        id_mov = _registrar(
+            cursor, cod_med, id_sede, delta, saldo, motivo, referencia, id_emp, observacion
+        )
+
+    return {"id_mov": id_mov, "saldo": saldo}
+
+
+def fijar_saldo(cod_med, id_sede, cantidad, id_emp=None, observacion=None):
+    """
+    Lleva el saldo de (cod_med, id_sede) a `cantidad` con un movimiento
+    de ajuste por la diferencia. Devuelve el resultado de mover() o None
+    si el saldo ya era ese.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT cantidad FROM stock_medicamento
+            WHERE cod_med = %s AND id_sede = %s
+            FOR UPDATE;
+            """,
+            [cod_med, id_sede]
+        )
+        row = cursor.fetchone()
+        delta = cantidad - (row[0] if row else 0)
+        if delta == 0:
+            return None
+        return mover(
+            cod_med, id_sede, delta, "ajuste", id_emp=id_emp, observacion=observacion
+        )
+
+
+def dispensar_prescripcion(id_presc, cantidad, id_sede=None, id_emp=None):
+    """
+    Descuenta `cantidad` del medicamento de la prescripción en la sede
+    indicada o, si no se indica, en la sede del paciente.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT pm.cod_med, per.id_sede
+            FROM prescripciones_medicamentos pm
+            JOIN historias_clinicas h ON pm.cod_hist = h.cod_hist
+            JOIN citas c ON h.id_cita = c.id_cita
+            JOIN pacientes pac ON c.cod_pac = pac.cod_pac
+            JOIN personas per ON pac.documento = per.documento
+            WHERE pm.id_presc = %s;
+            """,
+            [id_presc]
+        )
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+
+    cod_med, sede_paciente = row
+    id_sede = id_sede or sede_paciente
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            resultado = mover(
+                cod_med, id_sede, -cantidad, "prescripcion", referencia=id_presc, id_emp=id_emp
+            )
+            cursor.execute(
+                "INSERT INTO prescripciones_dispensadas (id_presc, id_mov) VALUES (%s, %s);",
+                [id_presc, resultado["id_mov"]]
+            )
+    except IntegrityError:
+        raise YaDispensada(f"La prescripción {id_presc} ya fue dispensada")
+    return {"cod_med": cod_med, "id_sede": id_sede, **resultado}
+
+
+def saldo(cod_med, id_sede):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT cantidad FROM stock_medicamento WHERE cod_med = %s AND id_sede = %s;",
+            [cod_med, id_sede]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# ---------------------------------------------------------------
+#   Compactación
+# ---------------------------------------------------------------
+
+SQL_COMPACTAR = """
+    WITH viejos AS (
+        DELETE FROM movimientos_stock
+        WHERE id_mov > %s AND id_mov <= %s AND creado < %s
+        RETURNING cod_med, id_sede, delta, id_mov
+    ),
+    sumados AS (
+        INSERT INTO stock_snapshot (cod_med, id_sede, cantidad, hasta_mov, actualizado)
+        SELECT cod_med, id_sede, SUM(delta), MAX(id_mov), now()
+        FROM viejos
+        GROUP BY cod_med, id_sede
+        ON CONFLICT (cod_med, id_sede) DO UPDATE SET
+            cantidad = stock_snapshot.cantidad + EXCLUDED.cantidad,
+            hasta_mov = GREATEST(stock_snapshot.hasta_mov, EXCLUDED.hasta_mov),
+            actualizado = now()
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM viejos;
+"""
+
+SQL_DESCUADRES = """
+    SELECT s.cod_med, s.id_sede, s.cantidad,
+           COALESCE(sn.cantidad, 0) + COALESCE(m.suma, 0) AS libro
+    FROM stock_medicamento s
+    LEFT JOIN stock_snapshot sn ON sn.cod_med = s.cod_med AND sn.id_sede = s.id_sede
+    LEFT JOIN (
+        SELECT cod_med, id_sede, SUM(delta) AS suma
+        FROM movimientos_stock
+        GROUP BY cod_med, id_sede
+    ) m ON m.cod_med = s.cod_med AND m.id_sede = s.id_sede
+    WHERE s.cantidad <> COALESCE(sn.cantidad, 0) + COALESCE(m.suma, 0);
+"""
+
+
+def compactar(antes_de, lote=10000):
+    """
+    Pasa a stock_snapshot los movimientos creados antes de `antes_de`,
+    en transacciones de a lo sumo `lote` ids. Devuelve cuántos compactó.
+    """
+    esquema.verificar(*TABLAS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(MIN(id_mov), 1) - 1, COALESCE(MAX(id_mov), 0) "
+            "FROM movimientos_stock WHERE creado < %s;",
+            [antes_de]
+        )
+        desde, hasta = cursor.fetchone()
+
+    total = 0
+    while desde < hasta:
+        fin = min(desde + lote, hasta)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(SQL_COMPACTAR, [desde, fin, antes_de])
+            total += cursor.fetchone()[0]
+        desde = fin
+    return total
+
+
+def descuadres():
+    esquema.verificar(*TABLAS)
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_DESCUADRES)
+        return cursor.fetchall()
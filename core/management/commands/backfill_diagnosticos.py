@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import esquema
+from core.diagnosticos import catalogo_diagnosticos
+
+
+class Command(BaseCommand):
+    help = (
+        "Asigna el código de diagnóstico normalizado (core.diagnosticos) a "
+        "las historias clínicas que no lo tienen, por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=5000)
+        parser.add_argument(
+            "--todas",
+            action="store_true",
+            help="Recalcula también las historias ya asignadas (tras cambiar sinónimos).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            esquema.verificar("diagnosticos_catalogo", "historias_diagnostico")
+        except esquema.TablasFaltantes as e:
+            raise CommandError(e.detail)
+        lote = options["lote"]
+        pendiente = "" if options["todas"] else "AND hd.cod_hist IS NULL"
+
+        sql = f"""
+            SELECT h.cod_hist, h.diagnostico
+            FROM historias_clinicas h
+            LEFT JOIN historias_diagnostico hd ON hd.cod_hist = h.cod_hist
+            WHERE h.cod_hist > %s {pendiente}
+            ORDER BY h.cod_hist
+            LIMIT %s;
+        """
+
+        ultimo, total = 0, 0
+        while True:
+            # cada lote en su propia transacción: si se interrumpe, se
+            # retoma por las historias que siguen sin código
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [ultimo, lote])
+                    filas = cursor.fetchall()
+                if not filas:
+                    break
+                total += catalogo_diagnosticos.asignar(filas)
+            ultimo = filas[-1][0]
+            self.stdout.write(f"  {total} historias (hasta cod_hist {ultimo})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} historias asignadas. Ejecute `rebuild_rollups` para actualizar el reporte."
+        ))
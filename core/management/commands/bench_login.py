@@ -0,0 +1,57 @@
+import asyncio
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+
+from core.passwords import hasher
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga del login asíncrono (/api/login/async/): "
+        "logins por segundo y por núcleo con N clientes concurrentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documento", required=True)
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--concurrencia", type=int, default=50)
+
+    def handle(self, *args, **options):
+        resultado = asyncio.run(self._correr(options))
+        ok, ocupado, fallidos, segundos = resultado
+
+        if fallidos:
+            raise CommandError(f"{fallidos} logins fallaron (¿credenciales correctas?)")
+
+        por_segundo = ok / segundos
+        nucleos = min(hasher.workers, os.cpu_count() or 1)
+        self.stdout.write(f"logins ok:         {ok}")
+        self.stdout.write(f"rechazados (503):  {ocupado}")
+        self.stdout.write(f"tiempo:            {segundos:.2f} s")
+        self.stdout.write(f"logins/s:          {por_segundo:.1f}")
+        self.stdout.write(f"logins/s/núcleo:   {por_segundo / nucleos:.1f} ({nucleos} hilos bcrypt)")
+
+    async def _correr(self, options):
+        client = AsyncClient()
+        body = {"documento": options["documento"], "password": options["password"]}
+        restantes = options["logins"]
+        conteo = {200: 0, 503: 0, "otros": 0}
+
+        async def trabajador():
+            nonlocal restantes
+            while restantes > 0:
+                restantes -= 1
+                response = await client.post(
+                    "/api/login/async/", body, content_type="application/json"
+                )
+                clave = response.status_code if response.status_code in conteo else "otros"
+                conteo[clave] += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(options["concurrencia"])))
+        segundos = time.perf_counter() - inicio
+        return conteo[200], conteo[503], conteo["otros"], segundos
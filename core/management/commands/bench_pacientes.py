@@ -0,0 +1,122 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.core.wsgi import get_wsgi_application
+
+
+# Cada modo se corre en un proceso aparte porque la configuración de
+# conexiones se lee de variables de entorno al cargar settings.
+#
+# Las peticiones van por HTTP a un servidor WSGI real de un solo hilo
+# (como un worker sync de gunicorn): así se emiten request_started /
+# request_finished y Django cierra o devuelve la conexión al pool según
+# el modo. django.test.Client desconecta close_old_connections y los
+# tres modos terminarían usando la misma conexión.
+MODOS = {
+    "sin_pool": {"DB_POOL": "0", "DB_CONN_MAX_AGE": "0"},
+    "persistente": {"DB_POOL": "0", "DB_CONN_MAX_AGE": "60"},
+    "pool": {"DB_POOL": "1"},
+}
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    k = (len(valores) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(valores) - 1)
+    return valores[i] + (valores[j] - valores[i]) * (k - i)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia p50/p99 de GET /api/pacientes/ sin pool, con "
+        "conexiones persistentes y con el pool de psycopg."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument("--url", default="/api/pacientes/")
+        parser.add_argument(
+            "--modos", default=",".join(MODOS),
+            help=f"Lista separada por comas: {', '.join(MODOS)}",
+        )
+        parser.add_argument("--interno", action="store_true", help="Uso interno.")
+
+    def handle(self, *args, **options):
+        if options["interno"]:
+            return self._medir(options)
+
+        resultados = []
+        for modo in options["modos"].split(","):
+            if modo not in MODOS:
+                raise CommandError(f"Modo desconocido: {modo}")
+
+            env = {**os.environ, **MODOS[modo]}
+            cmd = [
+                sys.executable, str(settings.BASE_DIR / "manage.py"), "bench_pacientes",
+                "--interno",
+                "--requests", str(options["requests"]),
+                "--warmup", str(options["warmup"]),
+                "--url", options["url"],
+            ]
+            salida = subprocess.run(cmd, env=env, capture_output=True, text=True)
+            if salida.returncode != 0:
+                raise CommandError(salida.stderr)
+            resultados.append((modo, json.loads(salida.stdout.strip().splitlines()[-1])))
+
+        self.stdout.write(f"{'modo':<12} {'p50 ms':>9} {'p99 ms':>9} {'media ms':>9}")
+        for modo, r in resultados:
+            self.stdout.write(
+                f"{modo:<12} {r['p50']:>9.2f} {r['p99']:>9.2f} {r['media']:>9.2f}"
+            )
+
+    def _medir(self, options):
+        servidor = WSGIServer(("127.0.0.1", 0), _HandlerSilencioso)
+        servidor.set_app(get_wsgi_application())
+        hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+        hilo.start()
+
+        url = f"http://127.0.0.1:{servidor.server_port}{options['url']}"
+        try:
+            for _ in range(options["warmup"]):
+                _get(url)
+
+            tiempos = []
+            for _ in range(options["requests"]):
+                inicio = time.perf_counter()
+                _get(url)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+
+        self.stdout.write(json.dumps({
+            "p50": _percentil(tiempos, 50),
+            "p99": _percentil(tiempos, 99),
+            "media": statistics.mean(tiempos),
+        }))
+
+
+class _HandlerSilencioso(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        raise CommandError(f"{url} respondió {e.code}")
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from core.agenda import CitaOcupada, duracion_cita, jornada, reservar
+from core.models import Citas, Empleados, Pacientes, TiposServicio
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de contención de reservas: N hilos intentan agendar citas "
+        "en los mismos horarios de pocos médicos. Reporta reservas/s, "
+        "latencia y verifica que no quedaron citas cruzadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reservadores", type=int, default=32)
+        parser.add_argument("--intentos", type=int, default=50, help="Intentos por hilo.")
+        parser.add_argument("--medicos", type=int, default=4)
+        parser.add_argument("--dias", type=int, default=60, help="Día de la prueba: hoy + N.")
+        parser.add_argument(
+            "--conservar", action="store_true", help="No borrar las citas creadas."
+        )
+
+    def handle(self, *args, **options):
+        medicos = list(
+            Empleados.objects.order_by("id_emp").values_list("id_emp", flat=True)[:options["medicos"]]
+        )
+        paciente = Pacientes.objects.order_by("cod_pac").first()
+        servicio = TiposServicio.objects.order_by("cod_servicio").first()
+        if not medicos or paciente is None or servicio is None:
+            raise CommandError("Se necesitan empleados, un paciente y un tipo de servicio.")
+
+        dia = timezone.localdate() + timedelta(days=options["dias"])
+        hora_inicio, hora_fin = jornada()
+        paso = duracion_cita()
+        slots = []
+        inicio = timezone.make_aware(datetime.combine(dia, hora_inicio))
+        while inicio + paso <= timezone.make_aware(datetime.combine(dia, hora_fin)):
+            slots.append(inicio)
+            inicio += paso
+
+        conteo = {"ok": 0, "ocupado": 0}
+        latencias = []
+        creadas = []
+        lock = threading.Lock()
+
+        def reservador():
+            try:
+                for _ in range(options["intentos"]):
+                    id_emp = random.choice(medicos)
+                    # la mitad de las veces se corre el inicio para forzar cruces parciales
+                    fecha_hora = random.choice(slots) + paso / 2 * random.randint(0, 1)
+                    t0 = time.perf_counter()
+                    try:
+                        with reservar(id_emp, fecha_hora):
+                            cita = Citas.objects.create(
+                                cod_pac=paciente, id_emp_id=id_emp, cod_servicio=servicio,
+                                fecha_hora=fecha_hora, estado="Programada",
+                            )
+                        resultado = "ok"
+                    except CitaOcupada:
+                        cita, resultado = None, "ocupado"
+                    ms = (time.perf_counter() - t0) * 1000
+                    with lock:
+                        conteo[resultado] += 1
+                        latencias.append(ms)
+                        if cita is not None:
+                            creadas.append(cita.pk)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservador) for _ in range(options["reservadores"])]
+        inicio_prueba = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - inicio_prueba
+
+        cruces = self._cruces(creadas)
+        if not options["conservar"]:
+            Citas.objects.filter(pk__in=creadas).delete()
+        connections.close_all()
+
+        latencias.sort()
+        total = len(latencias)
+        self.stdout.write(f"médicos / horarios: {len(medicos)} / {len(slots)} ({dia})")
+        self.stdout.write(f"intentos:           {total} ({options['reservadores']} hilos)")
+        self.stdout.write(f"reservadas:         {conteo['ok']}")
+        self.stdout.write(f"ocupadas (409):     {conteo['ocupado']}")
+        self.stdout.write(f"intentos/s:         {total / segundos:.1f}")
+        self.stdout.write(f"p50:                {latencias[total // 2]:.2f} ms")
+        self.stdout.write(f"p99:                {latencias[min(total - 1, int(total * 0.99))]:.2f} ms")
+
+        if cruces:
+            raise CommandError(f"{cruces} pares de citas cruzadas")
+        self.stdout.write(self.style.SUCCESS("Sin citas cruzadas."))
+
+    def _cruces(self, ids):
+        if not ids:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(*)
+                FROM citas a
+                JOIN citas b
+                  ON a.id_emp = b.id_emp
+                 AND a.id_cita < b.id_cita
+                 AND b.fecha_hora > a.fecha_hora - %s
+                 AND b.fecha_hora < a.fecha_hora + %s
+                WHERE a.id_cita = ANY(%s) AND b.id_cita = ANY(%s);
+                """,
+                [duracion_cita(), duracion_cita(), ids, ids]
+            )
+            return cursor.fetchone()[0]
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import esquema
+from core.alertas import calcular_alertas, horizonte_dias
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula alertas_stock: consumo diario por medicamento y sede "
+        "a partir de las unidades dispensadas recientemente (libro de stock) "
+        "y días de stock restantes."
+    )
+
+    def handle(self, *args, **options):
+        try:
+            en_riesgo = calcular_alertas()
+        except esquema.TablasFaltantes as e:
+            raise CommandError(e.detail)
+        self.stdout.write(self.style.SUCCESS(
+            f"Alertas actualizadas: {en_riesgo} pares se agotan en {horizonte_dias()} días o menos."
+        ))
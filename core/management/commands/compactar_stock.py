@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import esquema
+from core.inventario import TABLAS, compactar, descuadres
+
+
+class Command(BaseCommand):
+    help = (
+        "Compacta el libro de movimientos de stock: suma en stock_snapshot "
+        "los movimientos más viejos que --dias y los borra. Luego verifica "
+        "que saldo = snapshot + movimientos para cada medicamento y sede."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=90)
+        parser.add_argument("--lote", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        try:
+            esquema.verificar(*TABLAS)
+        except esquema.TablasFaltantes as e:
+            raise CommandError(e.detail)
+        antes_de = timezone.now() - timedelta(days=options["dias"])
+        total = compactar(antes_de, lote=options["lote"])
+        self.stdout.write(f"{total} movimientos compactados (anteriores a {antes_de:%Y-%m-%d}).")
+
+        filas = descuadres()
+        if filas:
+            for cod_med, id_sede, cantidad, libro in filas:
+                self.stdout.write(self.style.WARNING(
+                    f"  cod_med={cod_med} id_sede={id_sede}: saldo {cantidad}, libro {libro}"
+                ))
+            raise CommandError(f"{len(filas)} saldos no cuadran con el libro")
+
+        self.stdout.write(self.style.SUCCESS("Saldos y libro cuadran."))
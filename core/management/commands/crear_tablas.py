@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.esquema import crear_tablas
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea las tablas auxiliares que no administra Django (rollups, "
+        "diagnósticos, ...) y hace el primer cálculo de los rollups. Se "
+        "ejecuta en cada despliegue."
+    )
+
+    def handle(self, *args, **options):
+        for modulo in crear_tablas():
+            self.stdout.write(f"  {modulo}")
+        self.stdout.write(self.style.SUCCESS("Tablas auxiliares listas."))
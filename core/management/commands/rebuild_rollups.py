@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.esquema import TablasFaltantes
+from core.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Reconstruye las tablas de resumen (rollups) de los reportes del dashboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Recalcula solo los periodos con historias/citas nuevas (para cron).",
+        )
+
+    def handle(self, *args, **options):
+        incremental = options["incremental"]
+        try:
+            refresh_rollups(completo=not incremental)
+        except TablasFaltantes as e:
+            raise CommandError(e.detail)
+        modo = "incremental" if incremental else "completo"
+        self.stdout.write(self.style.SUCCESS(f"Rollups actualizados ({modo})."))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from core.indexes import INDEXES, create_index, diff_indexes, unused_indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los índices declarados en core.indexes con pg_indexes, "
+        "crea los faltantes (CONCURRENTLY) y reporta índices sin uso."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo muestra el DDL que se ejecutaría.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        faltantes, invalidos, distintos, equivalentes = diff_indexes()
+
+        self.stdout.write(
+            f"{len(INDEXES)} índices declarados, {len(faltantes)} faltantes, "
+            f"{len(invalidos)} inválidos, {len(distintos)} con otra definición."
+        )
+
+        for spec, otro in equivalentes:
+            self.stdout.write(f"  {spec.nombre}: ya cubierto por {otro}")
+
+        recrear = [("inválido", spec) for spec in invalidos] + [
+            ("con otra definición", spec) for spec in distintos
+        ]
+        for motivo, spec in recrear:
+            self.stdout.write(self.style.WARNING(f"Recreando índice {motivo} {spec.nombre}"))
+            self.stdout.write(f"  {spec.drop_sql()}")
+            self.stdout.write(f"  {spec.create_sql()}")
+            if not dry_run:
+                create_index(spec, recrear=True)
+
+        for spec in faltantes:
+            if spec.extension:
+                self.stdout.write(f"  {spec.extension_sql()}")
+            self.stdout.write(f"  {spec.create_sql()}")
+            if not dry_run:
+                create_index(spec)
+
+        sin_uso = unused_indexes()
+        if sin_uso:
+            self.stdout.write("")
+            self.stdout.write(self.style.WARNING("Índices sin escaneos (pg_stat_user_indexes):"))
+            for tabla, indice, _, bytes_ in sin_uso:
+                self.stdout.write(f"  {tabla}.{indice} ({bytes_ // 1024} KiB)")
+
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS("Índices sincronizados."))
@@ -1,27 +1,129 @@
-import jwt
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 from core.models import Empleados
+from core.tokens import decodificar, adecodificar
+
+
+class PrincipalCache:
+    """
+    Caché LRU con TTL de empleados ya resueltos, indexada por id_emp.
+    Vive en el proceso; cada worker tiene la suya.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, id_emp):
+        with self._lock:
+            item = self._data.get(id_emp)
+            if item is None:
+                return None
+            expira, empleado = item
+            if expira < time.monotonic():
+                del self._data[id_emp]
+                return None
+            self._data.move_to_end(id_emp)
+            return empleado
+
+    def set(self, id_emp, empleado):
+        with self._lock:
+            self._data[id_emp] = (time.monotonic() + self.ttl, empleado)
+            self._data.move_to_end(id_emp)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, id_emp):
+        with self._lock:
+            self._data.pop(id_emp, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+principal_cache = PrincipalCache(
+    maxsize=getattr(settings, "EMPLEADO_CACHE_MAXSIZE", 1024),
+    ttl=getattr(settings, "EMPLEADO_CACHE_TTL", 300),
+)
+
+
+def invalidate_empleado(id_emp):
+    principal_cache.invalidate(int(id_emp))
+
+
+def get_empleado(emp_id):
+    empleado = principal_cache.get(emp_id)
+    if empleado is not None:
+        return empleado
+    try:
+        empleado = Empleados.objects.select_related("rol").get(id_emp=emp_id)
+    except Empleados.DoesNotExist:
+        return None
+    principal_cache.set(emp_id, empleado)
+    return empleado
 
 
 class EmpleadoAuthMiddleware:
+    # Sirve tanto con WSGI como con ASGI: bajo ASGI la cadena queda async
+    # y las vistas async (login_async) no pasan por un hilo por petición.
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        
+        if self.async_mode:
+            return self.__acall__(request)
+
         token = request.headers.get("Authorization")
+        payload = None
 
         if token:
             try:
-                token = token.replace("Bearer ", "")
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                emp_id = payload.get("id_emp")
-                empleado = Empleados.objects.select_related("rol").get(id_emp=emp_id)
-                request.empleado = empleado
+                # valida firma, expiración y revocación sin ir a la base
+                payload = decodificar(token.replace("Bearer ", ""))
             except Exception:
-                request.empleado = None
-        else:
-            request.empleado = None
+                payload = None
 
+        self._asignar(request, payload)
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        token = request.headers.get("Authorization")
+        payload = None
+
+        if token:
+            try:
+                payload = await adecodificar(token.replace("Bearer ", ""))
+            except Exception:
+                payload = None
+
+        self._asignar(request, payload)
+        return await self.get_response(request)
+
+    def _asignar(self, request, payload):
+        try:
+            emp_id = int(payload.get("id_emp"))
+        except (AttributeError, TypeError, ValueError):
+            request.empleado = None
+            request.rol_id = None
+            request.token_payload = None
+            return
+
+        # el empleado solo se consulta si la vista lo usa (en una vista
+        # async, con sync_to_async)
+        request.empleado = SimpleLazyObject(lambda: get_empleado(emp_id))
+        request.rol_id = payload.get("rol_id")
+        request.token_payload = payload
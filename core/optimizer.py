@@ -0,0 +1,96 @@
+from functools import lru_cache
+
+from rest_framework import serializers
+
+
+# ================================================================
+#          OPTIMIZADOR DE QUERYSETS PARA SERIALIZERS ANIDADOS
+# ================================================================
+#
+# Recorre los campos de un serializer y arma las rutas de
+# select_related (FK / one-to-one anidados) y prefetch_related
+# (relaciones many=True) para que serializar un listado no dispare
+# consultas por cada fila.
+
+
+def _model_field(model, nombre):
+    try:
+        return model._meta.get_field(nombre)
+    except Exception:
+        return None
+
+
+def _walk(serializer, model, prefix, en_prefetch, select, prefetch):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*":
+            continue
+
+        many = isinstance(field, serializers.ListSerializer)
+        nested = field.child if many else field
+        if not isinstance(nested, serializers.ModelSerializer):
+            continue
+
+        # solo fuentes que sigan relaciones del modelo
+        actual = model
+        partes = []
+        a_muchos = many
+        for parte in field.source.split("."):
+            rel = _model_field(actual, parte)
+            if rel is None or not rel.is_relation:
+                partes = None
+                break
+            partes.append(parte)
+            a_muchos = a_muchos or rel.many_to_many or rel.one_to_many
+            actual = rel.related_model
+        if not partes:
+            continue
+
+        ruta = prefix + "__".join(partes)
+
+        if en_prefetch or a_muchos:
+            prefetch.add(ruta)
+            _walk(nested, actual, ruta + "__", True, select, prefetch)
+        else:
+            select.add(ruta)
+            _walk(nested, actual, ruta + "__", False, select, prefetch)
+
+
+@lru_cache(maxsize=None)
+def related_paths(serializer_class):
+    """
+    Devuelve (select_related, prefetch_related) para un serializer.
+    El resultado se calcula una sola vez por clase.
+    """
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    select, prefetch = set(), set()
+    _walk(serializer, model, "", False, select, prefetch)
+
+    # select_related con la ruta más larga ya incluye a las intermedias
+    select = {
+        ruta for ruta in select
+        if not any(otra.startswith(ruta + "__") for otra in select)
+    }
+    prefetch = {
+        ruta for ruta in prefetch
+        if not any(otra.startswith(ruta + "__") for otra in prefetch)
+    }
+    return tuple(sorted(select)), tuple(sorted(prefetch))
+
+
+def optimize_queryset(queryset, serializer_class):
+    select, prefetch = related_paths(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class OptimizedQuerysetMixin:
+    """
+    Aplica optimize_queryset() al queryset de un ModelViewSet.
+    """
+
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.get_serializer_class())
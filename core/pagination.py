@@ -0,0 +1,192 @@
+import base64
+import binascii
+import re
+from datetime import datetime
+
+from django.conf import settings
+from rest_framework.response import Response
+
+
+# ================================================================
+#               PAGINACIÓN POR CURSOR (KEYSET)
+# ================================================================
+#
+# Las vistas de listado usan SQL crudo ordenado por la llave primaria.
+# En lugar de OFFSET (que obliga a recorrer todas las filas anteriores)
+# se filtra con "pk > ultimo_visto", así Postgres recorre el índice de
+# la llave primaria y cada página cuesta lo mismo sin importar su
+# posición en la tabla.
+#
+# Sin ?limit= cada página trae DEFAULT_LIMIT filas y nunca más de
+# MAX_LIMIT. Para clientes viejos que esperan la tabla completa,
+# settings.PAGINACION_OPCIONAL = True vuelve a devolver todas las filas
+# salvo que lleguen ?after= o ?limit=.
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+_ENTERO = re.compile(r"^[0-9]+$")
+
+
+def encode_cursor(valor):
+    raw = f"v1:{valor}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_valor(cursor):
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(cursor + padding).decode()
+        version, valor = raw.split(":", 1)
+        if version != "v1":
+            raise ValueError
+        return valor
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Cursor 'after' inválido")
+
+
+def decode_cursor(cursor):
+    """
+    Devuelve la llave primaria codificada en el cursor.
+    Acepta también el valor entero plano (?after=123).
+    """
+    if cursor is None or cursor == "":
+        return None
+
+    if _ENTERO.match(cursor):
+        return int(cursor)
+
+    try:
+        return int(_decode_valor(cursor))
+    except ValueError:
+        raise ValueError("Cursor 'after' inválido")
+
+
+class KeysetPagination:
+    """
+    Paginación por cursor compartida por las vistas de SQL crudo.
+
+    Uso:
+        paginador = KeysetPagination(request, "p.cod_pac")
+        where, params = paginador.where()
+        limit, limit_params = paginador.limit()
+        ...
+        rows = paginador.paginate(cursor.fetchall())
+        return paginador.get_response(data)
+
+    La llave primaria debe ser la primera columna del SELECT.
+
+    Con siempre=True la vista pagina aunque PAGINACION_OPCIONAL esté
+    activo (listados nuevos que nunca devolvieron la tabla completa).
+    """
+
+    def __init__(self, request, columna, siempre=False):
+        self.request = request
+        self.columna = columna
+        params = request.query_params
+        self.activa = (
+            siempre
+            or not getattr(settings, "PAGINACION_OPCIONAL", False)
+            or any(params.get(p) for p in ("after", "limit"))
+        )
+        self.after = self.decode(params.get("after"))
+        self.page_size = self._parse_limit(params.get("limit"))
+        self.next_key = None
+
+    def _parse_limit(self, valor):
+        if valor is None or valor == "":
+            return DEFAULT_LIMIT
+        try:
+            limit = int(valor)
+        except ValueError:
+            raise ValueError("El parámetro 'limit' debe ser un entero")
+        if limit < 1:
+            raise ValueError("El parámetro 'limit' debe ser mayor que 0")
+        return min(limit, MAX_LIMIT)
+
+    def decode(self, cursor):
+        return decode_cursor(cursor)
+
+    def where(self, prefijo="WHERE"):
+        if self.after is None:
+            return "", []
+        return f"{prefijo} {self.columna} > %s", [self.after]
+
+    def limit(self):
+        if not self.activa:
+            return "", []
+        # se pide una fila extra para saber si hay página siguiente
+        return "LIMIT %s", [self.page_size + 1]
+
+    def paginate(self, rows):
+        if self.activa and len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_key = rows[-1][0]
+        return rows
+
+    def next_cursor(self):
+        if self.next_key is None:
+            return None
+        return encode_cursor(self.encode(self.next_key))
+
+    def encode(self, key):
+        return key
+
+    def next_link(self):
+        cursor = self.next_cursor()
+        if cursor is None:
+            return None
+        params = self.request.query_params.copy()
+        params["after"] = cursor
+        params["limit"] = self.page_size
+        return self.request.build_absolute_uri(
+            f"{self.request.path}?{params.urlencode()}"
+        )
+
+    def get_response(self, data):
+        # Se conserva la lista como cuerpo para no romper a los clientes
+        # actuales; el cursor de la siguiente página va en cabeceras.
+        response = Response(data)
+        cursor = self.next_cursor()
+        if cursor is not None:
+            response["X-Next-Cursor"] = cursor
+            response["Link"] = f'<{self.next_link()}>; rel="next"'
+        return response
+
+
+class TimeKeysetPagination(KeysetPagination):
+    """
+    Variante que recorre hacia atrás en el tiempo:
+    ORDER BY columna_fecha DESC, columna DESC. El cursor lleva la pareja
+    (fecha, llave primaria) de la última fila, que deben ser las dos
+    primeras columnas del SELECT en ese orden: (pk, fecha, ...).
+    """
+
+    def __init__(self, request, columna, columna_fecha):
+        self.columna_fecha = columna_fecha
+        super().__init__(request, columna, siempre=True)
+
+    def decode(self, cursor):
+        if cursor is None or cursor == "":
+            return None
+        try:
+            fecha, pk = _decode_valor(cursor).rsplit("|", 1)
+            return datetime.fromisoformat(fecha), int(pk)
+        except ValueError:
+            raise ValueError("Cursor 'after' inválido")
+
+    def encode(self, key):
+        pk, fecha = key
+        return f"{fecha.isoformat()}|{pk}"
+
+    def where(self, prefijo="WHERE"):
+        if self.after is None:
+            return "", []
+        fecha, pk = self.after
+        return f"{prefijo} ({self.columna_fecha}, {self.columna}) < (%s, %s)", [fecha, pk]
+
+    def paginate(self, rows):
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_key = (rows[-1][0], rows[-1][1])
+        return rows
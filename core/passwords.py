@@ -0,0 +1,134 @@
+import asyncio
+import hmac
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from django.conf import settings
+
+
+# ================================================================
+#                 VERIFICACIÓN DE CONTRASEÑAS
+# ================================================================
+#
+# Todo intento de login paga exactamente un bcrypt con el costo
+# configurado (BCRYPT_ROUNDS), exista o no el documento y sea el hash
+# bcrypt o texto plano heredado; así la latencia no revela si la cuenta
+# existe. Tras un login correcto, los hashes en texto plano o con costo
+# menor al configurado se reemplazan por uno nuevo.
+
+BCRYPT_PREFIXES = ("$2b$", "$2a$", "$2y$")
+
+# $2b$<costo 04-31>$<22 de sal + 31 de hash en el alfabeto de bcrypt>
+BCRYPT_RE = re.compile(r"\$2[aby]\$(0[4-9]|[12][0-9]|3[01])\$[./A-Za-z0-9]{53}")
+
+_dummy_hash = None
+
+
+def bcrypt_rounds():
+    return getattr(settings, "BCRYPT_ROUNDS", 12)
+
+
+def hash_password(password, rounds=None):
+    rounds = rounds or bcrypt_rounds()
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def dummy_hash():
+    # se calcula una vez por proceso con el costo vigente
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password("dummy-password-no-valida").encode()
+    return _dummy_hash
+
+
+def es_bcrypt(hash_contra):
+    return isinstance(hash_contra, str) and hash_contra.startswith(BCRYPT_PREFIXES)
+
+
+def bcrypt_bien_formado(hash_contra):
+    return isinstance(hash_contra, str) and BCRYPT_RE.fullmatch(hash_contra) is not None
+
+
+def costo_bcrypt(hash_contra):
+    try:
+        return int(hash_contra.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def necesita_rehash(hash_contra):
+    return not es_bcrypt(hash_contra) or costo_bcrypt(hash_contra) < bcrypt_rounds()
+
+
+def verificar_login(password, hash_contra):
+    """
+    Verifica la contraseña; hash_contra=None significa documento
+    inexistente. Devuelve (valido, nuevo_hash) donde nuevo_hash es el
+    hash bcrypt con el que se debe reemplazar el guardado, o None.
+    """
+    if es_bcrypt(hash_contra):
+        try:
+            valido = bcrypt.checkpw(password.encode(), hash_contra.encode())
+        except ValueError:
+            valido = False
+    else:
+        # documento inexistente o hash heredado en texto plano: se gasta
+        # el mismo bcrypt contra el hash ficticio para igualar el tiempo
+        bcrypt.checkpw(password.encode(), dummy_hash())
+        valido = hash_contra is not None and hmac.compare_digest(
+            password.encode(), str(hash_contra).encode()
+        )
+
+    if valido and necesita_rehash(hash_contra):
+        return True, hash_password(password)
+    return valido, None
+
+
+class HasherSaturado(Exception):
+    """Hay demasiadas verificaciones en curso y en cola."""
+
+
+class BoundedHasher:
+    """
+    Pool de hilos acotado para bcrypt (libera el GIL mientras calcula).
+
+    Como máximo `workers` verificaciones corren a la vez y `max_queue`
+    esperan turno; por encima de eso se rechaza de inmediato para que
+    el cliente reintente, en vez de acumular requests colgados.
+    """
+
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pendientes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pendientes(self):
+        return self._pendientes
+
+    def _liberar(self, _future):
+        with self._lock:
+            self._pendientes -= 1
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._pendientes >= self.workers + self.max_queue:
+                raise HasherSaturado()
+            self._pendientes += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._liberar)
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+hasher = BoundedHasher(
+    workers=getattr(settings, "BCRYPT_WORKERS", None) or os.cpu_count() or 1,
+    max_queue=getattr(settings, "BCRYPT_MAX_QUEUE", 64),
+)
@@ -27,31 +27,100 @@ ROLE_PERMISSIONS = {
 }
 
 
-class RolePermission(BasePermission):
+METODOS = ("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS")
+
+
+class PermissionMatrix:
     """
-    Valida si el usuario (empleado) puede acceder a la vista según su rol.
+    ROLE_PERMISSIONS compilado a un frozenset de (rol_id, método, recurso).
+    Los comodines ("allow_all" y "GET": ["*"]) se expanden sobre todos los
+    recursos conocidos, así que una verificación es una sola búsqueda; para
+    las vistas sueltas (p. ej. "empleados") se guardan además como
+    (rol_id, método) en `comodines`.
     """
 
-    def has_permission(self, request, view):
-        empleado = getattr(request, "empleado", None)
-        if not empleado:
-            return False
+    def __init__(self, roles, recursos):
+        # roles: [(rol_id, nombre)], recursos: basenames registrados
+        recursos = tuple(recursos) + (None,)   # None: vistas sin basename
+        permitidos = set()
+        comodines = set()
+        self.roles = {}
+
+        for rol_id, nombre in roles:
+            self.roles[rol_id] = nombre
+            permisos = ROLE_PERMISSIONS.get(nombre.lower(), {})
 
-        rol = empleado.rol.nombre.lower()
+            if permisos.get("allow_all", False):
+                permitidos.update(
+                    (rol_id, metodo, recurso)
+                    for metodo in METODOS for recurso in recursos
+                )
+                comodines.update((rol_id, metodo) for metodo in METODOS)
+                continue
 
-        # Administrador tiene full access
-        if ROLE_PERMISSIONS.get(rol, {}).get("allow_all", False):
-            return True
+            for metodo, lista in permisos.items():
+                if metodo == "GET" and "*" in lista:
+                    permitidos.update((rol_id, "GET", recurso) for recurso in recursos)
+                    comodines.add((rol_id, "GET"))
+                else:
+                    permitidos.update((rol_id, metodo, recurso) for recurso in lista)
 
-        metodo = request.method
-        recurso = view.basename  # ej: "citas", "pacientes", etc.
+        self.permitidos = frozenset(permitidos)
+        self.comodines = frozenset(comodines)
 
-        permisos = ROLE_PERMISSIONS.get(rol, {})
+    def permite(self, rol_id, metodo, recurso):
+        return (
+            (rol_id, metodo, recurso) in self.permitidos
+            or (rol_id, metodo) in self.comodines
+        )
 
-        # Si el rol solo puede leer
-        if metodo == "GET" and "*" in permisos.get("GET", []):
-            return True
+    def tabla(self):
+        """Filas (rol_id, rol, método, recurso) ordenadas, para auditoría."""
+        return sorted(
+            (
+                (rol_id, self.roles[rol_id], metodo, recurso)
+                for rol_id, metodo, recurso in self.permitidos
+                if recurso is not None
+            ),
+            key=lambda fila: (fila[0], METODOS.index(fila[2]), fila[3]),
+        )
+
+
+_matriz = None
+
+
+def get_matrix():
+    """
+    Compila la matriz la primera vez y de nuevo solo si cambia el
+    catálogo de roles (versión de core.catalogos).
+    """
+    global _matriz
+    from core.catalogos import catalog_cache
+    from core.models import Roles
+    from core.urls import router
+
+    version = catalog_cache.version(Roles)
+    if _matriz is None or _matriz[0] != version:
+        roles = [(rol.rol_id, rol.nombre) for rol in catalog_cache.all(Roles)]
+        recursos = [basename for _, _, basename in router.registry]
+        _matriz = (version, PermissionMatrix(roles, recursos))
+    return _matriz[1]
+
+
+class RolePermission(BasePermission):
+    """
+    Valida si el usuario (empleado) puede acceder a la vista según su rol.
+    El rol_id viene en el JWT; solo tokens antiguos sin rol_id cargan el
+    empleado desde la base.
+    """
+
+    def has_permission(self, request, view):
+        rol_id = getattr(request, "rol_id", None)
+        if rol_id is None:
+            empleado = getattr(request, "empleado", None)
+            if not empleado:
+                return False
+            rol_id = empleado.rol_id
 
-        # Si el rol tiene permisos explícitos
-        lista = permisos.get(metodo, [])
-        return recurso in lista
+        recurso = getattr(view, "basename", None)  # ej: "citas", "pacientes", etc.
+        return get_matrix().permite(rol_id, request.method, recurso)
@@ -0,0 +1,162 @@
+import time
+
+import numpy as np
+from django.db import connection
+from django.utils import timezone
+
+from core import esquema
+from core.alertas import (
+    consumo_diario, horizonte_dias, rango_consumo, vida_media_dias, ventana_dias
+)
+
+
+# ================================================================
+#            REBALANCEO DE STOCK ENTRE SEDES DE UNA REGIÓN
+# ================================================================
+#
+# Para cada medicamento y sede de la región se calcula la necesidad
+# para `cobertura` días (consumo diario de core.alertas) y de ahí el
+# sobrante o el faltante. Las transferencias resuelven el problema de
+# transporte de costo mínimo con dos costos: entre sedes de la misma
+# ciudad y entre ciudades distintas. Con esa estructura el óptimo es
+# cubrir primero todo lo posible dentro de cada ciudad y repartir el
+# resto entre ciudades, y ambos pasos se calculan para todos los
+# medicamentos a la vez con sumas acumuladas (regla de la esquina
+# noroeste) sobre matrices medicamentos x sedes.
+
+COSTO_MISMA_CIUDAD = 1
+COSTO_OTRA_CIUDAD = 3
+
+SQL_SEDES = """
+    SELECT id_sede, nom_sede, ciudad
+    FROM sedes_hospitalarias
+    WHERE region_id = %s
+    ORDER BY ciudad, id_sede;
+"""
+
+SQL_STOCK = """
+    SELECT s.cod_med, s.id_sede, s.cantidad
+    FROM stock_medicamento s
+    JOIN sedes_hospitalarias sh ON sh.id_sede = s.id_sede
+    WHERE sh.region_id = %s;
+"""
+
+# unidades dispensadas por día, igual que core.alertas.SQL_CONSUMO
+SQL_CONSUMO = """
+    SELECT m.cod_med, m.id_sede, (m.creado AT TIME ZONE %s)::date, SUM(-m.delta)
+    FROM movimientos_stock m
+    JOIN sedes_hospitalarias sh ON sh.id_sede = m.id_sede
+    WHERE sh.region_id = %s
+      AND m.motivo = 'prescripcion' AND m.creado >= %s AND m.creado < %s
+    GROUP BY 1, 2, 3;
+"""
+
+
+def _acumulado_por_grupo(matriz, grupos):
+    """
+    Suma acumulada por filas que vuelve a cero al empezar cada grupo de
+    columnas (las columnas de un grupo son contiguas).
+    Devuelve (acumulado hasta la columna, acumulado antes de la columna).
+    """
+    hasta = np.cumsum(matriz, axis=1)
+    inicios = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+    base = np.zeros_like(hasta)
+    base[:, inicios[1:]] = hasta[:, inicios[1:] - 1]
+    base = np.maximum.accumulate(base, axis=1)
+    hasta = hasta - base
+    return hasta, hasta - matriz
+
+
+def asignar_noroeste(sobrante, faltante, grupos):
+    """
+    Flujos de la regla de la esquina noroeste dentro de cada grupo, para
+    todos los medicamentos a la vez.
+
+    sobrante, faltante: (medicamentos, sedes). grupos: (sedes,).
+    Devuelve flujo (medicamentos, origen, destino).
+    """
+    s_hasta, s_antes = _acumulado_por_grupo(sobrante, grupos)
+    f_hasta, f_antes = _acumulado_por_grupo(faltante, grupos)
+
+    # el tramo [antes, hasta) de cada origen se cruza con el de cada destino
+    flujo = (
+        np.minimum(s_hasta[:, :, None], f_hasta[:, None, :])
+        - np.maximum(s_antes[:, :, None], f_antes[:, None, :])
+    )
+    flujo = np.maximum(flujo, 0)
+    flujo *= (grupos[:, None] == grupos[None, :])
+    return flujo
+
+
+def planificar(region_id, cobertura=None, hoy=None):
+    inicio = time.perf_counter()
+    cobertura = cobertura or horizonte_dias()
+    hoy = hoy or timezone.localdate()
+    ventana = ventana_dias()
+    esquema.verificar("movimientos_stock")
+    zona, desde, hasta = rango_consumo(hoy, ventana)
+
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_SEDES, [region_id])
+        sedes = cursor.fetchall()
+        cursor.execute(SQL_STOCK, [region_id])
+        stock = cursor.fetchall()
+        cursor.execute(SQL_CONSUMO, [zona, region_id, desde, hasta])
+        filas = cursor.fetchall()
+
+    ids_sede = [sede[0] for sede in sedes]
+    meds = sorted({fila[0] for fila in stock} | {fila[0] for fila in filas})
+    n_med, n_sede = len(meds), len(ids_sede)
+    if n_med == 0 or n_sede < 2:
+        return _resultado([], meds, sedes, np.zeros((0, 0, 0)), 0, inicio)
+
+    col = {id_sede: j for j, id_sede in enumerate(ids_sede)}
+    fila_med = {cod_med: i for i, cod_med in enumerate(meds)}
+
+    existencias = np.zeros((n_med, n_sede))
+    for cod_med, id_sede, cantidad in stock:
+        existencias[fila_med[cod_med], col[id_sede]] = max(cantidad, 0)
+
+    pares = [(cod_med, id_sede) for cod_med in meds for id_sede in ids_sede]
+    consumo = consumo_diario(pares, filas, hoy, ventana, vida_media_dias())
+    necesidad = np.ceil(consumo.reshape(n_med, n_sede) * cobertura)
+
+    sobrante = np.maximum(existencias - necesidad, 0)
+    faltante = np.maximum(necesidad - existencias, 0)
+
+    # 1) dentro de cada ciudad (costo menor)
+    ciudades = {}
+    grupos = np.array([ciudades.setdefault(sede[2], len(ciudades)) for sede in sedes])
+    flujo = asignar_noroeste(sobrante, faltante, grupos)
+
+    # 2) lo que quede, entre ciudades (un solo grupo)
+    sobrante = sobrante - flujo.sum(axis=2)
+    faltante = faltante - flujo.sum(axis=1)
+    flujo_regional = asignar_noroeste(sobrante, faltante, np.zeros(n_sede, dtype=int))
+    flujo = flujo + flujo_regional
+
+    sin_cubrir = int((faltante - flujo_regional.sum(axis=1)).sum())
+    costos = np.where(grupos[:, None] == grupos[None, :], COSTO_MISMA_CIUDAD, COSTO_OTRA_CIUDAD)
+    return _resultado(costos, meds, sedes, flujo, sin_cubrir, inicio)
+
+
+def _resultado(costos, meds, sedes, flujo, sin_cubrir, inicio):
+    transferencias = []
+    for i, j, k in zip(*np.nonzero(flujo)):
+        transferencias.append({
+            "cod_med": meds[i],
+            "origen": {"id_sede": sedes[j][0], "sede": sedes[j][1], "ciudad": sedes[j][2]},
+            "destino": {"id_sede": sedes[k][0], "sede": sedes[k][1], "ciudad": sedes[k][2]},
+            "cantidad": int(flujo[i, j, k]),
+            "costo": int(flujo[i, j, k] * costos[j, k]),
+        })
+
+    return {
+        "transferencias": transferencias,
+        "unidades": sum(t["cantidad"] for t in transferencias),
+        "costo_total": sum(t["costo"] for t in transferencias),
+        "faltante_sin_cubrir": sin_cubrir,
+        "medicamentos": len(meds),
+        "sedes": len(sedes),
+        "ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
@@ -0,0 +1,474 @@
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core import esquema
+
+
+# ================================================================
+#              TABLAS DE RESUMEN (ROLLUPS) DE REPORTES
+# ================================================================
+#
+# Los reportes del dashboard leen estas tablas en lugar de recorrer
+# historias_clinicas / citas / pacientes en cada consulta.
+#
+# Refresco incremental: por cada rollup se guarda en rollup_estado el
+# último id procesado de la tabla origen. Al refrescar se busca la
+# fecha más antigua entre las filas nuevas (o el inicio de la ventana
+# de gracia, para alcanzar cambios de estado recientes) y se recalculan
+# solo los periodos desde ahí. El comando `rebuild_rollups` reconstruye
+# todo desde cero.
+#
+# Las escrituras y borrados de las vistas registran en rollup_pendientes
+# la fecha más antigua que tocaron (marcar_cambio); el siguiente
+# refresco recalcula desde esa fecha aunque sea anterior a la ventana de
+# gracia.
+#
+# `manage.py crear_tablas` hace el primer cálculo completo de los
+# rollups que aún no tienen fila en rollup_estado. Después, el cron
+# `manage.py rebuild_rollups --incremental` (ver README) los mantiene al
+# día: los reportes muestran los datos hasta el último refresco, que va
+# en la cabecera X-Rollups-Actualizado, y responden 503 si un rollup
+# nunca se calculó.
+#
+# Un rango ?desde=&hasta= cualquiera se arma con los periodos completos
+# del rollup más los días sueltos de los bordes, que se leen de las
+# tablas base con el mismo SELECT del rollup (ver Rollup.fuente).
+
+VENTANA_GRACIA = timedelta(days=14)
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS rollup_estado (
+        nombre varchar(50) PRIMARY KEY,
+        ultimo_id bigint NOT NULL DEFAULT 0,
+        actualizado timestamptz NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_pendientes (
+        id bigserial PRIMARY KEY,
+        nombre varchar(50) NOT NULL,
+        desde timestamptz NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_enfermedades (
+        id_sede integer NOT NULL,
+        mes date NOT NULL,
+        cod_diag integer NOT NULL,
+        total integer NOT NULL,
+        PRIMARY KEY (id_sede, mes, cod_diag)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_tiempos_atencion (
+        id_sede integer NOT NULL,
+        mes date NOT NULL,
+        suma_minutos double precision NOT NULL,
+        atenciones integer NOT NULL,
+        PRIMARY KEY (id_sede, mes)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_prescripciones (
+        id_sede integer NOT NULL,
+        mes date NOT NULL,
+        cod_med integer NOT NULL,
+        total integer NOT NULL,
+        PRIMARY KEY (id_sede, mes, cod_med)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_consultas_medico (
+        id_sede integer NOT NULL,
+        semana date NOT NULL,
+        id_emp integer NOT NULL,
+        total integer NOT NULL,
+        PRIMARY KEY (id_sede, semana, id_emp)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_pacientes_sede (
+        id_sede integer PRIMARY KEY,
+        total integer NOT NULL
+    );
+    """,
+]
+
+
+class Rollup:
+    """
+    Un rollup por periodo ('month' o 'week').
+
+    `select_sql` debe producir las columnas de `columnas` y tener un
+    marcador {where} donde se insertan el filtro sobre `columna_fecha`
+    y la `condicion` fija del rollup (si la hay).
+    """
+
+    def __init__(self, nombre, tabla, columnas, periodo, columna_periodo,
+                 origen, origen_pk, origen_fecha, columna_fecha, select_sql,
+                 condicion=None):
+        self.nombre = nombre
+        self.tabla = tabla
+        self.columnas = columnas
+        self.periodo = periodo
+        self.columna_periodo = columna_periodo
+        self.origen = origen
+        self.origen_pk = origen_pk
+        self.origen_fecha = origen_fecha
+        self.columna_fecha = columna_fecha
+        self.select_sql = select_sql
+        self.condicion = condicion
+
+    def _max_id(self, cursor):
+        cursor.execute(f"SELECT COALESCE(MAX({self.origen_pk}), 0) FROM {self.origen};")
+        return cursor.fetchone()[0]
+
+    def _min_fecha_nuevas(self, cursor, ultimo_id):
+        cursor.execute(
+            f"SELECT MIN({self.origen_fecha}) FROM {self.origen} WHERE {self.origen_pk} > %s;",
+            [ultimo_id]
+        )
+        return cursor.fetchone()[0]
+
+    def recalcular(self, cursor, desde=None):
+        columnas = ", ".join(self.columnas)
+        condiciones, params = [], []
+        if self.condicion:
+            condiciones.append(self.condicion)
+
+        if desde is None:
+            cursor.execute(f"DELETE FROM {self.tabla};")
+        else:
+            inicio = f"date_trunc('{self.periodo}', %s::timestamptz)"
+            cursor.execute(
+                f"DELETE FROM {self.tabla} WHERE {self.columna_periodo} >= ({inicio})::date;",
+                [desde]
+            )
+            condiciones.append(f"{self.columna_fecha} >= {inicio}")
+            params.append(desde)
+
+        where = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+        cursor.execute(
+            f"INSERT INTO {self.tabla} ({columnas}) "
+            + self.select_sql.format(where=where),
+            params
+        )
+
+    def _select_base(self, desde, hasta, id_sede):
+        """
+        El SELECT del rollup sobre las tablas base para [desde, hasta).
+        """
+        condiciones = [self.condicion] if self.condicion else []
+        condiciones += [f"{self.columna_fecha} >= %s", f"{self.columna_fecha} < %s"]
+        params = [desde, hasta]
+        if id_sede is not None:
+            condiciones.append("per.id_sede = %s")
+            params.append(id_sede)
+
+        select = self.select_sql.format(where="WHERE " + " AND ".join(condiciones))
+        columnas = ", ".join(self.columnas)
+        return f"SELECT * FROM ({select.strip().rstrip(';')}) base ({columnas})", params
+
+    def fuente(self, desde=None, hasta=None, id_sede=None):
+        """
+        (sql, params) de una subconsulta con las columnas del rollup para
+        las fechas [desde, hasta] (ambas incluidas, None = sin límite).
+        Los periodos que caen completos en el rango se leen del rollup;
+        los días de los bordes, de las tablas base. Las filas de un mismo
+        periodo pueden venir repetidas (borde y rollup): hay que sumarlas.
+        """
+        # [primero, ultimo) son los periodos completos dentro del rango
+        primero = desde
+        if desde is not None and desde != _inicio_periodo(desde, self.periodo):
+            primero = _siguiente_periodo(desde, self.periodo)
+        hasta_excl = hasta + timedelta(days=1) if hasta is not None else None
+        ultimo = _inicio_periodo(hasta_excl, self.periodo) if hasta_excl else None
+
+        if primero is not None and ultimo is not None and primero >= ultimo:
+            return self._select_base(desde, hasta_excl, id_sede)
+
+        partes, params = [], []
+        condiciones = []
+        if primero is not None:
+            condiciones.append(f"{self.columna_periodo} >= %s")
+            params.append(primero)
+        if ultimo is not None:
+            condiciones.append(f"{self.columna_periodo} < %s")
+            params.append(ultimo)
+        if id_sede is not None:
+            condiciones.append("id_sede = %s")
+            params.append(id_sede)
+        where = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+        partes.append(f"SELECT {', '.join(self.columnas)} FROM {self.tabla} {where}")
+
+        for inicio, fin in ((desde, primero), (ultimo, hasta_excl)):
+            if inicio is not None and inicio < fin:
+                sql, borde = self._select_base(inicio, fin, id_sede)
+                partes.append(sql)
+                params += borde
+
+        return "\nUNION ALL\n".join(partes), params
+
+    def refrescar(self, cursor, completo=False):
+        cursor.execute("SELECT ultimo_id FROM rollup_estado WHERE nombre = %s;", [self.nombre])
+        row = cursor.fetchone()
+        ultimo_id = row[0] if row else 0
+        max_id = self._max_id(cursor)
+
+        # los cambios marcados después de esta lectura quedan para el
+        # siguiente refresco
+        cursor.execute(
+            "SELECT COALESCE(MAX(id), 0), MIN(desde) FROM rollup_pendientes WHERE nombre = %s;",
+            [self.nombre]
+        )
+        hasta_pendiente, min_pendiente = cursor.fetchone()
+
+        if completo or row is None:
+            self.recalcular(cursor)
+        else:
+            desde = timezone.now() - VENTANA_GRACIA
+            for fecha in (self._min_fecha_nuevas(cursor, ultimo_id), min_pendiente):
+                if fecha is not None:
+                    desde = min(desde, _como_datetime(fecha))
+            self.recalcular(cursor, desde)
+
+        cursor.execute(
+            "DELETE FROM rollup_pendientes WHERE nombre = %s AND id <= %s;",
+            [self.nombre, hasta_pendiente]
+        )
+
+        cursor.execute(
+            """
+            INSERT INTO rollup_estado (nombre, ultimo_id, actualizado)
+            VALUES (%s, %s, now())
+            ON CONFLICT (nombre)
+            DO UPDATE SET ultimo_id = EXCLUDED.ultimo_id, actualizado = EXCLUDED.actualizado;
+            """,
+            [self.nombre, max_id]
+        )
+
+
+def _inicio_periodo(fecha, periodo):
+    if periodo == "month":
+        return fecha.replace(day=1)
+    return fecha - timedelta(days=fecha.weekday())
+
+
+def _siguiente_periodo(fecha, periodo):
+    if periodo == "month":
+        return (fecha.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return _inicio_periodo(fecha, periodo) + timedelta(days=7)
+
+
+def _como_datetime(fecha):
+    if not isinstance(fecha, datetime):
+        return timezone.make_aware(datetime.combine(fecha, time.min))
+    return fecha
+
+
+_JOIN_PACIENTE = """
+    JOIN citas c ON h.id_cita = c.id_cita
+    JOIN pacientes pac ON c.cod_pac = pac.cod_pac
+    JOIN personas per ON pac.documento = per.documento
+"""
+
+ROLLUPS = [
+    # agrupa por el código normalizado (core.diagnosticos), no por el texto
+    Rollup(
+        nombre="enfermedades",
+        tabla="rollup_enfermedades",
+        columnas=["id_sede", "mes", "cod_diag", "total"],
+        periodo="month",
+        columna_periodo="mes",
+        origen="historias_clinicas",
+        origen_pk="cod_hist",
+        origen_fecha="fecha_hora",
+        columna_fecha="h.fecha_hora",
+        select_sql="""
+            SELECT per.id_sede, date_trunc('month', h.fecha_hora)::date, hd.cod_diag, COUNT(*)::integer
+            FROM historias_clinicas h
+            JOIN historias_diagnostico hd ON hd.cod_hist = h.cod_hist
+        """ + _JOIN_PACIENTE + """
+            {where}
+            GROUP BY 1, 2, 3;
+        """,
+    ),
+    Rollup(
+        nombre="tiempos_atencion",
+        tabla="rollup_tiempos_atencion",
+        columnas=["id_sede", "mes", "suma_minutos", "atenciones"],
+        periodo="month",
+        columna_periodo="mes",
+        origen="historias_clinicas",
+        origen_pk="cod_hist",
+        origen_fecha="fecha_hora",
+        columna_fecha="h.fecha_hora",
+        select_sql="""
+            SELECT
+                per.id_sede,
+                date_trunc('month', h.fecha_hora)::date,
+                SUM(EXTRACT(EPOCH FROM (h.fecha_hora - c.fecha_hora)) / 60.0),
+                COUNT(*)::integer
+            FROM historias_clinicas h
+        """ + _JOIN_PACIENTE + """
+            {where}
+            GROUP BY 1, 2;
+        """,
+    ),
+    Rollup(
+        nombre="prescripciones",
+        tabla="rollup_prescripciones",
+        columnas=["id_sede", "mes", "cod_med", "total"],
+        periodo="month",
+        columna_periodo="mes",
+        origen="prescripciones_medicamentos",
+        origen_pk="id_presc",
+        origen_fecha="fecha_emision",
+        columna_fecha="pm.fecha_emision",
+        select_sql="""
+            SELECT per.id_sede, date_trunc('month', pm.fecha_emision)::date, pm.cod_med, COUNT(*)::integer
+            FROM prescripciones_medicamentos pm
+            JOIN historias_clinicas h ON pm.cod_hist = h.cod_hist
+        """ + _JOIN_PACIENTE + """
+            {where}
+            GROUP BY 1, 2, 3;
+        """,
+    ),
+    Rollup(
+        nombre="consultas_medico",
+        tabla="rollup_consultas_medico",
+        columnas=["id_sede", "semana", "id_emp", "total"],
+        periodo="week",
+        columna_periodo="semana",
+        origen="citas",
+        origen_pk="id_cita",
+        origen_fecha="fecha_hora",
+        columna_fecha="c.fecha_hora",
+        select_sql="""
+            SELECT per.id_sede, date_trunc('week', c.fecha_hora)::date, c.id_emp, COUNT(*)::integer
+            FROM citas c
+            JOIN pacientes pac ON c.cod_pac = pac.cod_pac
+            JOIN personas per ON pac.documento = per.documento
+            {where}
+            GROUP BY 1, 2, 3;
+        """,
+        condicion="c.estado = 'Atendida'",
+    ),
+]
+
+SQL_PACIENTES_SEDE = """
+    INSERT INTO rollup_pacientes_sede (id_sede, total)
+    SELECT per.id_sede, COUNT(*)
+    FROM pacientes pac
+    JOIN personas per ON pac.documento = per.documento
+    GROUP BY per.id_sede;
+"""
+
+
+TABLAS = ["rollup_estado", "rollup_pendientes", "rollup_pacientes_sede"] + [
+    rollup.tabla for rollup in ROLLUPS
+]
+
+NOMBRES = [rollup.nombre for rollup in ROLLUPS] + ["pacientes_sede"]
+
+_POR_NOMBRE = {rollup.nombre: rollup for rollup in ROLLUPS}
+
+
+def fuente(nombre, filtros):
+    """
+    Subconsulta (sql, params) del rollup `nombre` con los filtros de un
+    core.filtros.ReporteFiltros. Ver Rollup.fuente.
+    """
+    return _POR_NOMBRE[nombre].fuente(filtros.desde, filtros.hasta, filtros.id_sede)
+
+
+class RollupsPendientes(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Los reportes aún no se calcularon; ejecute `manage.py rebuild_rollups`."
+    default_code = "rollups_pendientes"
+
+
+def _sin_calcular(cursor, nombres):
+    cursor.execute(
+        "SELECT nombre, actualizado FROM rollup_estado WHERE nombre = ANY(%s);",
+        [list(nombres)]
+    )
+    calculados = dict(cursor.fetchall())
+    return [nombre for nombre in nombres if nombre not in calculados], calculados
+
+
+def actualizado(*nombres):
+    """
+    Fecha del último refresco del más atrasado de los rollups `nombres`.
+    Lanza TablasFaltantes o RollupsPendientes (503) si no se pueden leer.
+    """
+    esquema.verificar("rollup_estado")
+    with connection.cursor() as cursor:
+        faltan, calculados = _sin_calcular(cursor, nombres)
+    if faltan:
+        raise RollupsPendientes(
+            f"Los rollups {', '.join(faltan)} aún no se calcularon; "
+            "ejecute `manage.py rebuild_rollups`."
+        )
+    return min(calculados.values())
+
+
+def crear_tablas():
+    with connection.cursor() as cursor:
+        for ddl in DDL:
+            cursor.execute(ddl)
+        faltan, _ = _sin_calcular(cursor, NOMBRES)
+
+    # primer cálculo: refrescar() reconstruye completos los que no tienen
+    # estado y deja los demás como están hasta el siguiente cron
+    if faltan:
+        refresh_rollups()
+
+
+def marcar_cambio(origen, *fechas):
+    """
+    Registra que cambiaron filas de `origen` (tabla de la que se calculan
+    los rollups) con estas fechas. Se escribe al confirmar la transacción
+    de la vista.
+    """
+    fechas = [_como_datetime(fecha) for fecha in fechas if fecha is not None]
+    nombres = [rollup.nombre for rollup in ROLLUPS if rollup.origen == origen]
+    if not fechas or not nombres or not esquema.existen("rollup_pendientes"):
+        return
+
+    desde = min(fechas)
+
+    def registrar():
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO rollup_pendientes (nombre, desde) VALUES (%s, %s);",
+                [(nombre, desde) for nombre in nombres]
+            )
+
+    transaction.on_commit(registrar)
+
+
+def refresh_rollups(completo=False):
+    """
+    Refresca todos los rollups en una transacción.
+    Con completo=True se reconstruyen desde cero.
+    """
+    esquema.verificar(*TABLAS, "historias_diagnostico")
+    with transaction.atomic(), connection.cursor() as cursor:
+        for rollup in ROLLUPS:
+            rollup.refrescar(cursor, completo=completo)
+
+        cursor.execute("DELETE FROM rollup_pacientes_sede;")
+        cursor.execute(SQL_PACIENTES_SEDE)
+        cursor.execute(
+            """
+            INSERT INTO rollup_estado (nombre, ultimo_id, actualizado)
+            VALUES ('pacientes_sede', 0, now())
+            ON CONFLICT (nombre) DO UPDATE SET actualizado = EXCLUDED.actualizado;
+            """
+        )
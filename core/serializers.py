@@ -7,6 +7,7 @@ from .models import (
     PrescripcionesMedicamentos, RegistroMedicamentos, ReportesMedicos,
     AuditoriaAccesos, Citas, Equipamento
 )
+from .catalogos import CatalogPrimaryKeyRelatedField
 
 # ============================================================
 #   REGIONES / SEDES
@@ -21,7 +22,7 @@ class RegionSerializer(serializers.ModelSerializer):
 class SedeHospitalariaSerializer(serializers.ModelSerializer):
     region = RegionSerializer(read_only=True)
 
-    region_id = serializers.PrimaryKeyRelatedField(
+    region_id = CatalogPrimaryKeyRelatedField(
         source="region",
         queryset=Regiones.objects.all()
     )
@@ -89,7 +90,7 @@ class TipoEquipamientoSerializer(serializers.ModelSerializer):
 
 class ProveedorSerializer(serializers.ModelSerializer):
     region = RegionSerializer(read_only=True)
-    region_id = serializers.PrimaryKeyRelatedField(
+    region_id = CatalogPrimaryKeyRelatedField(
         source="region", queryset=Regiones.objects.all(), write_only=True
     )
 
@@ -104,7 +105,7 @@ class ProveedorSerializer(serializers.ModelSerializer):
 
 class PersonaSerializer(serializers.ModelSerializer):
     tipo_doc = TipoDocumentoSerializer(read_only=True)
-    tipo_doc_id = serializers.PrimaryKeyRelatedField(
+    tipo_doc_id = CatalogPrimaryKeyRelatedField(
         source="tipo_doc", queryset=TiposDocumento.objects.all(), write_only=True
     )
 
@@ -129,17 +130,17 @@ class EmpleadoSerializer(serializers.ModelSerializer):
     )
 
     id_dept = DepartamentoTrabajoSerializer(read_only=True)
-    id_dept_id = serializers.PrimaryKeyRelatedField(
+    id_dept_id = CatalogPrimaryKeyRelatedField(
         source="id_dept", queryset=DepartamentosTrabajo.objects.all(), write_only=True
     )
 
     cargo = CargoSerializer(read_only=True)
-    cargo_id = serializers.PrimaryKeyRelatedField(
+    cargo_id = CatalogPrimaryKeyRelatedField(
         source="cargo", queryset=Cargos.objects.all(), write_only=True
     )
 
     rol = RolSerializer(read_only=True)
-    rol_id = serializers.PrimaryKeyRelatedField(
+    rol_id = CatalogPrimaryKeyRelatedField(
         source="rol", queryset=Roles.objects.all(), write_only=True
     )
 
@@ -180,7 +181,7 @@ class MedicamentosSerializer(serializers.ModelSerializer):
 
 class EquipamentoSerializer(serializers.ModelSerializer):
     id_dept = DepartamentoTrabajoSerializer(read_only=True)
-    id_dept_id = serializers.PrimaryKeyRelatedField(
+    id_dept_id = CatalogPrimaryKeyRelatedField(
         source="id_dept", queryset=DepartamentosTrabajo.objects.all(), write_only=True
     )
     responsable = EmpleadoSerializer(read_only=True)
@@ -203,14 +204,21 @@ class EquipamentoSerializer(serializers.ModelSerializer):
 
 
 class StockMedicamentoSerializer(serializers.ModelSerializer):
-    medicamento = MedicamentosSerializer(read_only=True)
-    medicamento_id = serializers.PrimaryKeyRelatedField(
-        source="medicamento", queryset=Medicamentos.objects.all(), write_only=True
-    )
-
+    # la cantidad se aplica con core.inventario (StockMedicamentoViewSet),
+    # nunca se escribe directo
     class Meta:
         model = StockMedicamento
-        fields = ["id_stock", "medicamento", "medicamento_id", "cantidad", "fecha_actualizacion"]
+        fields = ["id", "cod_med", "id_sede", "cantidad"]
+        extra_kwargs = {"cantidad": {"min_value": 0}}
+
+    def validate(self, data):
+        if self.instance is not None:
+            for campo in ("cod_med", "id_sede"):
+                if campo in data and data[campo] != getattr(self.instance, campo):
+                    raise serializers.ValidationError(
+                        {campo: "No se puede cambiar; cree otro registro de stock"}
+                    )
+        return data
 
 
 # ============================================================
@@ -272,45 +280,38 @@ class HistoriaClinicaSerializer(serializers.ModelSerializer):
             "medico_nombre",
         ]
 
+    # Los nombres vienen anotados por HistoriaClinicaViewSet.get_queryset();
+    # el acceso por relaciones solo se usa para instancias sin anotar.
+
     def get_paciente_nombre(self, obj):
+        if hasattr(obj, "paciente_nombre"):
+            return obj.paciente_nombre
         try:
-            documento = obj.id_cita.cod_pac.documento
-            persona = Personas.objects.get(documento=documento)
-            return persona.nom_persona
-        except Personas.DoesNotExist:
-            return None
+            return obj.id_cita.cod_pac.documento.nom_persona
         except Exception:
             return None
 
     def get_medico_nombre(self, obj):
+        if hasattr(obj, "medico_nombre"):
+            return obj.medico_nombre
         try:
-            documento = obj.id_cita.id_emp.documento
-            persona = Personas.objects.get(documento=documento)
-            return persona.nom_persona
-        except Personas.DoesNotExist:
-            return None
+            return obj.id_cita.id_emp.documento.nom_persona
         except Exception:
             return None
 
 
 
 class PrescripcionMedicamentoSerializer(serializers.ModelSerializer):
-    id_historia = HistoriaClinicaSerializer(read_only=True)
-    id_historia_id = serializers.PrimaryKeyRelatedField(
-        source="id_historia", queryset=HistoriasClinicas.objects.all(), write_only=True
-    )
-
-    medicamento = MedicamentosSerializer(read_only=True)
-    medicamento_id = serializers.PrimaryKeyRelatedField(
-        source="medicamento", queryset=Medicamentos.objects.all(), write_only=True
-    )
+    # unidades que se descuentan del stock al crearla y sede de donde
+    # salen (por defecto la del paciente); ver core.inventario
+    cantidad = serializers.IntegerField(min_value=1, default=1, write_only=True)
+    id_sede = serializers.IntegerField(min_value=1, required=False, write_only=True)
 
     class Meta:
         model = PrescripcionesMedicamentos
         fields = [
-            "id_prescripcion", "id_historia", "id_historia_id",
-            "medicamento", "medicamento_id", "dosis",
-            "frecuencia", "duracion"
+            "id_presc", "cod_hist", "cod_med", "dosis", "frecuencia",
+            "duracion_dias", "fecha_emision", "cantidad", "id_sede"
         ]
 
 
@@ -380,7 +381,7 @@ class CitaSerializer(serializers.ModelSerializer):
     )
 
     cod_servicio = TipoServicioSerializer(read_only=True)
-    cod_servicio_id = serializers.PrimaryKeyRelatedField(
+    cod_servicio_id = CatalogPrimaryKeyRelatedField(
         source="cod_servicio", queryset=TiposServicio.objects.all(), write_only=True
     )
 
@@ -0,0 +1,179 @@
+import asyncio
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+
+# ================================================================
+#           EXPORTACIÓN EN STREAMING (NDJSON / CSV)
+# ================================================================
+#
+# Para los listados completos (ETL nocturno) no se arma la lista en
+# memoria: se abre un cursor del lado del servidor y se van emitiendo
+# las filas por bloques, así la memoria es constante y el primer byte
+# sale de inmediato. Sirve igual con WSGI y con ASGI (ver stream_query).
+
+CHUNK_SIZE = 2000
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # solo se usa para errores; los datos salen por stream_query
+        return json.dumps(data, cls=DjangoJSONEncoder).encode() + b"\n"
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # solo se usa para errores, que se responden como JSON
+        response = (renderer_context or {}).get("response")
+        if response is not None:
+            response["Content-Type"] = "application/json"
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+STREAMING_FORMATS = ("ndjson", "csv")
+
+
+class StreamingExportMixin:
+    """
+    Habilita ?format=ndjson y ?format=csv en una vista.
+    """
+
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [
+        NDJSONRenderer, CSVRenderer
+    ]
+
+    def streaming_format(self, request):
+        renderer = getattr(request, "accepted_renderer", None)
+        formato = getattr(renderer, "format", None)
+        if formato in STREAMING_FORMATS:
+            return formato
+        return None
+
+
+class _Echo:
+    """Buffer falso: csv.writer escribe y se devuelve la línea."""
+
+    def write(self, value):
+        return value
+
+
+def _lotes(sql, params):
+    # chunked_cursor() es un cursor con nombre (server-side) en Postgres
+    # y un cursor normal en los demás motores. Fuera de una transacción
+    # Postgres lo abriría WITH HOLD y materializaría todo el resultado
+    # antes de enviar la primera fila, por eso la transacción queda
+    # abierta mientras dure el generador.
+    with transaction.atomic():
+        cursor = connection.chunked_cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+async def _alotes(sql, params):
+    """
+    _lotes() para ASGI. El cursor y su transacción viven en un hilo
+    propio de la exportación (con su propia conexión): el hilo compartido
+    de las vistas sync no puede quedar dentro de la transacción entre un
+    bloque y otro. Cada bloque se pide cuando el anterior ya se envió.
+    """
+    loop = asyncio.get_running_loop()
+    hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+    lotes = _lotes(sql, params)
+
+    def cerrar():
+        lotes.close()
+        connection.close()
+
+    try:
+        while True:
+            rows = await loop.run_in_executor(hilo, next, lotes, None)
+            if rows is None:
+                break
+            yield rows
+    finally:
+        await loop.run_in_executor(hilo, cerrar)
+        hilo.shutdown(wait=False)
+
+
+def _value(valor):
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    return valor
+
+
+def _formato(formato, columnas):
+    """
+    Devuelve (cabecera, linea): las líneas iniciales y la función que
+    convierte una fila en una línea del formato.
+    """
+    if formato == "csv":
+        writer = csv.writer(_Echo())
+        return [writer.writerow(columnas)], lambda row: writer.writerow([_value(v) for v in row])
+
+    def linea(row):
+        registro = dict(zip(columnas, row))
+        return json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+    return [], linea
+
+
+def _contenido(sql, params, columnas, formato):
+    cabecera, linea = _formato(formato, columnas)
+    yield from cabecera
+    for rows in _lotes(sql, params):
+        for row in rows:
+            yield linea(row)
+
+
+async def _acontenido(sql, params, columnas, formato):
+    cabecera, linea = _formato(formato, columnas)
+    for texto in cabecera:
+        yield texto
+    async for rows in _alotes(sql, params):
+        yield "".join(linea(row) for row in rows)
+
+
+def stream_query(sql, params, columnas, formato, nombre, request=None):
+    """
+    Devuelve un StreamingHttpResponse con el resultado de `sql`.
+    `columnas` son los nombres de las columnas del SELECT, en orden.
+
+    Con una petición ASGI el contenido es un iterador async; con uno
+    sync, Django lo leería entero antes de enviar el primer byte.
+    """
+    if isinstance(getattr(request, "_request", request), ASGIRequest):
+        contenido = _acontenido(sql, params, columnas, formato)
+    else:
+        contenido = _contenido(sql, params, columnas, formato)
+
+    if formato == "csv":
+        response = StreamingHttpResponse(contenido, content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{nombre}.csv"'
+    else:
+        response = StreamingHttpResponse(
+            contenido, content_type="application/x-ndjson; charset=utf-8"
+        )
+    return response
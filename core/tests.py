@@ -1,3 +1,540 @@
-from django.test import TestCase
+import datetime as dt
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import (
+    Regiones, SedesHospitalarias, DepartamentosTrabajo, Cargos, Roles,
+    TiposDocumento, TiposServicio, Proveedores, Personas,
+    Empleados, Pacientes, Citas, HistoriasClinicas, Equipamento,
+    Medicamentos, PrescripcionesMedicamentos, StockMedicamento
+)
+from core import busqueda, esquema, inventario, tokens
+from core.catalogos import CATALOG_MODELS, catalog_cache
+from core.tokens import RevocationStore, TokenInvalido, emitir_tokens, revocaciones
+
+solo_postgres = skipUnless(connection.vendor == "postgresql", "requiere PostgreSQL")
+
+
+# ================================================================
+#        CANTIDAD DE CONSULTAS POR LISTADO (SIN N+1)
+# ================================================================
+#
+# Los modelos no son administrados por Django, así que las tablas se
+# crean a mano en la base de pruebas antes de abrir la transacción de
+# cada clase.
+
+def _modelos_no_administrados():
+    return [m for m in apps.get_app_config("core").get_models() if not m._meta.managed]
+
+
+class TablasNoAdministradasMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for modelo in _modelos_no_administrados():
+                editor.create_model(modelo)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for modelo in reversed(_modelos_no_administrados()):
+                editor.delete_model(modelo)
+
+
+class DatosBaseMixin(TablasNoAdministradasMixin):
+    """Catálogos mínimos y un médico (cls.empleado) para crear citas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Regiones.objects.create(nombre="Andina")
+        cls.sede = SedesHospitalarias.objects.create(
+            nom_sede="Central", ciudad="Bogotá", region=cls.region
+        )
+        cls.tipo_doc = TiposDocumento.objects.create(tipo_doc_id=1, nombre="CC")
+        cls.dept = DepartamentosTrabajo.objects.create(nom_dept="Urgencias")
+        cls.cargo = Cargos.objects.create(nombre="Médico")
+        cls.rol = Roles.objects.create(nombre="Médico")
+        cls.rol_admin = Roles.objects.create(nombre="Administrador")
+        cls.servicio = TiposServicio.objects.create(nombre="Consulta")
+        medico = Personas.objects.create(
+            documento=1, nom_persona="Médico", tipo_doc=cls.tipo_doc, id_sede=cls.sede
+        )
+        cls.empleado = Empleados.objects.create(
+            documento=medico, id_dept=cls.dept, cargo=cls.cargo, rol=cls.rol, hash_contra="x"
+        )
+        cls.siguiente = 100
+        # los catálogos se crean sin pasar por sus ViewSets: la copia en
+        # memoria de core.catalogos podría ser la de otra clase
+        for modelo in CATALOG_MODELS:
+            catalog_cache.bump(modelo)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        # las tablas auxiliares creadas en setUpTestData se fueron con el
+        # rollback de la clase
+        esquema._existentes.clear()
+
+    @classmethod
+    def crear_historia(cls, documento, diagnostico="Dengue", id_sede=None):
+        persona = Personas.objects.create(
+            documento=documento, nom_persona=f"Paciente {documento}",
+            tipo_doc=cls.tipo_doc, id_sede=id_sede or cls.sede
+        )
+        paciente = Pacientes.objects.create(documento=persona)
+        cita = Citas.objects.create(
+            cod_pac=paciente, id_emp=cls.empleado, cod_servicio=cls.servicio,
+            fecha_hora=timezone.now(), estado="Atendida"
+        )
+        return HistoriasClinicas.objects.create(
+            id_cita=cita, fecha_hora=timezone.now(), diagnostico=diagnostico
+        )
+
+
+class ConsultasPorListadoTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        caches["catalogos"].clear()
+
+    def crear_filas(self, n):
+        for _ in range(n):
+            ConsultasPorListadoTests.siguiente += 1
+            i = ConsultasPorListadoTests.siguiente
+            persona = Personas.objects.create(
+                documento=i, nom_persona=f"Paciente {i}", tipo_doc=self.tipo_doc, id_sede=self.sede
+            )
+            paciente = Pacientes.objects.create(documento=persona)
+            cita = Citas.objects.create(
+                cod_pac=paciente, id_emp=self.empleado, cod_servicio=self.servicio,
+                fecha_hora=timezone.now() + dt.timedelta(hours=i), estado="Atendida"
+            )
+            HistoriasClinicas.objects.create(
+                id_cita=cita, fecha_hora=timezone.now(), diagnostico="Dengue"
+            )
+            Proveedores.objects.create(nombre=f"Proveedor {i}", region=self.region)
+            Equipamento.objects.create(
+                nom_eq=f"Equipo {i}", id_dept=self.dept, estado="Activo",
+                fecha_mantenimiento=dt.date.today(), responsable=self.empleado
+            )
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+    def assertConsultasConstantes(self, url, esperadas):
+        self.crear_filas(2)
+        pocas = self.consultas(url)
+        self.crear_filas(8)
+        muchas = self.consultas(url)
+        self.assertEqual(pocas, muchas)
+        self.assertEqual(muchas, esperadas)
+
+    def test_citas(self):
+        self.assertConsultasConstantes("/api/citas/", 1)
+
+    def test_personas(self):
+        self.assertConsultasConstantes("/api/personas/", 1)
+
+    def test_proveedores(self):
+        self.assertConsultasConstantes("/api/proveedores/", 1)
+
+    def test_equipamento(self):
+        self.assertConsultasConstantes("/api/equipamento/", 1)
+
+    def test_historias(self):
+        self.assertConsultasConstantes("/api/historias-base/", 1)
+
+    def test_historia_detalle(self):
+        self.crear_filas(1)
+        historia = HistoriasClinicas.objects.get()
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/historias-base/{historia.cod_hist}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["paciente_nombre"], historia.id_cita.cod_pac.documento.nom_persona)
+
+
+# ================================================================
+#        STOCK: DISPENSAR PRESCRIPCIONES
+# ================================================================
+
+@solo_postgres
+class DispensarPrescripcionTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        proveedor = Proveedores.objects.create(nombre="Proveedor", region=cls.region)
+        cls.med = Medicamentos.objects.create(nom_med="Acetaminofén", unidad="tableta", proveedor=proveedor)
+        StockMedicamento.objects.create(cod_med=cls.med, id_sede=cls.sede, cantidad=10)
+        cls.otra_sede = SedesHospitalarias.objects.create(
+            nom_sede="Norte", ciudad="Medellín", region=cls.region
+        )
+        cls.historia = cls.crear_historia(2)
+        inventario.crear_tablas()
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def prescribir(self, **datos):
+        datos = {
+            "cod_hist": self.historia.cod_hist, "cod_med": self.med.cod_med, "dosis": "1",
+            "frecuencia": "8h", "duracion_dias": 5, "fecha_emision": "2024-03-01", **datos
+        }
+        response = self.client.post("/api/prescripciones/", datos, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def dispensar(self, id_presc, cantidad):
+        return self.client.post(
+            f"/api/prescripciones/{id_presc}/dispensar/", {"cantidad": cantidad}, format="json"
+        )
+
+    def saldo(self):
+        return inventario.saldo(self.med.cod_med, self.sede.id_sede)
+
+    def test_crear_descuenta_stock(self):
+        data = self.prescribir(cantidad=3)
+        self.assertEqual(data["dispensacion"]["estado"], "dispensada")
+        self.assertEqual(data["dispensacion"]["saldo"], 7)
+        self.assertEqual(self.saldo(), 7)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT delta, motivo, referencia FROM movimientos_stock WHERE cod_med = %s;",
+                [self.med.cod_med]
+            )
+            self.assertEqual(cursor.fetchall(), [(-3, "prescripcion", data["id_presc"])])
+        self.assertEqual(inventario.descuadres(), [])
+
+    def test_stock_insuficiente_queda_pendiente(self):
+        data = self.prescribir(cantidad=50)
+        self.assertEqual(data["dispensacion"]["estado"], "pendiente")
+        self.assertIn("hay 10, se piden 50", data["dispensacion"]["motivo"])
+        self.assertTrue(PrescripcionesMedicamentos.objects.filter(pk=data["id_presc"]).exists())
+        self.assertEqual(self.saldo(), 10)
+
+        response = self.dispensar(data["id_presc"], 50)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.saldo(), 10)
+
+        inventario.mover(self.med.cod_med, self.sede.id_sede, 40, "entrada")
+        response = self.dispensar(data["id_presc"], 50)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data["saldo"], 0)
+
+    def test_sede_sin_stock_queda_pendiente(self):
+        data = self.prescribir(cantidad=1, id_sede=self.otra_sede.id_sede)
+        self.assertEqual(data["dispensacion"]["estado"], "pendiente")
+        self.assertIn("No hay stock registrado", data["dispensacion"]["motivo"])
+        self.assertEqual(self.saldo(), 10)
+
+    def test_no_se_dispensa_dos_veces(self):
+        data = self.prescribir(cantidad=4)
+        response = self.dispensar(data["id_presc"], 4)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("ya fue dispensada", response.data["error"])
+        self.assertEqual(self.saldo(), 6)
+        self.assertEqual(inventario.descuadres(), [])
+
+    def test_prescripcion_inexistente(self):
+        self.assertEqual(self.dispensar(999, 1).status_code, 404)
+
+
+# ================================================================
+#        REVOCACIÓN DE TOKENS
+# ================================================================
+
+@solo_postgres
+@override_settings(REVOCACION_INTERVALO=0)
+class RevocacionTokensTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        admin = Personas.objects.create(
+            documento=3, nom_persona="Admin", tipo_doc=cls.tipo_doc, id_sede=cls.sede
+        )
+        cls.admin = Empleados.objects.create(
+            documento=admin, id_dept=cls.dept, cargo=cls.cargo, rol=cls.rol_admin, hash_contra="x"
+        )
+        tokens.crear_tablas()
+
+    def setUp(self):
+        self.client = APIClient()
+        caches["catalogos"].clear()
+        # la lista en memoria es del proceso y sobrevive al rollback
+        revocaciones._version = None
+        revocaciones._revisado = None
+        revocaciones._revocados = {}
+
+    def post(self, url, token, datos=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                url, datos or {}, format="json", HTTP_AUTHORIZATION=f"Bearer {token}"
+            )
+
+    def test_revocar_token(self):
+        sesion = emitir_tokens(self.empleado)
+        otra = emitir_tokens(self.empleado)
+
+        response = self.post("/api/token/revocar/", sesion["token"], {"refresh": sesion["refresh"]})
+        self.assertEqual(response.status_code, 200, response.content)
+
+        with self.assertRaises(TokenInvalido):
+            tokens.decodificar(sesion["token"])
+        with self.assertRaises(TokenInvalido):
+            tokens.refrescar(sesion["refresh"])
+        self.assertEqual(self.post("/api/token/revocar/", sesion["token"]).status_code, 401)
+        # las demás sesiones del empleado siguen valiendo
+        self.assertEqual(tokens.decodificar(otra["token"])["id_emp"], self.empleado.id_emp)
+
+    def test_revocar_empleado(self):
+        viejo = emitir_tokens(self.empleado)
+        response = self.post(f"/api/empleados/{self.empleado.id_emp}/revocar/", viejo["token"])
+        self.assertEqual(response.status_code, 200, response.content)
+
+        with self.assertRaises(TokenInvalido):
+            tokens.decodificar(viejo["token"])
+        with self.assertRaises(TokenInvalido):
+            tokens.refrescar(viejo["refresh"])
+
+        time.sleep(0.002)
+        nuevo = emitir_tokens(self.empleado)
+        self.assertEqual(tokens.decodificar(nuevo["token"])["id_emp"], self.empleado.id_emp)
+
+    def test_revocar_otro_empleado_requiere_permiso(self):
+        medico = emitir_tokens(self.empleado)["token"]
+        admin = emitir_tokens(self.admin)["token"]
+
+        self.assertEqual(self.post(f"/api/empleados/{self.admin.id_emp}/revocar/", medico).status_code, 403)
+        self.assertEqual(tokens.decodificar(admin)["id_emp"], self.admin.id_emp)
+
+        response = self.post(f"/api/empleados/{self.empleado.id_emp}/revocar/", admin)
+        self.assertEqual(response.status_code, 200, response.content)
+        with self.assertRaises(TokenInvalido):
+            tokens.decodificar(medico)
+
+    def test_sin_token(self):
+        response = self.client.post(f"/api/empleados/{self.empleado.id_emp}/revocar/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_otro_worker_ve_la_revocacion(self):
+        sesion = emitir_tokens(self.empleado)
+        payload = tokens.decodificar(sesion["token"])
+        otro = RevocationStore()
+        otro.recargar()
+        self.assertFalse(otro.esta_revocado(payload))
+
+        self.post("/api/token/revocar/", sesion["token"])
+        otro.recargar()
+        self.assertTrue(otro.esta_revocado(payload))
+
+        # aunque la caché compartida pierda la versión
+        caches["catalogos"].clear()
+        tercero = RevocationStore()
+        tercero.recargar()
+        self.assertTrue(tercero.esta_revocado(payload))
+
+
+# ================================================================
+#        ALTA MASIVA DE PACIENTES
+# ================================================================
+
+@solo_postgres
+class CargaMasivaPacientesTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.crear_historia(50)
+
+    def setUp(self):
+        self.client = APIClient()
+        caches["catalogos"].clear()
+
+    def paciente(self, documento, **datos):
+        return {
+            "documento": documento, "nombre": f"Paciente {documento}",
+            "tipo_doc_id": self.tipo_doc.tipo_doc_id, "id_sede": self.sede.id_sede, **datos
+        }
+
+    def test_fallo_parcial(self):
+        lote = [
+            self.paciente(201),
+            self.paciente(202, nombre=""),
+            self.paciente(203, tipo_doc_id=99),
+            self.paciente(50),                      # ya existe
+            self.paciente(204),
+            self.paciente(204),                     # repetido en el lote
+            self.paciente(3_000_000_000),           # la base lo rechaza
+            self.paciente(205, fecha_nac="1990-02-30"),
+            self.paciente(206, id_sede=999),
+            self.paciente(207),
+        ]
+        # tramos de 2 para que el rechazo de la base caiga en un tramo
+        # con filas buenas
+        with mock.patch("core.bulk.TAMANO_TRAMO", 2):
+            response = self.client.post("/api/pacientes/bulk/", lote, format="json")
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data["creados"], 3)
+        self.assertEqual([p["documento"] for p in response.data["pacientes"]], [201, 204, 207])
+        errores = {e["fila"]: e["error"] for e in response.data["errores"]}
+        self.assertEqual(sorted(errores), [2, 3, 4, 6, 7, 8, 9])
+        self.assertEqual(errores[2], "nombre es obligatorio")
+        self.assertEqual(errores[3], "tipo_doc_id no existe")
+        self.assertEqual(errores[4], "El documento ya existe")
+        self.assertEqual(errores[6], "documento repetido en el lote")
+        self.assertEqual(errores[9], "id_sede no existe")
+        self.assertIn("3000000000", errores[7])
+
+        self.assertEqual(
+            sorted(Pacientes.objects.filter(documento__gte=200).values_list("documento", flat=True)),
+            [201, 204, 207]
+        )
+        self.assertFalse(Personas.objects.filter(documento__in=[202, 203, 205, 206]).exists())
+
+    def test_csv(self):
+        cuerpo = (
+            "documento,nombre,tipo_doc_id,id_sede\n"
+            f"301,Ana,{self.tipo_doc.tipo_doc_id},{self.sede.id_sede}\n"
+            f"302,,{self.tipo_doc.tipo_doc_id},{self.sede.id_sede}\n"
+        )
+        response = self.client.post("/api/pacientes/bulk/", cuerpo, content_type="text/csv")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data["creados"], 1)
+        self.assertEqual(response.data["errores"], [{"fila": 2, "error": "nombre es obligatorio"}])
+
+    def test_todo_invalido(self):
+        response = self.client.post("/api/pacientes/bulk/", [self.paciente(50)], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["creados"], 0)
+
+
+# ================================================================
+#        BÚSQUEDA DE PERSONAS
+# ================================================================
+
+class BuscarPersonasTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for documento, nombre in [
+            (12345, "María González Pérez"),
+            (12399, "Gonzalo Ruiz"),
+            (91234, "Pedro Gómez"),
+        ]:
+            Personas.objects.create(
+                documento=documento, nom_persona=nombre, tipo_doc=cls.tipo_doc, id_sede=cls.sede
+            )
+        cls.paciente = Pacientes.objects.create(documento_id=12345)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def buscar(self, q, **params):
+        response = self.client.get("/api/personas/buscar/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_prefijo_de_documento(self):
+        pacientes = {p["documento"]: p["cod_pac"] for p in self.buscar("123")}
+        self.assertEqual(pacientes, {12345: self.paciente.cod_pac, 12399: None})
+
+    def test_nombre_parcial(self):
+        data = self.buscar("gonz")
+        self.assertEqual(
+            {p["nombre"] for p in data}, {"María González Pérez", "Gonzalo Ruiz"}
+        )
+
+    def test_limite(self):
+        self.assertEqual(len(self.buscar("123", limit=1)), 1)
+
+    def test_q_corta(self):
+        response = self.client.get("/api/personas/buscar/", {"q": " g "})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ranking_trigramas(self):
+        if not busqueda.trgm_disponible():
+            self.skipTest("requiere la extensión pg_trgm")
+        # con errores de digitación, ordenado por similitud
+        data = self.buscar("gonsalez perez")
+        self.assertEqual(data[0]["documento"], 12345)
+        self.assertEqual(data, sorted(data, key=lambda p: -p["score"]))
+
+
+# ================================================================
+#        BÚSQUEDA EN DIAGNÓSTICOS
+# ================================================================
+
+class BuscarDiagnosticosTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.otra_sede = SedesHospitalarias.objects.create(
+            nom_sede="Norte", ciudad="Medellín", region=cls.region
+        )
+        cls.corta = cls.crear_historia(201, "Dengue grave")
+        cls.larga = cls.crear_historia(
+            202, "Fiebre alta, cefalea intensa y dolor retroocular; se sospecha "
+                 "dengue, descartar una forma grave con hemograma y control"
+        )
+        cls.sin_grave = cls.crear_historia(203, "Dengue sin signos de alarma")
+        cls.norte = cls.crear_historia(204, "Dengue grave", id_sede=cls.otra_sede)
+        cls.otra = cls.crear_historia(205, "Neumonía adquirida en la comunidad")
+        # sin otros diagnósticos el peso de "dengue" y "grave" (IDF) es casi nulo
+        for documento, diagnostico in enumerate([
+            "Hipertensión arterial", "Diabetes mellitus tipo 2", "Otitis media aguda",
+            "Faringitis estreptocócica", "Migraña sin aura", "Lumbalgia mecánica",
+        ], start=206):
+            cls.crear_historia(documento, diagnostico)
+        # en SQLite la tabla FTS5; en PostgreSQL no hace nada
+        busqueda.crear_tablas()
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def buscar(self, q, **params):
+        response = self.client.get("/api/historias/buscar/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_ranking(self):
+        data = self.buscar("dengue grave", id_sede=self.sede.id_sede)
+        # todas las palabras deben aparecer; el diagnóstico corto pesa más
+        self.assertEqual([h["cod_hist"] for h in data], [self.corta.cod_hist, self.larga.cod_hist])
+        self.assertGreater(data[0]["score"], data[1]["score"])
+        self.assertEqual(data[0]["paciente_nombre"], "Paciente 201")
+        self.assertEqual(data[0]["medico_nombre"], "Médico")
+
+    def test_filtro_sede(self):
+        data = self.buscar("dengue grave", id_sede=self.otra_sede.id_sede)
+        self.assertEqual([h["cod_hist"] for h in data], [self.norte.cod_hist])
+
+    def test_limite(self):
+        self.assertEqual(len(self.buscar("dengue", limit=2)), 2)
+
+    def test_texto_con_operadores(self):
+        # comillas y operadores del usuario no rompen la consulta
+        data = self.buscar('dengue" OR (grave')
+        self.assertNotIn(self.otra.cod_hist, [h["cod_hist"] for h in data])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get("/api/historias/buscar/").status_code, 400)
+        response = self.client.get("/api/historias/buscar/", {"q": "dengue", "desde": "ayer"})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,264 @@
+import threading
+import time
+import uuid
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from core import esquema
+
+
+# ================================================================
+#                  TOKENS DE ACCESO / REFRESCO
+# ================================================================
+#
+# El token de acceso es corto y lleva todo lo que usa la capa de
+# permisos (id_emp, rol, rol_id), así que autenticar no consulta la
+# base. El de refresco dura más y permite pedir un acceso nuevo.
+#
+# Revocación: la tabla tokens_revocados (creada con `manage.py
+# crear_tablas`) es la fuente de verdad. Cada worker la mantiene en
+# memoria como un dict; al revocar se publica en la caché compartida una
+# versión nueva, sacada de la secuencia tokens_revocados_version, y los
+# demás workers recargan (la versión se mira a lo sumo
+# cada REVOCACION_INTERVALO segundos, así la mayoría de las peticiones
+# no hace E/S para esto). Los tiempos se comparan en
+# milisegundos (claim iat_ms) para que un token emitido justo después
+# de una revocación, en el mismo segundo, siga siendo válido.
+
+ALGORITMO = "HS256"
+
+
+def access_ttl():
+    return getattr(settings, "ACCESS_TOKEN_TTL", 15 * 60)
+
+
+def refresh_ttl():
+    return getattr(settings, "REFRESH_TOKEN_TTL", 7 * 24 * 3600)
+
+
+def revocacion_intervalo():
+    return getattr(settings, "REVOCACION_INTERVALO", 1.0)
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def _claims(empleado):
+    return {
+        "id_emp": empleado.id_emp,
+        "rol": empleado.rol.nombre,
+        "rol_id": empleado.rol_id,
+    }
+
+
+def _ahora_ms():
+    return int(time.time() * 1000)
+
+
+def _emitir(claims, tipo, ttl):
+    ahora_ms = _ahora_ms()
+    ahora = ahora_ms // 1000
+    payload = {
+        **claims,
+        "typ": tipo,
+        "jti": uuid.uuid4().hex,
+        "iat": ahora,
+        "iat_ms": ahora_ms,
+        "exp": ahora + ttl,
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=ALGORITMO)
+
+
+def emitir_tokens(empleado):
+    claims = _claims(empleado)
+    return {
+        "token": _emitir(claims, "access", access_ttl()),
+        "refresh": _emitir(claims, "refresh", refresh_ttl()),
+        "expira_en": access_ttl(),
+    }
+
+
+def _verificar_firma(token, tipo):
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[ALGORITMO],
+            options={"require": ["exp", "iat", "jti"]},
+        )
+    except jwt.PyJWTError as e:
+        raise TokenInvalido(str(e))
+
+    if payload.get("typ") != tipo:
+        raise TokenInvalido("Tipo de token incorrecto")
+    return payload
+
+
+def decodificar(token, tipo="access"):
+    payload = _verificar_firma(token, tipo)
+    revocaciones.recargar()
+    if revocaciones.esta_revocado(payload):
+        raise TokenInvalido("Token revocado")
+    return payload
+
+
+async def adecodificar(token, tipo="access"):
+    """
+    decodificar() para código async: la firma y la lista de revocados
+    se revisan en el event loop; solo la recarga (caché compartida y
+    base) va a un hilo, y únicamente cuando toca.
+    """
+    payload = _verificar_firma(token, tipo)
+    if revocaciones.debe_recargar():
+        await sync_to_async(revocaciones.recargar)()
+    if revocaciones.esta_revocado(payload):
+        raise TokenInvalido("Token revocado")
+    return payload
+
+
+def refrescar(refresh_token):
+    payload = decodificar(refresh_token, tipo="refresh")
+    claims = {clave: payload[clave] for clave in ("id_emp", "rol", "rol_id")}
+    return {
+        "token": _emitir(claims, "access", access_ttl()),
+        "expira_en": access_ttl(),
+    }
+
+
+# ================================================================
+#                       REVOCACIÓN
+# ================================================================
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS tokens_revocados (
+        clave varchar(80) PRIMARY KEY,
+        revocado_ms bigint NOT NULL,
+        expira timestamptz NOT NULL
+    );
+    """,
+    # versión de la lista: nunca se repite, aunque la caché pierda la
+    # clave (la de catálogos descarta entradas cuando se llena)
+    "CREATE SEQUENCE IF NOT EXISTS tokens_revocados_version;",
+]
+
+VERSION_KEY = "tokens_revocados:version"
+
+
+def crear_tablas():
+    with connection.cursor() as cursor:
+        for ddl in DDL:
+            cursor.execute(ddl)
+
+
+class RevocationStore:
+
+    def __init__(self, alias="catalogos"):
+        self.alias = alias
+        self._version = None
+        self._revisado = None
+        self._revocados = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def debe_recargar(self):
+        return (
+            self._revisado is None
+            or time.monotonic() - self._revisado >= revocacion_intervalo()
+        )
+
+    def recargar(self):
+        if not self.debe_recargar():
+            return
+        revisado = time.monotonic()
+        # sin la tabla no hay nada revocado (revocar sí la exige, y
+        # publica una versión)
+        if not esquema.existen("tokens_revocados"):
+            self._version = None
+            self._revisado = revisado
+            return
+
+        version = self.shared.get(VERSION_KEY)
+        if version is None:
+            version = self._version_base()
+        if version == self._version:
+            self._revisado = revisado
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT clave, revocado_ms FROM tokens_revocados WHERE expira > now();"
+            )
+            filas = cursor.fetchall()
+
+        with self._lock:
+            self._revocados = dict(filas)
+            self._version = version
+            self._revisado = revisado
+
+    def _version_base(self):
+        # la caché perdió la clave: se toma la última versión emitida (0
+        # si nunca se revocó nada) y se vuelve a publicar. Con add() no se
+        # pisa una versión más nueva que otro worker haya publicado
+        # mientras tanto.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE WHEN is_called THEN last_value ELSE 0 END "
+                "FROM tokens_revocados_version;"
+            )
+            version = cursor.fetchone()[0]
+        self.shared.add(VERSION_KEY, version, timeout=None)
+        return version
+
+    def _publicar(self):
+        # después del commit: quien vea la versión nueva ya ve la fila
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval('tokens_revocados_version');")
+            version = cursor.fetchone()[0]
+        self.shared.set(VERSION_KEY, version, timeout=None)
+        # este worker recarga en la siguiente petición, sin esperar
+        self._revisado = None
+
+    def esta_revocado(self, payload):
+        """
+        Consulta la lista en memoria; no recarga (ver recargar()).
+        """
+        if f"jti:{payload['jti']}" in self._revocados:
+            return True
+        revocado_ms = self._revocados.get(f"emp:{payload['id_emp']}")
+        if revocado_ms is None:
+            return False
+        # tokens sin iat_ms: se toma el inicio de su segundo
+        emitido_ms = payload.get("iat_ms", payload["iat"] * 1000)
+        return emitido_ms <= revocado_ms
+
+    def _revocar(self, clave, expira_epoch):
+        esquema.verificar("tokens_revocados")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO tokens_revocados (clave, revocado_ms, expira)
+                VALUES (%s, %s, to_timestamp(%s))
+                ON CONFLICT (clave)
+                DO UPDATE SET revocado_ms = EXCLUDED.revocado_ms, expira = EXCLUDED.expira;
+                """,
+                [clave, _ahora_ms(), expira_epoch]
+            )
+            cursor.execute("DELETE FROM tokens_revocados WHERE expira <= now();")
+        transaction.on_commit(self._publicar)
+
+    def revocar_token(self, payload):
+        self._revocar(f"jti:{payload['jti']}", payload["exp"])
+
+    def revocar_empleado(self, id_emp):
+        # todo token emitido hasta ahora queda inválido; pasado el TTL
+        # del refresco ya no hay tokens viejos y la fila se puede borrar
+        self._revocar(f"emp:{int(id_emp)}", time.time() + refresh_ttl())
+
+
+revocaciones = RevocationStore()
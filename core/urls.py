@@ -18,10 +18,15 @@ router.register("personas", PersonaViewSet, basename="personas")
 router.register("citas", CitaViewSet, basename="citas")
 router.register("medicamentos", MedicamentoViewSet, basename="medicamentos")
 router.register("equipamento", EquipamentoViewSet, basename="equipamento")
+router.register("stock-medicamento", StockMedicamentoViewSet, basename="stock-medicamento")
+router.register("prescripciones", PrescripcionMedicamentoViewSet, basename="prescripciones")
 
 urlpatterns = [
     path("", include(router.urls)),
     path("login/", LoginView.as_view(), name="login"),
+    path("login/async/", login_async, name="login-async"),
+    path("token/refresh/", TokenRefreshView.as_view()),
+    path("token/revocar/", TokenRevocarView.as_view()),
     path("reportes/top-enfermedades/", TopEnfermedadesReporte.as_view()),
     path("reportes/medicamentos-recetados/", MedicamentosRecetadosReporte.as_view()),
     path("reportes/medicos-top-consultas/", MedicosTopConsultasReporte.as_view()),
@@ -31,9 +36,18 @@ urlpatterns = [
     path("sedes/<int:id_sede>/telefonos/", TelefonosSedeView.as_view()),
     path("equipamiento/", EquipamientoReporteView.as_view()),
     path("empleados/", EmpleadosReporteView.as_view()),
+    path("empleados/bulk/", EmpleadosBulkView.as_view()),
     path("empleados/<int:id_emp>/", EmpleadoDetalleView.as_view()),
+    path("empleados/<int:id_emp>/revocar/", EmpleadoRevocarView.as_view()),
+    path("permisos/matriz/", PermisosMatrizView.as_view()),
     path("pacientes/", PacientesView.as_view()),
+    path("pacientes/bulk/", PacientesBulkView.as_view()),
     path("pacientes/<int:cod_pac>/", PacienteDetalleView.as_view()),
+    path("pacientes/<int:cod_pac>/timeline/", PacienteTimelineView.as_view()),
+    path("historias/buscar/", HistoriasBuscarView.as_view()),
     path("historias/<int:cod_hist>/", HistoriaClinicaDetalleView.as_view()),
+    path("inventario/stock/", InventarioStockView.as_view()),
+    path("inventario/movimientos/", MovimientosStockView.as_view()),
+    path("prescripciones/<int:id_presc>/dispensar/", PrescripcionDispensarView.as_view()),
 
 ]
@@ -1,19 +1,36 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
-
-from django.conf import settings
-import jwt
-import bcrypt
-from django.db.models import Count
-from django.db.models.functions import TruncMonth
-from django.db.models.functions import ExtractWeek, ExtractYear
-from django.db import connection
-
-
-
-from core.permissions import RolePermission
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.decorators import action
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import json
+from django.db.models import F
+from django.db import connection, transaction, IntegrityError
+
+
+
+from core.permissions import get_matrix
+from core.middleware import invalidate_empleado
+from core.passwords import verificar_login, hasher, HasherSaturado
+from core.tokens import emitir_tokens, refrescar, decodificar, revocaciones, TokenInvalido
+from core.pagination import KeysetPagination, TimeKeysetPagination
+from core.streaming import StreamingExportMixin, stream_query
+from core.optimizer import OptimizedQuerysetMixin
+from core.catalogos import CatalogViewSetMixin
+from core.filtros import ReporteFiltros
+from core.bulk import CSVTextParser, leer_filas, cargar_pacientes, cargar_empleados
+from core.agenda import Disponibilidad, agenda_cache, reservar, CitaOcupada
+from core.busqueda import Busqueda, buscar_personas, buscar_diagnosticos
+from core.diagnosticos import catalogo_diagnosticos
+from core import inventario, esquema
+from core.rollups import marcar_cambio, actualizado, fuente
+from core.alertas import leer_alertas, horizonte_dias
+from core.rebalanceo import planificar
 
 from core.models import (
     Regiones, SedesHospitalarias, DepartamentosTrabajo, DepartamentosSede,
@@ -41,6 +58,21 @@ from core.serializers import (
 #                           LOGIN
 # ================================================================
 
+def _datos_login(empleado):
+    return {
+        **emitir_tokens(empleado),
+        "rol": empleado.rol.nombre,
+        "id_emp": empleado.id_emp
+    }
+
+
+def _rehash_query(empleado):
+    # solo reemplaza si nadie cambió la contraseña mientras tanto
+    return Empleados.objects.filter(
+        id_emp=empleado.id_emp, hash_contra=empleado.hash_contra
+    )
+
+
 class LoginView(APIView):
     permission_classes = []   # login no requiere token
 
@@ -53,48 +85,125 @@ class LoginView(APIView):
 
         try:
             empleado = Empleados.objects.select_related('rol').get(documento_id=documento)
-        except Empleados.DoesNotExist:
+        except (Empleados.DoesNotExist, ValueError):
+            empleado = None
+
+        # Validar contraseña - el documento inexistente cuesta lo mismo
+        valido, nuevo_hash = verificar_login(
+            password, empleado.hash_contra if empleado else None
+        )
+        if not valido:
             return Response({"error": "Credenciales inválidas"}, status=401)
 
-        # Validar contraseña - manejar múltiples formatos
-        password_valid = False
+        if nuevo_hash:
+            _rehash_query(empleado).update(hash_contra=nuevo_hash)
+
+        return Response(_datos_login(empleado))
+
+
+@csrf_exempt
+@require_POST
+async def login_async(request):
+    """
+    Login para ASGI (config/asgi.py): bcrypt corre en el pool acotado de
+    core.passwords, así el event loop sigue atendiendo mientras se
+    verifica. Si el pool y su cola están llenos se responde 503.
+    """
+    try:
+        body = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    documento = body.get("documento")
+    password = body.get("password")
+
+    if not documento or not password:
+        return JsonResponse({"error": "Faltan credenciales"}, status=400)
+
+    try:
+        empleado = await Empleados.objects.select_related('rol').aget(documento_id=documento)
+    except (Empleados.DoesNotExist, ValueError):
+        empleado = None
+
+    try:
+        valido, nuevo_hash = await hasher.run(
+            verificar_login, password, empleado.hash_contra if empleado else None
+        )
+    except HasherSaturado:
+        response = JsonResponse({"error": "Servidor ocupado, intente de nuevo"}, status=503)
+        response["Retry-After"] = "1"
+        return response
+
+    if not valido:
+        return JsonResponse({"error": "Credenciales inválidas"}, status=401)
+
+    if nuevo_hash:
+        await _rehash_query(empleado).aupdate(hash_contra=nuevo_hash)
+
+    return JsonResponse(_datos_login(empleado))
+
+
+class TokenRefreshView(APIView):
+    permission_classes = []
+
+    def post(self, request):
+        refresh = request.data.get("refresh")
+
+        if not refresh:
+            return Response({"error": "Debe enviar el token 'refresh'"}, status=400)
+
         try:
-            # Intentar validar con bcrypt
-            if empleado.hash_contra.startswith('$2b$') or empleado.hash_contra.startswith('$2a$'):
-                password_valid = bcrypt.checkpw(password.encode(), empleado.hash_contra.encode())
-            else:
-                # Si no es bcrypt, comparar directamente (para desarrollo)
-                password_valid = (password == empleado.hash_contra)
-        except (ValueError, AttributeError) as e:
-            # Si falla bcrypt, intentar comparación directa
-            password_valid = (password == empleado.hash_contra)
-        
-        if not password_valid:
-            return Response({"error": "Credenciales inválidas"}, status=401)
+            data = refrescar(refresh)
+        except TokenInvalido as e:
+            return Response({"error": str(e)}, status=401)
 
-        payload = {
-            "id_emp": empleado.id_emp,
-            "rol": empleado.rol.nombre
-        }
+        return Response(data)
 
-        token = jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
 
-        return Response({
-            "token": token,
-            "rol": empleado.rol.nombre,
-            "id_emp": empleado.id_emp
-        })
+class TokenRevocarView(APIView):
+    """
+    Logout: revoca el token de acceso actual y, si se envía, el de refresco.
+    """
+
+    def post(self, request):
+        payload = getattr(request, "token_payload", None)
+        if not payload:
+            return Response({"error": "Token inválido"}, status=401)
+
+        revocaciones.revocar_token(payload)
+
+        refresh = request.data.get("refresh")
+        if refresh:
+            try:
+                revocaciones.revocar_token(decodificar(refresh, tipo="refresh"))
+            except TokenInvalido:
+                pass
+
+        return Response({"mensaje": "Sesión cerrada"})
 
 
 # ================================================================
 #                        VIEWSETS
 # ================================================================
 
-class RegionViewSet(viewsets.ModelViewSet):
+class RegionViewSet(CatalogViewSetMixin, viewsets.ModelViewSet):
     queryset = Regiones.objects.all()
     serializer_class = RegionSerializer
     permission_classes = [AllowAny]
 
+    @action(detail=True, methods=["get"])
+    def rebalanceo(self, request, pk=None):
+        # transferencias sugeridas entre sedes de la región (core.rebalanceo)
+        try:
+            cobertura = _entero_positivo(request.query_params, "cobertura", requerido=False)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        if not pk.isdigit() or not Regiones.objects.filter(pk=pk).exists():
+            return Response({"error": "Región no encontrada"}, status=404)
+
+        return Response(planificar(int(pk), cobertura))
+
 
 class SedeHospitalariaViewSet(viewsets.ModelViewSet):
     queryset = SedesHospitalarias.objects.all()
@@ -114,7 +223,7 @@ class SedeHospitalariaViewSet(viewsets.ModelViewSet):
 
 
 
-class DepartamentoTrabajoViewSet(viewsets.ModelViewSet):
+class DepartamentoTrabajoViewSet(CatalogViewSetMixin, viewsets.ModelViewSet):
     queryset = DepartamentosTrabajo.objects.all()
     serializer_class = DepartamentoTrabajoSerializer
     permission_classes = [AllowAny]
@@ -126,31 +235,31 @@ class DepartamentoSedeViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
 
 
-class CargoViewSet(viewsets.ModelViewSet):
+class CargoViewSet(CatalogViewSetMixin, viewsets.ModelViewSet):
     queryset = Cargos.objects.all()
     serializer_class = CargoSerializer
     permission_classes = [AllowAny]
 
 
-class RolViewSet(viewsets.ModelViewSet):
+class RolViewSet(CatalogViewSetMixin, viewsets.ModelViewSet):
     queryset = Roles.objects.all()
     serializer_class = RolSerializer
     permission_classes = [AllowAny]
 
 
-class TipoDocumentoViewSet(viewsets.ModelViewSet):
+class TipoDocumentoViewSet(CatalogViewSetMixin, viewsets.ModelViewSet):
     queryset = TiposDocumento.objects.all()
     serializer_class = TipoDocumentoSerializer
     permission_classes = [AllowAny]
 
 
-class TipoServicioViewSet(viewsets.ModelViewSet):
+class TipoServicioViewSet(CatalogViewSetMixin, viewsets.ModelViewSet):
     queryset = TiposServicio.objects.all()
     serializer_class = TipoServicioSerializer
     permission_classes = [AllowAny]
 
 
-class TipoEquipamientoViewSet(viewsets.ModelViewSet):
+class TipoEquipamientoViewSet(CatalogViewSetMixin, viewsets.ModelViewSet):
     queryset = TipoEquipamiento.objects.all()
     serializer_class = TipoEquipamientoSerializer
     permission_classes = [AllowAny]
@@ -158,7 +267,15 @@ class TipoEquipamientoViewSet(viewsets.ModelViewSet):
 class EquipamientoReporteView(APIView):
     def get(self, request):
 
-        sql = """
+        try:
+            paginador = KeysetPagination(request, "e.cod_eq")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        where, params = paginador.where()
+        limit, limit_params = paginador.limit()
+
+        sql = f"""
             SELECT 
                 e.cod_eq,
                 e.nom_eq,
@@ -171,12 +288,14 @@ class EquipamientoReporteView(APIView):
             JOIN departamentos_trabajo d ON e.id_dept = d.id_dept
             JOIN empleados emp ON e.responsable = emp.id_emp
             JOIN personas per ON emp.documento = per.documento
-            ORDER BY e.cod_eq;
+            {where}
+            ORDER BY e.cod_eq
+            {limit};
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
-            rows = cursor.fetchall()
+            cursor.execute(sql, params + limit_params)
+            rows = paginador.paginate(cursor.fetchall())
 
         data = []
         for row in rows:
@@ -203,19 +322,29 @@ class EquipamientoReporteView(APIView):
                 }
             })
 
-        return Response(data)
+        return paginador.get_response(data)
 
-class ProveedorViewSet(viewsets.ModelViewSet):
+class ProveedorViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Proveedores.objects.all()
     serializer_class = ProveedorSerializer
     permission_classes = [AllowAny]
 
 
-class PersonaViewSet(viewsets.ModelViewSet):
+class PersonaViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Personas.objects.all()
     serializer_class = PersonaSerializer
     permission_classes = [AllowAny]
 
+    @action(detail=False, methods=["get"])
+    def buscar(self, request):
+        # ?q= nombre parcial o con errores, o prefijo del documento
+        try:
+            busqueda = Busqueda(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response(buscar_personas(busqueda.q, busqueda.limite))
+
 
 class EmpleadoViewSet(viewsets.ModelViewSet):
     queryset = Empleados.objects.all()
@@ -225,7 +354,15 @@ class EmpleadoViewSet(viewsets.ModelViewSet):
 class EmpleadosReporteView(APIView):
 
     def get(self, request):
-        sql = """
+        try:
+            paginador = KeysetPagination(request, "emp.id_emp")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        where, params = paginador.where()
+        limit, limit_params = paginador.limit()
+
+        sql = f"""
             SELECT 
                 emp.id_emp,
                 per.documento,
@@ -245,12 +382,14 @@ class EmpleadosReporteView(APIView):
             JOIN personas per ON emp.documento = per.documento
             JOIN cargos c ON emp.cargo_id = c.cargo_id
             JOIN roles r ON emp.rol_id = r.rol_id
-            ORDER BY emp.id_emp;
+            {where}
+            ORDER BY emp.id_emp
+            {limit};
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
-            rows = cursor.fetchall()
+            cursor.execute(sql, params + limit_params)
+            rows = paginador.paginate(cursor.fetchall())
 
         data = []
         for row in rows:
@@ -284,7 +423,7 @@ class EmpleadosReporteView(APIView):
                 }
             })
 
-        return Response(data)
+        return paginador.get_response(data)
 
     def post(self, request):
 
@@ -321,7 +460,7 @@ class EmpleadosReporteView(APIView):
         """
 
         try:
-            with connection.cursor() as cursor:
+            with transaction.atomic(), connection.cursor() as cursor:
                 cursor.execute(sql_persona, [
                     documento, nombre, fecha_nac, genero,
                     direccion, correo, tipo_doc_id, id_sede
@@ -339,6 +478,28 @@ class EmpleadosReporteView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
+class EmpleadosBulkView(APIView):
+    """
+    Alta masiva de empleados: arreglo JSON o CSV con los campos de
+    persona más id_dept, cargo_id, rol_id y password. Las contraseñas
+    se hashean con bcrypt en paralelo antes de insertar.
+    """
+    parser_classes = [JSONParser, CSVTextParser, MultiPartParser, FormParser]
+
+    def post(self, request):
+        try:
+            filas = leer_filas(request, "empleados")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        if not filas:
+            return Response({"error": "El lote está vacío"}, status=400)
+
+        resultado = cargar_empleados(filas)
+        status_code = 201 if resultado["creados"] else 400
+        return Response(resultado, status=status_code)
+
+
 class EmpleadoDetalleView(APIView):
 
     def get(self, request, id_emp):
@@ -476,30 +637,85 @@ class EmpleadoDetalleView(APIView):
                 with connection.cursor() as cursor:
                     cursor.execute(sql_update_empleado, values)
 
+                # el rol (y demás datos) cacheados del empleado ya no son válidos
+                invalidate_empleado(id_emp)
+
+                # los tokens emitidos llevan el rol anterior
+                if "rol_id" in empleado:
+                    revocaciones.revocar_empleado(id_emp)
+
         return Response({"mensaje": "Empleado actualizado correctamente"})
 
 
+class EmpleadoRevocarView(APIView):
+    """
+    Revoca todos los tokens emitidos a un empleado (p. ej. al retirarse).
+    Lo puede hacer el propio empleado o un rol que pueda dar de baja
+    empleados (DELETE sobre "empleados" en core.permissions).
+    """
+
+    def post(self, request, id_emp):
+        payload = getattr(request, "token_payload", None)
+        if not payload:
+            return Response({"error": "Token inválido"}, status=401)
+
+        propio = payload.get("id_emp") == id_emp
+        if not propio and not get_matrix().permite(payload.get("rol_id"), "DELETE", "empleados"):
+            return Response({"error": "No autorizado"}, status=403)
+
+        revocaciones.revocar_empleado(id_emp)
+        invalidate_empleado(id_emp)
+        return Response({"mensaje": "Tokens del empleado revocados", "id_emp": id_emp})
+
+
+class PermisosMatrizView(APIView):
+    """
+    Matriz de permisos compilada (core.permissions), para auditoría.
+    """
+
+    def get(self, request):
+        data = [
+            {"rol_id": rol_id, "rol": rol, "metodo": metodo, "recurso": recurso}
+            for rol_id, rol, metodo, recurso in get_matrix().tabla()
+        ]
+        return Response(data)
+
+
 class PacienteViewSet(viewsets.ModelViewSet):
     queryset = Pacientes.objects.all()
     serializer_class = PacienteSerializer
     permission_classes = [AllowAny]
     
-class PacientesView(APIView):
+class PacientesView(StreamingExportMixin, APIView):
 
     def get(self, request):
-        sql = """
+        formato = self.streaming_format(request)
+        if formato:
+            return self.exportar(formato)
+
+        try:
+            paginador = KeysetPagination(request, "p.cod_pac")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        where, params = paginador.where()
+        limit, limit_params = paginador.limit()
+
+        sql = f"""
             SELECT 
                 p.cod_pac,
                 per.documento,
                 per.nom_persona
             FROM pacientes p
             JOIN personas per ON p.documento = per.documento
-            ORDER BY p.cod_pac;
+            {where}
+            ORDER BY p.cod_pac
+            {limit};
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
-            rows = cursor.fetchall()
+            cursor.execute(sql, params + limit_params)
+            rows = paginador.paginate(cursor.fetchall())
 
         data = [
             {
@@ -513,7 +729,27 @@ class PacientesView(APIView):
             for row in rows
         ]
 
-        return Response(data)
+        return paginador.get_response(data)
+
+    def exportar(self, formato):
+        sql = """
+            SELECT 
+                p.cod_pac,
+                per.documento,
+                per.nom_persona,
+                per.fecha_nac,
+                per.genero,
+                per.correo_per,
+                per.id_sede
+            FROM pacientes p
+            JOIN personas per ON p.documento = per.documento
+            ORDER BY p.cod_pac;
+        """
+        columnas = [
+            "cod_pac", "documento", "nombre", "fecha_nac",
+            "genero", "correo", "id_sede"
+        ]
+        return stream_query(sql, [], columnas, formato, "pacientes", self.request)
 
     def post(self, request):
 
@@ -572,6 +808,28 @@ class PacientesView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
+class PacientesBulkView(APIView):
+    """
+    Alta masiva de pacientes: arreglo JSON o CSV (cuerpo text/csv o
+    archivo multipart 'archivo') con las columnas documento, nombre,
+    fecha_nac, genero, direccion, correo, tipo_doc_id, id_sede.
+    """
+    parser_classes = [JSONParser, CSVTextParser, MultiPartParser, FormParser]
+
+    def post(self, request):
+        try:
+            filas = leer_filas(request, "pacientes")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        if not filas:
+            return Response({"error": "El lote está vacío"}, status=400)
+
+        resultado = cargar_pacientes(filas)
+        status_code = 201 if resultado["creados"] else 400
+        return Response(resultado, status=status_code)
+
+
 class PacienteDetalleView(APIView):
 
     def get(self, request, cod_pac):
@@ -704,17 +962,367 @@ class PacienteDetalleView(APIView):
         })
 
 
+class PacienteTimelineView(APIView):
+    """
+    Citas del paciente de la más reciente a la más antigua, cada una con
+    sus historias clínicas y las prescripciones de cada historia. Una
+    página completa sale de una sola consulta (json_agg); ?after= con el
+    cursor de X-Next-Cursor sigue hacia atrás en el tiempo.
+    """
+
+    def get(self, request, cod_pac):
+
+        try:
+            paginador = TimeKeysetPagination(request, "c.id_cita", "c.fecha_hora")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        sql_paciente = """
+            SELECT p.cod_pac, per.documento, per.nom_persona
+            FROM pacientes p
+            JOIN personas per ON p.documento = per.documento
+            WHERE p.cod_pac = %s;
+        """
+
+        where, where_params = paginador.where("AND")
+        limit, limit_params = paginador.limit()
+
+        sql_timeline = f"""
+            WITH pagina AS (
+                SELECT c.id_cita, c.fecha_hora, c.estado, c.cod_servicio, c.id_emp
+                FROM citas c
+                WHERE c.cod_pac = %s
+                {where}
+                ORDER BY c.fecha_hora DESC, c.id_cita DESC
+                {limit}
+            ),
+            presc AS (
+                SELECT
+                    pr.cod_hist,
+                    json_agg(json_build_object(
+                        'id_presc', pr.id_presc,
+                        'cod_med', pr.cod_med,
+                        'medicamento', m.nom_med,
+                        'dosis', pr.dosis,
+                        'frecuencia', pr.frecuencia,
+                        'duracion_dias', pr.duracion_dias,
+                        'fecha_emision', pr.fecha_emision
+                    ) ORDER BY pr.id_presc) AS prescripciones
+                FROM pagina pg
+                JOIN historias_clinicas h ON h.id_cita = pg.id_cita
+                JOIN prescripciones_medicamentos pr ON pr.cod_hist = h.cod_hist
+                JOIN medicamentos m ON m.cod_med = pr.cod_med
+                GROUP BY pr.cod_hist
+            ),
+            hist AS (
+                SELECT
+                    h.id_cita,
+                    json_agg(json_build_object(
+                        'cod_hist', h.cod_hist,
+                        'fecha_hora', h.fecha_hora,
+                        'diagnostico', h.diagnostico,
+                        'prescripciones', COALESCE(presc.prescripciones, '[]'::json)
+                    ) ORDER BY h.fecha_hora, h.cod_hist) AS historias
+                FROM pagina pg
+                JOIN historias_clinicas h ON h.id_cita = pg.id_cita
+                LEFT JOIN presc ON presc.cod_hist = h.cod_hist
+                GROUP BY h.id_cita
+            )
+            SELECT
+                pg.id_cita,
+                pg.fecha_hora,
+                pg.estado,
+                ts.nombre AS servicio,
+                pg.id_emp,
+                per.nom_persona AS medico,
+                COALESCE(hist.historias, '[]'::json) AS historias
+            FROM pagina pg
+            JOIN tipos_servicio ts ON ts.cod_servicio = pg.cod_servicio
+            JOIN empleados e ON e.id_emp = pg.id_emp
+            JOIN personas per ON per.documento = e.documento
+            LEFT JOIN hist ON hist.id_cita = pg.id_cita
+            ORDER BY pg.fecha_hora DESC, pg.id_cita DESC;
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql_paciente, [cod_pac])
+            paciente = cursor.fetchone()
+            if not paciente:
+                return Response({"error": "Paciente no encontrado"}, status=404)
+
+            cursor.execute(sql_timeline, [cod_pac] + where_params + limit_params)
+            rows = paginador.paginate(cursor.fetchall())
+
+        data = {
+            "cod_pac": paciente[0],
+            "persona": {
+                "documento": paciente[1],
+                "nombre": paciente[2]
+            },
+            "citas": [
+                {
+                    "id_cita": row[0],
+                    "fecha_hora": row[1],
+                    "estado": row[2],
+                    "servicio": row[3],
+                    "id_emp": row[4],
+                    "medico": row[5],
+                    "historias": row[6]
+                }
+                for row in rows
+            ]
+        }
+
+        return paginador.get_response(data)
+
+
 class MedicamentoViewSet(viewsets.ModelViewSet):
     queryset = Medicamentos.objects.all()
     serializer_class = MedicamentosSerializer
     permission_classes = [AllowAny]
 
+    @action(detail=False, methods=["get"])
+    def alertas(self, request):
+        # lee lo que dejó `manage.py calcular_alertas_stock` (core.alertas)
+        try:
+            filtros = ReporteFiltros(request, permitir_fechas=False)
+            dias = _entero_positivo(request.query_params, "dias", requerido=False)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response(leer_alertas(dias or horizonte_dias(), filtros.id_sede))
+
 
 class StockMedicamentoViewSet(viewsets.ModelViewSet):
     queryset = StockMedicamento.objects.all()
     serializer_class = StockMedicamentoSerializer
     permission_classes = [AllowAny]
 
+    # la cantidad pedida se lleva al saldo con un ajuste en el libro
+    # (core.inventario), así saldo = snapshot + movimientos se mantiene
+    def _fijar(self, cod_med, id_sede, cantidad):
+        inventario.fijar_saldo(
+            cod_med, id_sede, cantidad,
+            id_emp=_id_emp_token(self.request),
+            observacion="Edición de stock_medicamento",
+        )
+
+    def perform_create(self, serializer):
+        cantidad = serializer.validated_data["cantidad"]
+        with transaction.atomic():
+            stock = serializer.save(cantidad=0)
+            self._fijar(stock.cod_med_id, stock.id_sede_id, cantidad)
+            stock.refresh_from_db()
+
+    def perform_update(self, serializer):
+        stock = serializer.instance
+        cantidad = serializer.validated_data.get("cantidad")
+        with transaction.atomic():
+            if cantidad is not None:
+                self._fijar(stock.cod_med_id, stock.id_sede_id, cantidad)
+            stock.refresh_from_db()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            self._fijar(instance.cod_med_id, instance.id_sede_id, 0)
+            instance.delete()
+
+
+# ================================================================
+#              INVENTARIO (core.inventario)
+# ================================================================
+
+def _entero_positivo(data, campo, requerido=True):
+    valor = data.get(campo)
+    if valor is None or valor == "":
+        if requerido:
+            raise ValueError(f"'{campo}' es obligatorio")
+        return None
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{campo}' debe ser un entero")
+    if valor <= 0:
+        raise ValueError(f"'{campo}' debe ser mayor que cero")
+    return valor
+
+
+def _id_emp_token(request):
+    payload = getattr(request, "token_payload", None) or {}
+    return payload.get("id_emp")
+
+
+class InventarioStockView(APIView):
+    """
+    Saldo vigente por medicamento y sede: ?cod_med=&id_sede=
+    """
+
+    def get(self, request):
+        try:
+            cod_med = _entero_positivo(request.query_params, "cod_med", requerido=False)
+            id_sede = _entero_positivo(request.query_params, "id_sede", requerido=False)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        if cod_med and id_sede:
+            cantidad = inventario.saldo(cod_med, id_sede)
+            if cantidad is None:
+                return Response({"error": "Sin stock registrado"}, status=404)
+            return Response({"cod_med": cod_med, "id_sede": id_sede, "cantidad": cantidad})
+
+        condiciones, params = [], []
+        if cod_med:
+            condiciones.append("s.cod_med = %s")
+            params.append(cod_med)
+        if id_sede:
+            condiciones.append("s.id_sede = %s")
+            params.append(id_sede)
+        where = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+
+        sql = f"""
+            SELECT s.cod_med, m.nom_med, s.id_sede, sh.nom_sede, s.cantidad
+            FROM stock_medicamento s
+            JOIN medicamentos m ON m.cod_med = s.cod_med
+            JOIN sedes_hospitalarias sh ON sh.id_sede = s.id_sede
+            {where}
+            ORDER BY s.cod_med, s.id_sede;
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        data = [
+            {
+                "cod_med": row[0],
+                "medicamento": row[1],
+                "id_sede": row[2],
+                "sede": row[3],
+                "cantidad": row[4]
+            }
+            for row in rows
+        ]
+
+        return Response(data)
+
+
+class MovimientosStockView(APIView):
+    """
+    GET: libro de movimientos (?cod_med=&id_sede=, paginado por id_mov).
+    POST: {cod_med, id_sede, cantidad, motivo: entrada|salida|ajuste,
+    observacion}. En 'ajuste' la cantidad puede ser negativa.
+    """
+
+    def get(self, request):
+        try:
+            paginador = KeysetPagination(request, "mv.id_mov", siempre=True)
+            cod_med = _entero_positivo(request.query_params, "cod_med", requerido=False)
+            id_sede = _entero_positivo(request.query_params, "id_sede", requerido=False)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        esquema.verificar(*inventario.TABLAS)
+
+        condiciones, params = [], []
+        if cod_med:
+            condiciones.append("mv.cod_med = %s")
+            params.append(cod_med)
+        if id_sede:
+            condiciones.append("mv.id_sede = %s")
+            params.append(id_sede)
+        where_cursor, cursor_params = paginador.where("")
+        if where_cursor:
+            condiciones.append(where_cursor)
+            params.extend(cursor_params)
+        where = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+        limit, limit_params = paginador.limit()
+
+        sql = f"""
+            SELECT mv.id_mov, mv.cod_med, mv.id_sede, mv.delta, mv.saldo,
+                   mv.motivo, mv.referencia, mv.id_emp, mv.observacion, mv.creado
+            FROM movimientos_stock mv
+            {where}
+            ORDER BY mv.id_mov
+            {limit};
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + limit_params)
+            rows = paginador.paginate(cursor.fetchall())
+
+        columnas = [
+            "id_mov", "cod_med", "id_sede", "delta", "saldo",
+            "motivo", "referencia", "id_emp", "observacion", "creado"
+        ]
+        return paginador.get_response([dict(zip(columnas, row)) for row in rows])
+
+    def post(self, request):
+        data = request.data
+        motivo = data.get("motivo", "entrada")
+
+        try:
+            cod_med = _entero_positivo(data, "cod_med")
+            id_sede = _entero_positivo(data, "id_sede")
+            if motivo == "ajuste":
+                cantidad = int(data.get("cantidad") or 0)
+            elif motivo in ("entrada", "salida"):
+                cantidad = _entero_positivo(data, "cantidad")
+            else:
+                raise ValueError("'motivo' debe ser entrada, salida o ajuste")
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=400)
+
+        delta = -cantidad if motivo == "salida" else cantidad
+
+        try:
+            resultado = inventario.mover(
+                cod_med, id_sede, delta, motivo,
+                id_emp=_id_emp_token(request),
+                observacion=data.get("observacion"),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        except (inventario.SinStock, inventario.StockInsuficiente) as e:
+            return Response({"error": str(e)}, status=409)
+        except IntegrityError:
+            return Response({"error": "Medicamento o sede inexistente"}, status=400)
+
+        return Response(
+            {"cod_med": cod_med, "id_sede": id_sede, "delta": delta, **resultado},
+            status=201
+        )
+
+
+class PrescripcionDispensarView(APIView):
+    """
+    Descuenta del stock el medicamento de una prescripción:
+    {cantidad, id_sede (opcional, por defecto la sede del paciente)}.
+    Las prescripciones nuevas se dispensan al crearlas; esto queda para
+    las que quedaron pendientes (sin stock al crearlas) y las que se
+    emitieron antes del libro.
+    """
+
+    def post(self, request, id_presc):
+        try:
+            cantidad = _entero_positivo(request.data, "cantidad")
+            id_sede = _entero_positivo(request.data, "id_sede", requerido=False)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        try:
+            resultado = inventario.dispensar_prescripcion(
+                id_presc, cantidad, id_sede=id_sede, id_emp=_id_emp_token(request)
+            )
+        except (inventario.SinStock, inventario.StockInsuficiente) as e:
+            return Response({"error": str(e)}, status=409)
+        except inventario.YaDispensada as e:
+            return Response({"error": str(e)}, status=409)
+
+        if resultado is None:
+            return Response({"error": "Prescripción no encontrada"}, status=404)
+
+        return Response({"id_presc": id_presc, **resultado}, status=201)
+
 
 class TelefonoPersonaViewSet(viewsets.ModelViewSet):
     queryset = TelefonosPersona.objects.all()
@@ -722,7 +1330,7 @@ class TelefonoPersonaViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
 
 
-class EquipamentoViewSet(viewsets.ModelViewSet):
+class EquipamentoViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Equipamento.objects.all()
     serializer_class = EquipamentoSerializer
     permission_classes = [AllowAny]
@@ -826,13 +1434,61 @@ class TelefonosPorSedeView(APIView):
 
         return Response(data)
 
-class HistoriaClinicaViewSet(viewsets.ModelViewSet):
+class HistoriaClinicaViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     queryset = HistoriasClinicas.objects.all()
     serializer_class = HistoriaClinicaSerializer
 
+    def get_queryset(self):
+        # una sola consulta: cita por JOIN y nombres anotados desde personas
+        return (
+            HistoriasClinicas.objects
+            .select_related("id_cita")
+            .annotate(
+                paciente_nombre=F("id_cita__cod_pac__documento__nom_persona"),
+                medico_nombre=F("id_cita__id_emp__documento__nom_persona"),
+            )
+        )
+
+    def _recargar(self, serializer):
+        # tras guardar, se relee la fila anotada para responder sin N+1
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    # el código de diagnóstico normalizado se asigna al guardar
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            historia = serializer.save()
+            catalogo_diagnosticos.asignar_historia(historia)
+            marcar_cambio("historias_clinicas", historia.fecha_hora)
+        self._recargar(serializer)
+
+    def perform_update(self, serializer):
+        anterior = serializer.instance.fecha_hora
+        with transaction.atomic():
+            historia = serializer.save()
+            catalogo_diagnosticos.asignar_historia(historia)
+            marcar_cambio("historias_clinicas", anterior, historia.fecha_hora)
+        self._recargar(serializer)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            marcar_cambio("historias_clinicas", instance.fecha_hora)
+            instance.delete()
+
     def list(self, request):
 
-        sql = """
+        formato = self.streaming_format(request)
+        if formato:
+            return self.exportar(formato)
+
+        try:
+            paginador = KeysetPagination(request, "h.cod_hist")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        where, params = paginador.where()
+        limit, limit_params = paginador.limit()
+
+        sql = f"""
             SELECT 
                 h.cod_hist,
                 h.fecha_hora,
@@ -855,12 +1511,14 @@ class HistoriaClinicaViewSet(viewsets.ModelViewSet):
             JOIN empleados emp ON c.id_emp = emp.id_emp
             JOIN personas per_emp ON emp.documento = per_emp.documento
 
-            ORDER BY h.cod_hist;
+            {where}
+            ORDER BY h.cod_hist
+            {limit};
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
-            rows = cursor.fetchall()
+            cursor.execute(sql, params + limit_params)
+            rows = paginador.paginate(cursor.fetchall())
 
         data = []
 
@@ -879,13 +1537,97 @@ class HistoriaClinicaViewSet(viewsets.ModelViewSet):
                 "empleado": empleado_nombre
             })
 
-        return Response(data)
+        return paginador.get_response(data)
+
+    def exportar(self, formato):
+        sql = """
+            SELECT 
+                h.cod_hist,
+                h.id_cita,
+                h.fecha_hora,
+                h.diagnostico,
+                c.cod_pac,
+                per_pac.nom_persona AS paciente_nombre,
+                c.id_emp,
+                per_emp.nom_persona AS empleado_nombre
+            FROM historias_clinicas h
+            JOIN citas c ON h.id_cita = c.id_cita
+            JOIN pacientes pac ON c.cod_pac = pac.cod_pac
+            JOIN personas per_pac ON pac.documento = per_pac.documento
+            JOIN empleados emp ON c.id_emp = emp.id_emp
+            JOIN personas per_emp ON emp.documento = per_emp.documento
+            ORDER BY h.cod_hist;
+        """
+        columnas = [
+            "cod_hist", "id_cita", "fecha_registro_hora", "diagnostico",
+            "cod_pac", "paciente", "id_emp", "empleado"
+        ]
+        return stream_query(sql, [], columnas, formato, "historias_clinicas", self.request)
 
 class PrescripcionMedicamentoViewSet(viewsets.ModelViewSet):
     queryset = PrescripcionesMedicamentos.objects.all()
     serializer_class = PrescripcionMedicamentoSerializer
     permission_classes = [AllowAny]
 
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.data["dispensacion"] = self.dispensacion
+        return response
+
+    # crear la prescripción intenta descontar su medicamento del stock en
+    # la misma transacción. Sin stock (o sin el libro de core.inventario)
+    # la prescripción se crea igual y queda pendiente de dispensar; la
+    # respuesta dice cuál fue el caso. Los periodos tocados se recalculan
+    # en el siguiente refresco de rollups.
+    def perform_create(self, serializer):
+        cantidad = serializer.validated_data.pop("cantidad")
+        id_sede = serializer.validated_data.pop("id_sede", None)
+        with transaction.atomic():
+            prescripcion = serializer.save()
+            self.dispensacion = self._dispensar(prescripcion, cantidad, id_sede)
+            marcar_cambio("prescripciones_medicamentos", prescripcion.fecha_emision)
+
+    def _dispensar(self, prescripcion, cantidad, id_sede):
+        pendiente = {"estado": "pendiente", "cantidad": cantidad}
+        if not esquema.existen(*inventario.TABLAS):
+            return {**pendiente, "motivo": "El libro de stock aún no está creado"}
+        try:
+            resultado = inventario.dispensar_prescripcion(
+                prescripcion.id_presc, cantidad,
+                id_sede=id_sede, id_emp=_id_emp_token(self.request)
+            )
+        except (inventario.SinStock, inventario.StockInsuficiente) as e:
+            # dispensar_prescripcion deshizo solo su savepoint
+            return {**pendiente, "motivo": str(e)}
+        return {"estado": "dispensada", "cantidad": cantidad, **resultado}
+
+    def perform_update(self, serializer):
+        serializer.validated_data.pop("cantidad", None)
+        serializer.validated_data.pop("id_sede", None)
+        anterior = serializer.instance.fecha_emision
+        prescripcion = serializer.save()
+        marcar_cambio("prescripciones_medicamentos", anterior, prescripcion.fecha_emision)
+
+    def perform_destroy(self, instance):
+        marcar_cambio("prescripciones_medicamentos", instance.fecha_emision)
+        instance.delete()
+
+class HistoriasBuscarView(APIView):
+    """
+    Búsqueda de texto completo en diagnósticos:
+    ?q=dengue&id_sede=&desde=&hasta=&limit=
+    """
+
+    def get(self, request):
+        try:
+            busqueda = Busqueda(request)
+            filtros = ReporteFiltros(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response(buscar_diagnosticos(busqueda.q, filtros, busqueda.limite))
+
+
 class HistoriaClinicaDetalleView(APIView):
 
     def get(self, request, cod_hist):
@@ -991,65 +1733,167 @@ class AuditoriaAccesoViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
 
 
-class CitaViewSet(viewsets.ModelViewSet):
+class CitaViewSet(StreamingExportMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Citas.objects.all()
     serializer_class = CitaSerializer
     permission_classes = [AllowAny]
+
+    def list(self, request, *args, **kwargs):
+        formato = self.streaming_format(request)
+        if formato:
+            sql = """
+                SELECT id_cita, cod_pac, id_emp, cod_servicio, fecha_hora, estado
+                FROM citas
+                ORDER BY id_cita;
+            """
+            columnas = [
+                "id_cita", "cod_pac", "id_emp", "cod_servicio", "fecha_hora", "estado"
+            ]
+            return stream_query(sql, [], columnas, formato, "citas", request)
+
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=["get"])
+    def disponibilidad(self, request):
+        try:
+            consulta = Disponibilidad(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response(consulta.calcular())
+
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except CitaOcupada as e:
+            return Response({"error": str(e)}, status=409)
+
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except CitaOcupada as e:
+            return Response({"error": str(e)}, status=409)
+
+    # cada escritura se guarda con el candado del médico y el día
+    # (core.agenda.reservar) e invalida los días de agenda afectados
+    def perform_create(self, serializer):
+        datos = serializer.validated_data
+        with reservar(datos["id_emp"].pk, datos["fecha_hora"], datos.get("estado")):
+            cita = serializer.save()
+            marcar_cambio("citas", cita.fecha_hora)
+            agenda_cache.invalidar_al_confirmar((cita.id_emp_id, cita.fecha_hora))
+
+    def perform_update(self, serializer):
+        instancia = serializer.instance
+        anterior = (instancia.id_emp_id, instancia.fecha_hora)
+        datos = serializer.validated_data
+        id_emp = datos["id_emp"].pk if "id_emp" in datos else instancia.id_emp_id
+
+        with reservar(
+            id_emp,
+            datos.get("fecha_hora", instancia.fecha_hora),
+            datos.get("estado", instancia.estado),
+            excluir=instancia.pk,
+        ):
+            cita = serializer.save()
+            marcar_cambio("citas", anterior[1], cita.fecha_hora)
+            if cita.fecha_hora != anterior[1]:
+                # el tiempo de atención de sus historias se mide desde la cita
+                marcar_cambio("historias_clinicas", *cita.historiasclinicas_set.values_list(
+                    "fecha_hora", flat=True
+                ))
+            agenda_cache.invalidar_al_confirmar(anterior, (cita.id_emp_id, cita.fecha_hora))
+
+    def perform_destroy(self, instance):
+        dia = (instance.id_emp_id, instance.fecha_hora)
+        with transaction.atomic():
+            instance.delete()
+            marcar_cambio("citas", dia[1])
+            agenda_cache.invalidar_al_confirmar(dia)
     
 # ================================================================
 #                        DASHBOARD REPORTS
 # ================================================================
 
 class TopEnfermedadesReporte(APIView):
+    # Los reportes leen las tablas de core.rollups (se actualizan con
+    # `manage.py rebuild_rollups --incremental`); si aún no se crearon
+    # o nunca se calcularon responden 503. La cabecera
+    # X-Rollups-Actualizado dice hasta cuándo están al día.
+
     def get(self, request):
+        esquema.verificar("rollup_enfermedades", "diagnosticos_catalogo")
+        al_dia = actualizado("enfermedades")
 
-        sql = """
+        try:
+            filtros = ReporteFiltros(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        origen, params = fuente("enfermedades", filtros)
+
+        # se agrupa por el código entero y solo el top se une a los nombres
+        sql = f"""
+            WITH top AS (
+                SELECT r.cod_diag, r.id_sede, SUM(r.total) AS total
+                FROM ({origen}) r
+                GROUP BY r.cod_diag, r.id_sede
+                ORDER BY total DESC
+                LIMIT 5
+            )
             SELECT 
-                h.diagnostico,
+                d.nombre,
                 s.nom_sede AS sede,
-                COUNT(h.diagnostico) AS total
-            FROM historias_clinicas h
-            JOIN citas c ON h.id_cita = c.id_cita
-            JOIN pacientes p ON c.cod_pac = p.cod_pac
-            JOIN personas per ON p.documento = per.documento
-            JOIN sedes_hospitalarias s ON per.id_sede = s.id_sede
-            GROUP BY h.diagnostico, s.nom_sede
-            ORDER BY total DESC
-            LIMIT 5;
+                top.total,
+                top.cod_diag
+            FROM top
+            JOIN diagnosticos_catalogo d ON top.cod_diag = d.cod_diag
+            JOIN sedes_hospitalarias s ON top.id_sede = s.id_sede
+            ORDER BY top.total DESC;
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
+            cursor.execute(sql, params)
             rows = cursor.fetchall()
 
         data = [
             {
                 "enfermedad": row[0],
                 "sede": row[1],
-                "casos": row[2]
+                "casos": row[2],
+                "cod_diag": row[3]
             }
             for row in rows
         ]
 
-        return Response(data)
+        return Response(data, headers={"X-Rollups-Actualizado": al_dia.isoformat()})
 
     
 class MedicamentosRecetadosReporte(APIView):
     def get(self, request):
+        esquema.verificar("rollup_prescripciones")
+        al_dia = actualizado("prescripciones")
 
-        sql = """
+        try:
+            filtros = ReporteFiltros(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        origen, params = fuente("prescripciones", filtros)
+
+        sql = f"""
             SELECT 
                 m.nom_med AS nombre_medicamento,
-                TO_CHAR(p.fecha_emision, 'YYYY-MM') AS mes,
-                COUNT(*) AS cantidad
-            FROM prescripciones_medicamentos p
-            LEFT JOIN medicamentos m ON p.cod_med = m.cod_med
+                TO_CHAR(r.mes, 'YYYY-MM') AS mes,
+                SUM(r.total) AS cantidad
+            FROM ({origen}) r
+            LEFT JOIN medicamentos m ON r.cod_med = m.cod_med
             GROUP BY nombre_medicamento, mes
             ORDER BY mes;
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
+            cursor.execute(sql, params)
             rows = cursor.fetchall()
 
         data = [
@@ -1061,59 +1905,75 @@ class MedicamentosRecetadosReporte(APIView):
             for row in rows
         ]
 
-        return Response(data)
+        return Response(data, headers={"X-Rollups-Actualizado": al_dia.isoformat()})
 
 
 class MedicosTopConsultasReporte(APIView):
     def get(self, request):
+        esquema.verificar("rollup_consultas_medico")
+        al_dia = actualizado("consultas_medico")
 
-        sql = """
+        try:
+            filtros = ReporteFiltros(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        origen, params = fuente("consultas_medico", filtros)
+
+        sql = f"""
             SELECT 
                 per.nom_persona AS medico,
-                DATE_PART('year', c.fecha_hora)::int AS anio,
-                DATE_PART('week', c.fecha_hora)::int AS semana,
-                COUNT(*) AS total_consultas
-            FROM citas c
-            JOIN empleados e ON c.id_emp = e.id_emp
+                r.semana,
+                SUM(r.total) AS total_consultas
+            FROM ({origen}) r
+            JOIN empleados e ON r.id_emp = e.id_emp
             JOIN personas per ON e.documento = per.documento
-            WHERE c.estado = 'Atendida'
-            GROUP BY medico, anio, semana
-            ORDER BY anio, semana;
+            GROUP BY medico, r.semana
+            ORDER BY r.semana;
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
+            cursor.execute(sql, params)
             rows = cursor.fetchall()
 
-        data = [
-            {
-                "medico": row[0] if row[0] else "(Nombre no disponible)",
-                "semana": f"{int(row[1])}-W{int(row[2]):02d}",
-                "consultas": row[3]
-            }
-            for row in rows
-        ]
+        data = []
+        for medico, semana, consultas in rows:
+            anio, num_semana, _ = semana.isocalendar()
+            data.append({
+                "medico": medico if medico else "(Nombre no disponible)",
+                "semana": f"{anio}-W{num_semana:02d}",
+                "consultas": consultas
+            })
 
-        return Response(data)
+        return Response(data, headers={"X-Rollups-Actualizado": al_dia.isoformat()})
 
 
     
 class PacientesPorSedeReporte(APIView):
     def get(self, request):
+        esquema.verificar("rollup_pacientes_sede")
+        al_dia = actualizado("pacientes_sede")
 
-        sql = """
+        try:
+            filtros = ReporteFiltros(request, permitir_fechas=False)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        where, params = filtros.where("r")
+
+        sql = f"""
             SELECT 
                 s.nom_sede AS sede,
-                COUNT(pac.documento) AS total_pacientes
-            FROM pacientes pac
-            JOIN personas per ON pac.documento = per.documento
-            JOIN sedes_hospitalarias s ON per.id_sede = s.id_sede
+                SUM(r.total) AS total_pacientes
+            FROM rollup_pacientes_sede r
+            JOIN sedes_hospitalarias s ON r.id_sede = s.id_sede
+            {where}
             GROUP BY s.nom_sede
             ORDER BY total_pacientes DESC;
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
+            cursor.execute(sql, params)
             rows = cursor.fetchall()
 
         data = [
@@ -1124,25 +1984,32 @@ class PacientesPorSedeReporte(APIView):
             for row in rows
         ]
 
-        return Response(data)
+        return Response(data, headers={"X-Rollups-Actualizado": al_dia.isoformat()})
     
 class TiemposAtencionReporte(APIView):
     def get(self, request):
-        sql = """
+        esquema.verificar("rollup_tiempos_atencion")
+        al_dia = actualizado("tiempos_atencion")
+
+        try:
+            filtros = ReporteFiltros(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        origen, params = fuente("tiempos_atencion", filtros)
+
+        sql = f"""
             SELECT 
                 s.nom_sede AS sede,
-                AVG(EXTRACT(EPOCH FROM (h.fecha_hora - c.fecha_hora)) / 60.0) AS tiempo_promedio
-            FROM historias_clinicas h
-            JOIN citas c ON h.id_cita = c.id_cita
-            JOIN pacientes p ON c.cod_pac = p.cod_pac
-            JOIN personas per ON p.documento = per.documento
-            JOIN sedes_hospitalarias s ON per.id_sede = s.id_sede
+                SUM(r.suma_minutos) / NULLIF(SUM(r.atenciones), 0) AS tiempo_promedio
+            FROM ({origen}) r
+            JOIN sedes_hospitalarias s ON r.id_sede = s.id_sede
             GROUP BY s.nom_sede
             ORDER BY s.nom_sede;
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(sql)
+            cursor.execute(sql, params)
             rows = cursor.fetchall()
 
         data = [
@@ -1150,4 +2017,4 @@ class TiemposAtencionReporte(APIView):
             for row in rows
         ]
 
-        return Response(data)
\ No newline at end of file
+        return Response(data, headers={"X-Rollups-Actualizado": al_dia.isoformat()})
\ No newline at end of file